@@ -1,3 +1,4 @@
+import threading
 from typing import Dict, Any
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode, tools_condition
@@ -122,6 +123,20 @@ def create_graph():
     return workflow.compile()
 
 
+# Compiled graph is stateless between invocations, so build it once per process
+_graph = None
+_graph_lock = threading.Lock()
+
+
+def get_graph():
+    global _graph
+    if _graph is None:
+        with _graph_lock:
+            if _graph is None:
+                _graph = create_graph()
+    return _graph
+
+
 def run_agent(user_id: int, message: str) -> Dict[str, Any]:
     initial_state: GraphState = {
         "messages": [],
@@ -139,5 +154,4 @@ def run_agent(user_id: int, message: str) -> Dict[str, Any]:
         "questions": [],
         "confidence": 0.0,
     }
-    graph = create_graph()
-    return graph.invoke(initial_state)
+    return get_graph().invoke(initial_state)
@@ -6,7 +6,7 @@ import json
 from app.db import SessionLocal
 from app.models import Food, MealLog, User
 from app.barcode import lookup_upc, search_food_by_name
-from app.nutrition import compute_totals
+from app.nutrition import compute_totals, TOTALS_FOOD_LOAD
 
 def tool_search_food(query: str, limit: int = 5) -> List[Dict[str, Any]]:
     """Search for food items by name"""
@@ -105,7 +105,7 @@ def tool_compute_day(user_id: int, date_iso: str = None) -> Dict[str, Any]:
         start_datetime = datetime.combine(target_date, datetime.min.time())
         end_datetime = datetime.combine(target_date, datetime.max.time())
         
-        meal_logs = db.query(MealLog).filter(
+        meal_logs = db.query(MealLog).options(TOTALS_FOOD_LOAD).filter(
             MealLog.user_id == user_id,
             MealLog.logged_at >= start_datetime,
             MealLog.logged_at <= end_datetime
@@ -3,7 +3,7 @@ from datetime import datetime, timedelta, date
 
 from app.db import SessionLocal
 from app.models import MealLog
-from app.nutrition import compute_totals
+from app.nutrition import compute_totals, NutritionContext, TOTALS_FOOD_LOAD
 from .registry import TOOL_REGISTRY, ToolSpec
 
 
@@ -18,31 +18,34 @@ def tool_compute_day(user_id: int, date_iso: str = None) -> Dict[str, Any]:
             target_date = datetime.utcnow().date()
         start_datetime = datetime.combine(target_date, datetime.min.time())
         end_datetime = datetime.combine(target_date, datetime.max.time())
-        meal_logs = db.query(MealLog).filter(
+        meal_logs = db.query(MealLog).options(TOTALS_FOOD_LOAD).filter(
             MealLog.user_id == user_id,
             MealLog.logged_at >= start_datetime,
             MealLog.logged_at <= end_datetime
         ).all()
-        totals = compute_totals(meal_logs)
-        return {
-            "date": target_date.isoformat(),
-            "meal_count": len(meal_logs),
-            "totals": totals.dict() if hasattr(totals, 'dict') else totals.__dict__,
-            "meals": [
-                {
-                    "id": log.id,
-                    "food_name": log.food.name if log.food else None,
-                    "grams": log.grams,
-                    "meal_type": log.meal_type,
-                    "logged_at": log.logged_at.isoformat(),
-                }
-                for log in meal_logs
-            ],
-        }
+        return _day_result(target_date, meal_logs, compute_totals(meal_logs))
     finally:
         db.close()
 
 
+def _day_result(target_date: date, meal_logs: List[MealLog], totals) -> Dict[str, Any]:
+    return {
+        "date": target_date.isoformat(),
+        "meal_count": len(meal_logs),
+        "totals": totals.model_dump() if hasattr(totals, 'model_dump') else totals.__dict__,
+        "meals": [
+            {
+                "id": log.id,
+                "food_name": log.food.name if log.food else None,
+                "grams": log.grams,
+                "meal_type": log.meal_type,
+                "logged_at": log.logged_at.isoformat(),
+            }
+            for log in meal_logs
+        ],
+    }
+
+
 def tool_compute_range(user_id: int, start_date_iso: str, end_date_iso: str) -> Dict[str, Any]:
     """Compute rollup totals across an inclusive date range."""
     start_d = datetime.fromisoformat(start_date_iso).date()
@@ -50,19 +53,35 @@ def tool_compute_range(user_id: int, start_date_iso: str, end_date_iso: str) ->
     if end_d < start_d:
         start_d, end_d = end_d, start_d
 
-    days: List[Dict[str, Any]] = []
-    current = start_d
-    grand_totals = None
-    while current <= end_d:
-        day = tool_compute_day(user_id, current.isoformat())
-        days.append(day)
-        if grand_totals is None:
-            grand_totals = day["totals"].copy()
-        else:
-            for k, v in day["totals"].items():
-                if isinstance(v, (int, float)):
-                    grand_totals[k] = grand_totals.get(k, 0) + v
-        current += timedelta(days=1)
+    db = SessionLocal()
+    try:
+        # One query and one nutrient matrix for the whole range; each day is a row subset
+        meal_logs = db.query(MealLog).options(TOTALS_FOOD_LOAD).filter(
+            MealLog.user_id == user_id,
+            MealLog.logged_at >= datetime.combine(start_d, datetime.min.time()),
+            MealLog.logged_at <= datetime.combine(end_d, datetime.max.time())
+        ).all()
+        ctx = NutritionContext(meal_logs)
+        rows_by_day: Dict[date, List[int]] = {}
+        for i, log in enumerate(meal_logs):
+            rows_by_day.setdefault(log.logged_at.date(), []).append(i)
+
+        days: List[Dict[str, Any]] = []
+        grand_totals = None
+        current = start_d
+        while current <= end_d:
+            rows = rows_by_day.get(current, [])
+            day = _day_result(current, [meal_logs[i] for i in rows], ctx.totals(rows))
+            days.append(day)
+            if grand_totals is None:
+                grand_totals = day["totals"].copy()
+            else:
+                for k, v in day["totals"].items():
+                    if isinstance(v, (int, float)):
+                        grand_totals[k] = grand_totals.get(k, 0) + v
+            current += timedelta(days=1)
+    finally:
+        db.close()
 
     return {"start": start_d.isoformat(), "end": end_d.isoformat(), "days": days, "totals": grand_totals}
 
@@ -4,6 +4,8 @@ Advanced goal setting system with macro cycling, periodization, and custom sched
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta, date
 from enum import Enum
+from functools import lru_cache
+import copy
 import json
 
 class GoalType(Enum):
@@ -213,6 +215,27 @@ class AdvancedGoalCalculator:
                 return base_goals
         
         return base_goals
+    
+    def get_goals_for_dates(self, user_profile: Dict, dates: List[date]) -> Dict[date, Dict]:
+        """Get goals for many dates; each distinct point in the cycle is computed once"""
+        goal_type = user_profile.get('advanced_goal_type', GoalType.STATIC.value)
+        
+        results = {}
+        computed = {}
+        for target_date in dates:
+            if goal_type == GoalType.CUSTOM_SCHEDULE.value:
+                key = target_date
+            elif goal_type in (GoalType.WEEKLY_CYCLE.value, GoalType.MACRO_CYCLING.value):
+                # 42 = lcm of the 7-day week and the 2/3/7-day carb cycles
+                key = target_date.toordinal() % 42
+            else:
+                key = None
+            
+            if key not in computed:
+                computed[key] = self.get_goals_for_date(user_profile, target_date)
+            results[target_date] = computed[key]
+        
+        return results
 
 # Global instance
 advanced_goal_calculator = AdvancedGoalCalculator()
@@ -221,7 +244,9 @@ class GoalTemplate:
     """Predefined goal templates for common scenarios"""
     
     @staticmethod
+    @lru_cache(maxsize=1)
     def get_templates() -> Dict[str, Dict]:
+        # Static configuration, built once per process; callers must not mutate it
         return {
             'bodybuilding_prep': {
                 'name': 'Bodybuilding Contest Prep',
@@ -277,6 +302,11 @@ class GoalTemplate:
             }
         }
     
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def template_names() -> Tuple[str, ...]:
+        return tuple(GoalTemplate.get_templates())
+    
     @staticmethod
     def apply_template(template_name: str, user_profile: Dict) -> Dict:
         """Apply a goal template to user profile"""
@@ -288,9 +318,30 @@ class GoalTemplate:
         template = templates[template_name]
         updated_profile = user_profile.copy()
         
-        # Apply template settings
+        # Apply template settings (copied so the cached templates stay untouched)
         for key, value in template.items():
             if key not in ['name', 'description']:
-                updated_profile[key] = value
+                updated_profile[key] = copy.deepcopy(value)
         
         return updated_profile
+    
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def get_template_payload() -> List[Dict]:
+        """Templates formatted for the frontend, built once per process"""
+        suitable_for = {
+            'bodybuilding_prep': ['Contest prep', 'Cutting', 'High protein'],
+            'powerlifting': ['Strength training', 'Powerlifting', 'Heavy lifting'],
+            'carb_cycling': ['Fat loss', 'Body recomposition', 'Metabolic flexibility'],
+            'weekend_warrior': ['Recreational athletes', 'Busy professionals', 'Weekend activities']
+        }
+        return [
+            {
+                'name': name,
+                'display_name': template['name'],
+                'description': template['description'],
+                'goal_type': template['goal_type'],
+                'suitable_for': suitable_for.get(name, ['General fitness'])
+            }
+            for name, template in GoalTemplate.get_templates().items()
+        ]
@@ -1,19 +1,38 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g
 import os
 import time
-from sqlalchemy.orm import Session
-from sqlalchemy import text
-from datetime import datetime
+import threading
+import hashlib
+import base64
+import binascii
+from functools import lru_cache
+from sqlalchemy.orm import Session, joinedload, object_session
+from sqlalchemy import text, select, update, func, cast, case, or_, desc, event, JSON, Text, type_coerce
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from datetime import datetime, date
 import os
+import json
 from flask_cors import CORS
+from flask_compress import Compress
+from flask_caching import Cache
+import gzip
 from werkzeug.security import generate_password_hash, check_password_hash
 import jwt
 from typing import Optional
-
-from .db import get_db, create_tables, engine
-from .models import User, Food, MealLog
+import orjson
+from cachetools import TTLCache
+import numpy as np
+
+from .db import get_db, create_tables, engine, run_after_commit
+from .models import (
+    User, Food, MealLog, Recipe, BarcodeHistory, SharedFood, SharedFoodLike, SharedFoodComment,
+    ActivityFeed, UserFollow, Challenge, ChallengeParticipant, NUTRIENT_COLS, pack_nutrients,
+)
 from .schemas import AgentRequest, AgentResponse, AgentStructuredResponse, FoodCandidate, DaySummary, RecommendationItem, MealLog as MealLogSchema
 from .barcode import lookup_upc
+from .barcode_scanner import barcode_api, barcode_history, validate_upc, decode_barcode_image
+from .nutrition_goals import get_cached_daily_goals, cache_daily_goals
 from agentic.graph import run_agent
 from agentic.tools import tool_compute_day
 from agentic.observability import setup_langsmith
@@ -30,11 +49,48 @@ CORS(
     allow_headers=["Content-Type", "Authorization"],
     expose_headers=["Authorization"],
 )
+# gzip/br large JSON responses (feed, history, search) for clients that accept it
+Compress(app)
 app.config["JWT_SECRET"] = os.getenv("JWT_SECRET", "dev-secret-change-me")
 
-# Simple in-memory cache for search responses
+# Route-level response cache for hot read endpoints; shared across workers when REDIS_URL is set
+if os.getenv("REDIS_URL"):
+    cache = Cache(app, config={"CACHE_TYPE": "RedisCache", "CACHE_REDIS_URL": os.getenv("REDIS_URL")})
+else:
+    cache = Cache(app, config={"CACHE_TYPE": "SimpleCache"})
+CHALLENGES_CACHE_KEY = "view/social/challenges"
+
+def _cache_ok(rv) -> bool:
+    """Only cache successful responses, never (body, 500) error tuples."""
+    return isinstance(rv, Response) and rv.status_code == 200
+
+# Bounded in-memory cache for search responses (stores serialized JSON bytes)
 SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "1800"))  # 30 minutes default
-SEARCH_CACHE: dict[str, dict] = {}
+SEARCH_CACHE_MAXSIZE = int(os.getenv("SEARCH_CACHE_MAXSIZE", "10000"))
+SEARCH_CACHE: TTLCache = TTLCache(maxsize=SEARCH_CACHE_MAXSIZE, ttl=SEARCH_CACHE_TTL)
+_SEARCH_CACHE_LOCK = threading.Lock()  # TTLCache is not thread-safe
+
+# Successful barcode lookups keyed by UPC
+UPC_CACHE: TTLCache = TTLCache(maxsize=10000, ttl=int(os.getenv("UPC_CACHE_TTL", "3600")))
+_UPC_CACHE_LOCK = threading.Lock()
+
+def _forget_upcs(upcs):
+    with _UPC_CACHE_LOCK:
+        for upc in upcs:
+            UPC_CACHE.pop(upc, None)
+
+@event.listens_for(Food, "after_update")
+@event.listens_for(Food, "after_delete")
+def _forget_food_upc(mapper, connection, target):
+    # Cached scans embed the food's nutrition and id; drop them once the change is committed
+    upc_history = sa_inspect(target).attrs.upc.history
+    upcs = {upc for upc in (*upc_history.deleted, *upc_history.unchanged, *upc_history.added) if upc}
+    session = object_session(target)
+    if upcs and session is not None:
+        run_after_commit(session, lambda: _forget_upcs(upcs))
+
+# Set at startup once mv_daily_nutrition exists (Postgres only)
+DAILY_NUTRITION_VIEW_READY = False
 
 # Create tables on startup
 with app.app_context():
@@ -52,6 +108,66 @@ with app.app_context():
         # Non-fatal; migration tools should handle in real deployments
         print(f"Warning: could not ensure users.password_hash column: {e}")
 
+    # Packed nutrient vector column on foods (NULL until a row is next written; readers fall back)
+    try:
+        from sqlalchemy import LargeBinary
+        if "nutrients_blob" not in {c["name"] for c in sa_inspect(engine).get_columns("foods")}:
+            blob_type = LargeBinary().compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(f"ALTER TABLE foods ADD COLUMN nutrients_blob {blob_type}"))
+    except Exception as e:
+        print(f"Warning: could not ensure foods.nutrients_blob column: {e}")
+
+    # Indexes added after the tables first shipped (create_all only indexes new tables)
+    try:
+        from app.models import BarcodeHistory, ChallengeParticipant, MealLog, MealPlan
+        for table in (BarcodeHistory.__table__, ChallengeParticipant.__table__,
+                      MealLog.__table__, MealPlan.__table__):
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+    except Exception as e:
+        print(f"Warning: could not ensure indexes: {e}")
+
+    # foods.name lost its B-tree index; drop it from existing databases so inserts stop maintaining it
+    try:
+        with engine.begin() as conn:
+            conn.execute(text("DROP INDEX IF EXISTS ix_foods_name"))
+    except Exception as e:
+        print(f"Warning: could not drop ix_foods_name: {e}")
+
+    # Trigram GIN indexes so ILIKE '%q%' searches on Postgres can use an index scan
+    if engine.dialect.name == "postgresql":
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_username_trgm ON users USING gin (username gin_trgm_ops)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_foods_name_trgm ON foods USING gin (name gin_trgm_ops)"))
+        except Exception as e:
+            print(f"Warning: could not ensure trigram search indexes: {e}")
+
+        # Pre-aggregated scan counts for /barcode/popular; the unique index allows REFRESH ... CONCURRENTLY
+        try:
+            with engine.begin() as conn:
+                conn.execute(text(
+                    "CREATE MATERIALIZED VIEW IF NOT EXISTS popular_products AS "
+                    "SELECT upc, max(product_name) AS product_name, max(brand) AS brand, count(*) AS scan_count "
+                    "FROM barcode_history WHERE success = true GROUP BY upc"
+                ))
+                conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_popular_products_upc ON popular_products (upc)"))
+                conn.execute(text("CREATE INDEX IF NOT EXISTS ix_popular_products_count ON popular_products (scan_count DESC)"))
+            barcode_history.start_popular_refresher()
+        except Exception as e:
+            print(f"Warning: could not ensure popular_products view: {e}")
+
+        # Per-day nutrition totals for /progress
+        try:
+            from app.nutrition import ensure_daily_nutrition_view, start_daily_nutrition_refresher
+            if ensure_daily_nutrition_view(engine):
+                DAILY_NUTRITION_VIEW_READY = True
+                start_daily_nutrition_refresher(engine)
+        except Exception as e:
+            print(f"Warning: could not ensure daily nutrition view: {e}")
+
 @app.route("/")
 def root():
     """Health check endpoint"""
@@ -62,6 +178,64 @@ def root():
     })
 
 
+def _orjson_response(payload, status: int = 200) -> Response:
+    """JSON response encoded with orjson (dates/datetimes serialize natively as ISO 8601)."""
+    return Response(orjson.dumps(payload), status=status, mimetype="application/json")
+
+
+def _etag_json(payload) -> Response:
+    """Serialize payload with a content-hash ETag; answers 304 when If-None-Match matches."""
+    body = orjson.dumps(payload)
+    resp = Response(body, mimetype="application/json")
+    resp.set_etag(hashlib.blake2b(body, digest_size=8).hexdigest())
+    return resp.make_conditional(request)
+
+
+# Nutrients rolled up into Recipe.<field>_per_serving
+RECIPE_NUTRIENT_FIELDS = (
+    'calories', 'protein_g', 'fat_g', 'carbs_g',
+    'vitamin_c_mg', 'calcium_mg', 'iron_mg'
+)
+RECIPE_NUTRIENT_INDEX = [NUTRIENT_COLS.index(field) for field in RECIPE_NUTRIENT_FIELDS]
+
+
+try:
+    from numba import njit
+
+    @njit(cache=True, fastmath=True)
+    def _sum_nutrition(mult, nut):
+        out = np.zeros(nut.shape[1])
+        for i in range(mult.shape[0]):
+            for j in range(nut.shape[1]):
+                out[j] += mult[i] * nut[i, j]
+        return out
+except ImportError:
+    def _sum_nutrition(mult, nut):
+        return mult @ nut
+
+
+def _jsonl_response(rows) -> Response:
+    """Stream rows as newline-delimited JSON, encoding one row at a time."""
+    def generate():
+        for row in rows:
+            yield orjson.dumps(row) + b"\n"
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+def _request_db() -> Session:
+    """Session shared by everything in the current request; closed on teardown."""
+    if "db" not in g:
+        g.db = next(get_db())
+    return g.db
+
+
+@app.teardown_request
+def _close_request_db(exc):
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
+
+
 # -------- Authentication helpers --------
 def _create_jwt(user: User) -> str:
     payload = {
@@ -86,12 +260,7 @@ def _auth_user() -> Optional[User]:
         user_id = int(payload.get("sub"))
     except Exception:
         return None
-    db = next(get_db())
-    try:
-        user = db.query(User).filter(User.id == user_id).first()
-        return user
-    finally:
-        db.close()
+    return _request_db().query(User).filter(User.id == user_id).first()
 
 
 @app.route("/auth/register", methods=["POST"])
@@ -102,40 +271,37 @@ def auth_register():
     password = data.get("password") or ""
     if not username or not email or not password:
         return jsonify({"error": "username, email, password required"}), 400
-    db = next(get_db())
-    try:
-        if db.query(User).filter((User.username == username) | (User.email == email)).first():
-            return jsonify({"error": "username or email already exists"}), 409
-        # Optional profile details
-        birthday = data.get("birthday")  # ISO date
-        age_val = None
-        if birthday:
-            try:
-                # Compute age in years
-                dt = datetime.fromisoformat(str(birthday))
-                today = datetime.utcnow().date()
-                age_val = today.year - dt.year - ((today.month, today.day) < (dt.month, dt.day))
-            except Exception:
-                age_val = None
-        user = User(
-            username=username,
-            email=email,
-            password_hash=generate_password_hash(password, method="pbkdf2:sha256"),
-            prefs={"goals": {}},
-            age=age_val,
-            weight_kg=(data.get("weight_kg") or None),
-            height_cm=(data.get("height_cm") or None),
-            gender=(data.get("gender") or None),
-            activity_level=(data.get("activity_level") or 'sedentary'),
-            goal_type=(data.get("goal_type") or 'maintain'),
-        )
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-        token = _create_jwt(user)
-        return jsonify({"token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
-    finally:
-        db.close()
+    db = _request_db()
+    if db.query(User).filter((User.username == username) | (User.email == email)).first():
+        return jsonify({"error": "username or email already exists"}), 409
+    # Optional profile details
+    birthday = data.get("birthday")  # ISO date
+    age_val = None
+    if birthday:
+        try:
+            # Compute age in years
+            dt = datetime.fromisoformat(str(birthday))
+            today = datetime.utcnow().date()
+            age_val = today.year - dt.year - ((today.month, today.day) < (dt.month, dt.day))
+        except Exception:
+            age_val = None
+    user = User(
+        username=username,
+        email=email,
+        password_hash=generate_password_hash(password, method="pbkdf2:sha256"),
+        prefs={"goals": {}},
+        age=age_val,
+        weight_kg=(data.get("weight_kg") or None),
+        height_cm=(data.get("height_cm") or None),
+        gender=(data.get("gender") or None),
+        activity_level=(data.get("activity_level") or 'sedentary'),
+        goal_type=(data.get("goal_type") or 'maintain'),
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    token = _create_jwt(user)
+    return jsonify({"token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
 
 
 @app.route("/auth/login", methods=["POST"])
@@ -145,15 +311,31 @@ def auth_login():
     password = data.get("password") or ""
     if not username_or_email or not password:
         return jsonify({"error": "username/email and password required"}), 400
-    db = next(get_db())
-    try:
-        user = db.query(User).filter((User.username == username_or_email) | (User.email == username_or_email.lower())).first()
-        if not user or not user.password_hash or not check_password_hash(user.password_hash, password):
-            return jsonify({"error": "invalid credentials"}), 401
-        token = _create_jwt(user)
-        return jsonify({"token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
-    finally:
-        db.close()
+    db = _request_db()
+    user = db.query(User).filter((User.username == username_or_email) | (User.email == username_or_email.lower())).first()
+    if not user or not user.password_hash or not check_password_hash(user.password_hash, password):
+        return jsonify({"error": "invalid credentials"}), 401
+    token = _create_jwt(user)
+    return jsonify({"token": token, "user": {"id": user.id, "username": user.username, "email": user.email}})
+
+
+def _update_goals_prefs(db: Session, user_id: int, goals: dict) -> bool:
+    """Write prefs["goals"] for a user with a single UPDATE (no row load). Returns False if no such user."""
+    # SQL NULL, JSON null or any other non-object prefs start over as {} (as the ORM path did)
+    if engine.dialect.name == "postgresql":
+        prefs = cast(User.prefs, JSONB)
+        base = case((func.jsonb_typeof(prefs) == "object", prefs), else_=type_coerce({}, JSONB))
+        # type_coerce binds the dict through JSONB once; cast() of a JSON string would double-encode it
+        new_prefs = cast(
+            func.jsonb_set(base, cast(["goals"], ARRAY(Text)), type_coerce(goals, JSONB)),
+            JSON,
+        )
+    else:
+        base = case((func.json_type(User.prefs) == "object", User.prefs), else_="{}")
+        new_prefs = func.json_set(base, "$.goals", func.json(json.dumps(goals)))
+    result = db.execute(update(User).where(User.id == user_id).values(prefs=new_prefs))
+    db.commit()
+    return result.rowcount > 0
 
 
 @app.route("/me", methods=["GET"])
@@ -169,24 +351,17 @@ def me_goals():
     user = _auth_user()
     if not user:
         return jsonify({"error": "unauthorized"}), 401
-    db = next(get_db())
-    try:
-        if request.method == "GET":
-            goals = (user.prefs or {}).get("goals", {})
-            return jsonify({"goals": goals})
-        else:
-            data = request.get_json() or {}
-            goals = data.get("goals") or {}
-            if not isinstance(goals, dict):
-                return jsonify({"error": "goals must be an object"}), 400
-            prefs = user.prefs or {}
-            prefs["goals"] = goals
-            user.prefs = prefs
-            db.add(user)
-            db.commit()
-            return jsonify({"success": True, "goals": goals})
-    finally:
-        db.close()
+    db = _request_db()
+    if request.method == "GET":
+        goals = (user.prefs or {}).get("goals", {})
+        return jsonify({"goals": goals})
+    else:
+        data = request.get_json() or {}
+        goals = data.get("goals") or {}
+        if not isinstance(goals, dict):
+            return jsonify({"error": "goals must be an object"}), 400
+        _update_goals_prefs(db, user.id, goals)
+        return jsonify({"success": True, "goals": goals})
 
 @app.route("/summary/day")
 def day_summary_endpoint():
@@ -231,7 +406,7 @@ def agent_endpoint():
                     food_id = int(food_id_match.group(1))
                     meal_type = meal_type_match.group(1) if meal_type_match else 'snack'
                     
-                    db = next(get_db())
+                    db = _request_db()
                     
                     # Handle USDA foods (negative IDs) by creating/finding local entries
                     if food_id < 0:
@@ -332,14 +507,13 @@ def agent_endpoint():
             if search_term:
                 # Cache key combines cleaned term, mode, page/size
                 cache_key = f"{search_term.lower()}|{mode_override or 'auto'}|{page}|{size}"
-                cached = SEARCH_CACHE.get(cache_key)
-                now = time.time()
-                if cached and now - cached.get('ts', 0) < SEARCH_CACHE_TTL:
-                    payload = cached['payload']
-                    return jsonify(payload)
+                with _SEARCH_CACHE_LOCK:
+                    cached = SEARCH_CACHE.get(cache_key)
+                if cached is not None:
+                    return Response(cached, mimetype="application/json")
                 # First try local database for speed
                 from app.models import Food
-                db = next(get_db())
+                db = _request_db()
                 local_foods = db.query(Food).filter(Food.name.ilike(f"%{search_term}%")).limit(10).all()
                 
                 local_candidates = []
@@ -446,8 +620,10 @@ def agent_endpoint():
                     if prefer_generic:
                         # Pull a wide set of explicit non-branded data types
                         generic_items: list = []
-                        for dtype in ('SR Legacy', 'Foundation', 'Survey (FNDDS)'):
-                            res = usda_api.search_foods(search_term, page_size=50, data_type=dtype)
+                        generic_results = usda_api.search_foods_by_types(
+                            search_term, ['SR Legacy', 'Foundation', 'Survey (FNDDS)'], page_size=50
+                        )
+                        for res in generic_results:
                             for usda_food in res.get('foods', []):
                                 if usda_food.get('dataType') == 'Branded':
                                     continue
@@ -617,9 +793,11 @@ def agent_endpoint():
                             "next_page": page + 1 if end < total else None,
                         }
                     }
-                    # Save in cache
-                    SEARCH_CACHE[cache_key] = {"ts": now, "payload": payload}
-                    return jsonify(payload)
+                    # Save serialized body in cache so hits skip re-encoding
+                    body = orjson.dumps(payload)
+                    with _SEARCH_CACHE_LOCK:
+                        SEARCH_CACHE[cache_key] = body
+                    return Response(body, mimetype="application/json")
                     
                 except Exception as usda_error:
                     print(f"USDA API error: {usda_error}")
@@ -698,7 +876,8 @@ def agent_endpoint():
             state=result,
         )
         
-        return jsonify(payload.dict())
+        # Serialized by pydantic-core straight to JSON bytes (no intermediate dict + json.dumps pass)
+        return Response(payload.model_dump_json(), mimetype="application/json")
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -712,7 +891,7 @@ def barcode_lookup():
             return jsonify({"error": "UPC parameter required"}), 400
         
         # Get database session
-        db = next(get_db())
+        db = _request_db()
         
         # Lookup UPC
         foods = lookup_upc(db, upc)
@@ -747,14 +926,14 @@ def barcode_lookup():
 def get_user_goals(user_id):
     """Get user's nutrition goals"""
     try:
-        db = next(get_db())
+        db = _request_db()
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
         goals = user.prefs.get("goals", {}) if user.prefs else {}
-        return jsonify({"goals": goals})
+        return _etag_json({"goals": goals})
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -767,18 +946,10 @@ def set_user_goals(user_id):
         if not data or "goals" not in data:
             return jsonify({"error": "Goals data required"}), 400
         
-        db = next(get_db())
-        user = db.query(User).filter(User.id == user_id).first()
-        
-        if not user:
+        db = _request_db()
+        if not _update_goals_prefs(db, user_id, data["goals"]):
             return jsonify({"error": "User not found"}), 404
         
-        if not user.prefs:
-            user.prefs = {}
-        
-        user.prefs["goals"] = data["goals"]
-        db.commit()
-        
         return jsonify({"success": True, "goals": data["goals"]})
         
     except Exception as e:
@@ -788,13 +959,13 @@ def set_user_goals(user_id):
 def get_user_profile(user_id: int):
     """Get user's profile and nutrition goals"""
     try:
-        db = next(get_db())
+        db = _request_db()
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        return jsonify({
+        return _etag_json({
             "user_id": user.id,
             "username": user.username,
             "email": user.email,
@@ -826,7 +997,7 @@ def get_user_profile(user_id: int):
 def update_user_profile(user_id: int):
     """Update user's profile and calculate nutrition goals"""
     try:
-        db = next(get_db())
+        db = _request_db()
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -866,17 +1037,19 @@ def update_user_profile(user_id: int):
         from app.nutrition_goals import goal_calculator
         user = goal_calculator.update_user_goals(user)
         
+        # Read the calculated goals before commit expires the instance,
+        # so the response doesn't need a reload SELECT
+        calculated_goals = {
+            "calories": user.goal_calories,
+            "protein_g": user.goal_protein_g,
+            "fat_g": user.goal_fat_g,
+            "carbs_g": user.goal_carbs_g
+        }
         db.commit()
-        db.refresh(user)
         
         return jsonify({
             "message": "Profile updated successfully",
-            "calculated_goals": {
-                "calories": user.goal_calories,
-                "protein_g": user.goal_protein_g,
-                "fat_g": user.goal_fat_g,
-                "carbs_g": user.goal_carbs_g
-            }
+            "calculated_goals": calculated_goals
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -886,9 +1059,9 @@ def generate_meal_plan(user_id: int):
     """Generate a meal plan for the user"""
     try:
         from app.meal_planner import meal_planner
-        from app.models import User
+        from app.models import User, MealPlan, MealPlanItem
         
-        db = next(get_db())
+        db = _request_db()
         user = db.query(User).filter(User.id == user_id).first()
         
         if not user:
@@ -897,7 +1070,12 @@ def generate_meal_plan(user_id: int):
         # Generate meal plan
         meal_plan = meal_planner.suggest_meal_plan(db, user)
         
-        # Get nutrition totals
+        # Reload items and their foods in one joined query (commit expired them; avoids one SELECT per item)
+        meal_plan = db.query(MealPlan).options(
+            joinedload(MealPlan.items).joinedload(MealPlanItem.food)
+        ).filter(MealPlan.id == meal_plan.id).one()
+        
+        # Get nutrition totals (computed from the loaded items)
         nutrition = meal_planner.get_meal_plan_nutrition(db, meal_plan)
         
         # Format response
@@ -940,7 +1118,7 @@ def export_data(user_id: int):
         import io
         from flask import make_response
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get recent meal logs
         from app.models import MealLog
@@ -995,19 +1173,22 @@ def export_data(user_id: int):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Per-day series charted by /progress
+PROGRESS_NUTRIENTS = ('calories', 'protein_g', 'fat_g', 'carbs_g', 'vitamin_c_mg', 'calcium_mg', 'iron_mg')
+
 @app.route("/progress/<int:user_id>", methods=["GET"])
 def get_progress_data(user_id: int):
     """Get progress data for charts and analytics"""
     try:
         from datetime import datetime, timedelta
-        from sqlalchemy.orm import joinedload
         from sqlalchemy import func
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get date range (default to last 30 days)
         days = int(request.args.get('days', 30))
-        end_date = datetime.now()
+        # meal_logs.logged_at is stored as naive UTC, so bucket days in UTC too
+        end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
         
         # Get user's goals
@@ -1017,45 +1198,43 @@ def get_progress_data(user_id: int):
         
         # Get daily nutrition totals for the period
         from app.models import MealLog
+        from app.nutrition import compute_totals_from_portions
         
         daily_data = []
-        current_date = start_date
         
-        while current_date <= end_date:
-            # Get all meal logs for this day
-            day_start = current_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = day_start + timedelta(days=1)
-            
-            day_logs = db.query(MealLog).options(joinedload(MealLog.food)).filter(
-                MealLog.user_id == user_id,
-                MealLog.logged_at >= day_start,
-                MealLog.logged_at < day_end
-            ).all()
-            
-            # Calculate daily totals
-            daily_totals = {
-                'date': current_date.strftime('%Y-%m-%d'),
-                'calories': 0,
-                'protein_g': 0,
-                'fat_g': 0,
-                'carbs_g': 0,
-                'vitamin_c_mg': 0,
-                'calcium_mg': 0,
-                'iron_mg': 0,
-                'meals_logged': len(day_logs)
-            }
-            
-            for log in day_logs:
-                food = log.food
-                multiplier = log.grams / 100.0
+        # Precompute [day_start, day_end) boundaries once instead of per iteration
+        one_day = timedelta(days=1)
+        first_day = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        day_bounds = [(first_day + i * one_day, first_day + (i + 1) * one_day) for i in range(days + 1)]
+        
+        # Past days come from the materialized view in one query; today is always computed live
+        today = end_date.date()
+        materialized = None
+        if DAILY_NUTRITION_VIEW_READY:
+            from app.nutrition import get_daily_nutrition_rows
+            materialized = get_daily_nutrition_rows(db, user_id, first_day.date(), today - one_day)
+        
+        for day_start, day_end in day_bounds:
+            if materialized is not None and day_start.date() < today:
+                row = materialized.get(day_start.date(), {})
+                daily_totals = {'date': day_start.strftime('%Y-%m-%d')}
+                for key in PROGRESS_NUTRIENTS:
+                    daily_totals[key] = float(row.get(key) or 0)
+                daily_totals['meals_logged'] = int(row.get('meals_logged') or 0)
+            else:
+                # Only (food_id, grams) per log; nutrient vectors come from the per-food cache
+                portions = db.execute(select(MealLog.food_id, MealLog.grams).where(
+                    MealLog.user_id == user_id,
+                    MealLog.logged_at >= day_start,
+                    MealLog.logged_at < day_end
+                )).all()
                 
-                daily_totals['calories'] += (food.calories or 0) * multiplier
-                daily_totals['protein_g'] += (food.protein_g or 0) * multiplier
-                daily_totals['fat_g'] += (food.fat_g or 0) * multiplier
-                daily_totals['carbs_g'] += (food.carbs_g or 0) * multiplier
-                daily_totals['vitamin_c_mg'] += (food.vitamin_c_mg or 0) * multiplier
-                daily_totals['calcium_mg'] += (food.calcium_mg or 0) * multiplier
-                daily_totals['iron_mg'] += (food.iron_mg or 0) * multiplier
+                # Vectorized over all nutrients; pick the charted ones
+                totals = compute_totals_from_portions(db, portions)
+                daily_totals = {'date': day_start.strftime('%Y-%m-%d')}
+                for key in PROGRESS_NUTRIENTS:
+                    daily_totals[key] = getattr(totals, key)
+                daily_totals['meals_logged'] = len(portions)
             
             # Calculate goal achievement percentages
             if user.goal_calories:
@@ -1068,7 +1247,6 @@ def get_progress_data(user_id: int):
                 daily_totals['carbs_goal_percent'] = (daily_totals['carbs_g'] / user.goal_carbs_g) * 100
             
             daily_data.append(daily_totals)
-            current_date += timedelta(days=1)
         
         # Calculate summary statistics
         total_days = len([d for d in daily_data if d['meals_logged'] > 0])
@@ -1119,13 +1297,16 @@ def get_progress_data(user_id: int):
 def get_meal_templates(user_id: int):
     """Get all meal plan templates for a user"""
     try:
-        from app.models import MealPlan
-        from sqlalchemy.orm import joinedload
+        from app.models import MealPlan, MealPlanItem
+        from sqlalchemy.orm import selectinload
         
-        db = next(get_db())
+        db = _request_db()
         
+        # Items in one IN query, each with only the Food columns summarized below
         templates = db.query(MealPlan).options(
-            joinedload(MealPlan.items).joinedload('food')
+            selectinload(MealPlan.items).joinedload(MealPlanItem.food).load_only(
+                Food.name, Food.brand, Food.calories, Food.protein_g, Food.fat_g, Food.carbs_g
+            )
         ).filter(
             MealPlan.user_id == user_id,
             MealPlan.is_template == 1
@@ -1171,7 +1352,9 @@ def get_meal_templates(user_id: int):
                 'created_at': template.created_at.isoformat()
             })
         
-        return jsonify({"templates": template_list})
+        if request.args.get("format") == "jsonl":
+            return _jsonl_response(template_list)
+        return _etag_json({"templates": template_list})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1185,7 +1368,7 @@ def save_meal_template(user_id: int):
         if not data or not data.get('name'):
             return jsonify({"error": "Template name required"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         # Create template
         template = MealPlan(
@@ -1239,7 +1422,7 @@ def apply_meal_template(template_id: int, user_id: int):
         else:
             target_date = datetime.now() + timedelta(days=1)
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get template
         template = db.query(MealPlan).filter(
@@ -1295,7 +1478,7 @@ def delete_meal_template(template_id: int, user_id: int):
     try:
         from app.models import MealPlan
         
-        db = next(get_db())
+        db = _request_db()
         
         template = db.query(MealPlan).filter(
             MealPlan.id == template_id,
@@ -1317,13 +1500,15 @@ def delete_meal_template(template_id: int, user_id: int):
 def get_user_recipes(user_id: int):
     """Get all recipes for a user"""
     try:
-        from app.models import Recipe
-        from sqlalchemy.orm import joinedload
+        from app.models import Recipe, RecipeIngredient, Food
+        from sqlalchemy.orm import selectinload
         
-        db = next(get_db())
+        db = _request_db()
         
+        # Ingredients in a second IN query rather than a JOIN that repeats every recipe's
+        # text columns once per ingredient; of each Food only the listed name/brand are read
         recipes = db.query(Recipe).options(
-            joinedload(Recipe.ingredients).joinedload('food')
+            selectinload(Recipe.ingredients).joinedload(RecipeIngredient.food).load_only(Food.name, Food.brand)
         ).filter(Recipe.user_id == user_id).order_by(Recipe.created_at.desc()).all()
         
         recipe_list = []
@@ -1359,7 +1544,9 @@ def get_user_recipes(user_id: int):
             }
             recipe_list.append(recipe_data)
         
-        return jsonify({"recipes": recipe_list})
+        if request.args.get("format") == "jsonl":
+            return _jsonl_response(recipe_list)
+        return _etag_json({"recipes": recipe_list})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1367,13 +1554,13 @@ def get_user_recipes(user_id: int):
 def create_recipe(user_id: int):
     """Create a new recipe"""
     try:
-        from app.models import Recipe, RecipeIngredient, Food
+        from app.models import Recipe, RecipeIngredient
         
         data = request.get_json()
         if not data or not data.get('name'):
             return jsonify({"error": "Recipe name required"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         # Create recipe
         recipe = Recipe(
@@ -1386,57 +1573,52 @@ def create_recipe(user_id: int):
             instructions=data.get('instructions', '')
         )
         db.add(recipe)
-        db.commit()
-        db.refresh(recipe)
+        db.flush()  # assigns recipe.id; committed together with the ingredients
+        recipe_id = recipe.id
         
         # Add ingredients and calculate nutrition
-        total_nutrition = {
-            'calories': 0, 'protein_g': 0, 'fat_g': 0, 'carbs_g': 0,
-            'vitamin_c_mg': 0, 'calcium_mg': 0, 'iron_mg': 0
-        }
-        
-        for idx, ingredient_data in enumerate(data.get('ingredients', [])):
-            ingredient = RecipeIngredient(
-                recipe_id=recipe.id,
-                food_id=ingredient_data['food_id'],
-                grams=ingredient_data['grams'],
-                notes=ingredient_data.get('notes', ''),
-                order_index=idx
-            )
-            db.add(ingredient)
-            
-            # Get food nutrition and add to totals
-            food = db.query(Food).filter(Food.id == ingredient_data['food_id']).first()
-            if food:
-                multiplier = ingredient_data['grams'] / 100.0
-                total_nutrition['calories'] += (food.calories or 0) * multiplier
-                total_nutrition['protein_g'] += (food.protein_g or 0) * multiplier
-                total_nutrition['fat_g'] += (food.fat_g or 0) * multiplier
-                total_nutrition['carbs_g'] += (food.carbs_g or 0) * multiplier
-                total_nutrition['vitamin_c_mg'] += (food.vitamin_c_mg or 0) * multiplier
-                total_nutrition['calcium_mg'] += (food.calcium_mg or 0) * multiplier
-                total_nutrition['iron_mg'] += (food.iron_mg or 0) * multiplier
+        ingredients_data = data.get('ingredients', [])
+        
+        rows = [
+            {
+                'recipe_id': recipe_id,
+                'food_id': i['food_id'],
+                'grams': i['grams'],
+                'notes': i.get('notes', ''),
+                'order_index': idx
+            }
+            for idx, i in enumerate(ingredients_data)
+        ]
+        if rows:
+            db.execute(RecipeIngredient.__table__.insert(), rows)
+        
+        # Sum nutrients as (grams/100) @ nutrient matrix (JIT kernel when numba is installed).
+        # Per-100g vectors come from the shared per-food cache; unknown foods are zero rows.
+        totals = np.zeros(len(RECIPE_NUTRIENT_FIELDS), dtype=np.float64)
+        if ingredients_data:
+            from app.nutrition import food_nutrient_matrix
+            mat = food_nutrient_matrix(db, [i['food_id'] for i in ingredients_data])
+            nut = np.ascontiguousarray(mat[:, RECIPE_NUTRIENT_INDEX])
+            mult = np.fromiter((i['grams'] / 100.0 for i in ingredients_data), dtype=np.float64,
+                               count=len(ingredients_data))
+            totals = _sum_nutrition(mult, nut)
         
         # Calculate per-serving nutrition
         servings = recipe.servings or 1.0
-        recipe.calories_per_serving = total_nutrition['calories'] / servings
-        recipe.protein_g_per_serving = total_nutrition['protein_g'] / servings
-        recipe.fat_g_per_serving = total_nutrition['fat_g'] / servings
-        recipe.carbs_g_per_serving = total_nutrition['carbs_g'] / servings
-        recipe.vitamin_c_mg_per_serving = total_nutrition['vitamin_c_mg'] / servings
-        recipe.calcium_mg_per_serving = total_nutrition['calcium_mg'] / servings
-        recipe.iron_mg_per_serving = total_nutrition['iron_mg'] / servings
+        per_serving = dict(zip(RECIPE_NUTRIENT_FIELDS, (totals / servings).tolist()))
+        for key, value in per_serving.items():
+            setattr(recipe, f"{key}_per_serving", value)
         
         db.commit()
         
         return jsonify({
             "message": "Recipe created successfully",
-            "recipe_id": recipe.id,
+            "recipe_id": recipe_id,
             "nutrition_per_serving": {
-                'calories': round(recipe.calories_per_serving, 1),
-                'protein_g': round(recipe.protein_g_per_serving, 1),
-                'fat_g': round(recipe.fat_g_per_serving, 1),
-                'carbs_g': round(recipe.carbs_g_per_serving, 1)
+                'calories': round(per_serving['calories'], 1),
+                'protein_g': round(per_serving['protein_g'], 1),
+                'fat_g': round(per_serving['fat_g'], 1),
+                'carbs_g': round(per_serving['carbs_g'], 1)
             }
         })
     except Exception as e:
@@ -1448,7 +1630,7 @@ def convert_recipe_to_food(recipe_id: int, user_id: int):
     try:
         from app.models import Recipe, Food
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get recipe
         recipe = db.query(Recipe).filter(
@@ -1460,8 +1642,9 @@ def convert_recipe_to_food(recipe_id: int, user_id: int):
             return jsonify({"error": "Recipe not found"}), 404
         
         # Create food entry from recipe
+        recipe_name = recipe.name
         food = Food(
-            name=f"{recipe.name} (Recipe)",
+            name=f"{recipe_name} (Recipe)",
             brand="Custom Recipe",
             data_source="recipe",
             calories=recipe.calories_per_serving,
@@ -1473,13 +1656,14 @@ def convert_recipe_to_food(recipe_id: int, user_id: int):
             iron_mg=recipe.iron_mg_per_serving
         )
         db.add(food)
+        db.flush()
+        new_id = food.id
         db.commit()
-        db.refresh(food)
         
         return jsonify({
             "message": "Recipe converted to food successfully",
-            "food_id": food.id,
-            "food_name": food.name
+            "food_id": new_id,
+            "food_name": f"{recipe_name} (Recipe)"
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1490,7 +1674,7 @@ def delete_recipe(recipe_id: int, user_id: int):
     try:
         from app.models import Recipe
         
-        db = next(get_db())
+        db = _request_db()
         
         recipe = db.query(Recipe).filter(
             Recipe.id == recipe_id,
@@ -1514,7 +1698,7 @@ def get_advanced_goals(user_id: int):
         from app.models import AdvancedGoalSettings
         from app.advanced_goals import GoalTemplate
         
-        db = next(get_db())
+        db = _request_db()
         
         settings = db.query(AdvancedGoalSettings).filter(
             AdvancedGoalSettings.user_id == user_id
@@ -1530,7 +1714,7 @@ def get_advanced_goals(user_id: int):
                 "custom_fat_ratio": None,
                 "custom_carb_ratio": None,
                 "template_name": None,
-                "available_templates": list(GoalTemplate.get_templates().keys())
+                "available_templates": GoalTemplate.template_names()
             })
         
         return jsonify({
@@ -1541,7 +1725,7 @@ def get_advanced_goals(user_id: int):
             "custom_fat_ratio": settings.custom_fat_ratio,
             "custom_carb_ratio": settings.custom_carb_ratio,
             "template_name": settings.template_name,
-            "available_templates": list(GoalTemplate.get_templates().keys())
+            "available_templates": GoalTemplate.template_names()
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1550,13 +1734,13 @@ def get_advanced_goals(user_id: int):
 def update_advanced_goals(user_id: int):
     """Update user's advanced goal settings"""
     try:
-        from app.models import AdvancedGoalSettings, DailyGoalCache
+        from app.models import AdvancedGoalSettings
         
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get or create settings
         settings = db.query(AdvancedGoalSettings).filter(
@@ -1567,27 +1751,14 @@ def update_advanced_goals(user_id: int):
             settings = AdvancedGoalSettings(user_id=user_id)
             db.add(settings)
         
-        # Update settings
-        if 'goal_type' in data:
-            settings.goal_type = data['goal_type']
-        if 'training_schedule' in data:
-            settings.training_schedule = data['training_schedule']
-        if 'carb_cycling_pattern' in data:
-            settings.carb_cycling_pattern = data['carb_cycling_pattern']
-        if 'custom_protein_ratio' in data:
-            settings.custom_protein_ratio = data['custom_protein_ratio']
-        if 'custom_fat_ratio' in data:
-            settings.custom_fat_ratio = data['custom_fat_ratio']
-        if 'custom_carb_ratio' in data:
-            settings.custom_carb_ratio = data['custom_carb_ratio']
+        # Update settings; cached daily goals are cleared on flush only if a goal input changed
+        for key in ('goal_type', 'training_schedule', 'carb_cycling_pattern',
+                    'custom_protein_ratio', 'custom_fat_ratio', 'custom_carb_ratio'):
+            if key in data and data[key] != getattr(settings, key):
+                setattr(settings, key, data[key])
         if 'template_name' in data:
             settings.template_name = data['template_name']
         
-        # Clear goal cache since settings changed
-        db.query(DailyGoalCache).filter(
-            DailyGoalCache.user_id == user_id
-        ).delete()
-        
         db.commit()
         
         return jsonify({"message": "Advanced goals updated successfully"})
@@ -1607,7 +1778,7 @@ def apply_goal_template(user_id: int):
         if not template_name:
             return jsonify({"error": "Template name required"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         # Get user profile
         user = db.query(User).filter(User.id == user_id).first()
@@ -1657,11 +1828,46 @@ def apply_goal_template(user_id: int):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _build_goal_profile(db: Session, user: User) -> dict:
+    """User profile (with any advanced goal settings) as expected by advanced_goal_calculator"""
+    from app.models import AdvancedGoalSettings
+    
+    # Get advanced settings
+    advanced_settings = db.query(AdvancedGoalSettings).filter(
+        AdvancedGoalSettings.user_id == user.id
+    ).first()
+    
+    # Build user profile for calculation
+    user_profile = {
+        'weight_kg': user.weight_kg or 70,
+        'height_cm': user.height_cm or 170,
+        'age': user.age or 25,
+        'gender': user.gender or 'male',
+        'activity_level': user.activity_level or 'moderate',
+        'goal_type': user.goal_type or 'maintain'
+    }
+    
+    # Add advanced settings if available
+    if advanced_settings:
+        user_profile.update({
+            'advanced_goal_type': advanced_settings.goal_type,
+            'training_schedule': advanced_settings.training_schedule,
+            'carb_cycling_pattern': advanced_settings.carb_cycling_pattern,
+            'custom_protein_ratio': advanced_settings.custom_protein_ratio,
+            'custom_fat_ratio': advanced_settings.custom_fat_ratio,
+            'custom_carb_ratio': advanced_settings.custom_carb_ratio
+        })
+    
+    return user_profile
+
+# daily_goal_cache columns overwritten when an upsert hits an existing (user_id, goal_date) row
+DAILY_GOAL_UPSERT_COLUMNS = ('calories', 'protein_g', 'fat_g', 'carbs_g', 'fiber_g', 'sodium_mg', 'goal_type', 'created_at')
+
 @app.route("/goals-for-date/<int:user_id>", methods=["GET"])
 def get_goals_for_date(user_id: int):
     """Get nutrition goals for a specific date"""
     try:
-        from app.models import User, AdvancedGoalSettings, DailyGoalCache
+        from app.models import User, DailyGoalCache
         from app.advanced_goals import advanced_goal_calculator
         from datetime import datetime, date
         
@@ -1672,17 +1878,20 @@ def get_goals_for_date(user_id: int):
         else:
             target_date = date.today()
         
-        db = next(get_db())
+        # In-process cache first, then the daily_goal_cache table
+        payload = get_cached_daily_goals(user_id, target_date)
+        if payload is not None:
+            return jsonify({"date": target_date.isoformat(), **payload, "cached": True})
+        
+        db = _request_db()
         
-        # Check cache first
         cached_goals = db.query(DailyGoalCache).filter(
             DailyGoalCache.user_id == user_id,
             DailyGoalCache.goal_date == target_date
-        ).first()
+        ).one_or_none()  # unique on (user_id, goal_date)
         
         if cached_goals:
-            return jsonify({
-                "date": target_date.isoformat(),
+            payload = {
                 "goals": {
                     "calories": cached_goals.calories,
                     "protein_g": cached_goals.protein_g,
@@ -1695,46 +1904,28 @@ def get_goals_for_date(user_id: int):
                     "goal_type": cached_goals.goal_type,
                     "training_day": cached_goals.training_day,
                     "is_high_carb_day": cached_goals.is_high_carb_day
-                },
-                "cached": True
-            })
+                }
+            }
+            cache_daily_goals(user_id, target_date, payload)
+            return jsonify({"date": target_date.isoformat(), **payload, "cached": True})
         
         # Get user profile
         user = db.query(User).filter(User.id == user_id).first()
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Get advanced settings
-        advanced_settings = db.query(AdvancedGoalSettings).filter(
-            AdvancedGoalSettings.user_id == user_id
-        ).first()
-        
-        # Build user profile for calculation
-        user_profile = {
-            'weight_kg': user.weight_kg or 70,
-            'height_cm': user.height_cm or 170,
-            'age': user.age or 25,
-            'gender': user.gender or 'male',
-            'activity_level': user.activity_level or 'moderate',
-            'goal_type': user.goal_type or 'maintain'
-        }
-        
-        # Add advanced settings if available
-        if advanced_settings:
-            user_profile.update({
-                'advanced_goal_type': advanced_settings.goal_type,
-                'training_schedule': advanced_settings.training_schedule,
-                'carb_cycling_pattern': advanced_settings.carb_cycling_pattern,
-                'custom_protein_ratio': advanced_settings.custom_protein_ratio,
-                'custom_fat_ratio': advanced_settings.custom_fat_ratio,
-                'custom_carb_ratio': advanced_settings.custom_carb_ratio
-            })
+        user_profile = _build_goal_profile(db, user)
         
         # Calculate goals for the date
         goals = advanced_goal_calculator.get_goals_for_date(user_profile, target_date)
         
-        # Cache the results
-        cache_entry = DailyGoalCache(
+        # Cache the results in one statement; if a concurrent request cached the day first, keep these values
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        
+        stmt = dialect_insert(DailyGoalCache).values(
             user_id=user_id,
             goal_date=target_date,
             calories=goals['calories'],
@@ -1743,15 +1934,15 @@ def get_goals_for_date(user_id: int):
             carbs_g=goals['carbs_g'],
             fiber_g=goals['fiber_g'],
             sodium_mg=goals['sodium_mg'],
-            goal_type=user_profile.get('advanced_goal_type', 'static')
+            goal_type=user_profile.get('advanced_goal_type', 'static'),
+            created_at=datetime.utcnow()
         )
-        
-        try:
-            db.add(cache_entry)
-            db.commit()
-        except Exception:
-            # Handle duplicate key error gracefully
-            db.rollback()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'goal_date'],
+            set_={col: stmt.excluded[col] for col in DAILY_GOAL_UPSERT_COLUMNS}
+        )
+        db.execute(stmt)
+        db.commit()
         
         return jsonify({
             "date": target_date.isoformat(),
@@ -1773,46 +1964,190 @@ def get_goals_for_date(user_id: int):
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/goals-for-range/<int:user_id>", methods=["GET"])
+def get_goals_for_range(user_id: int):
+    """Get nutrition goals for every date in [start, end], e.g. for a calendar view"""
+    try:
+        from app.models import User, DailyGoalCache
+        from app.advanced_goals import advanced_goal_calculator
+        from datetime import timedelta
+        
+        start_str = request.args.get('start')
+        end_str = request.args.get('end')
+        if not start_str or not end_str:
+            return jsonify({"error": "start and end dates required"}), 400
+        
+        start_date = datetime.fromisoformat(start_str).date()
+        end_date = datetime.fromisoformat(end_str).date()
+        num_days = (end_date - start_date).days + 1
+        if num_days < 1 or num_days > 366:
+            return jsonify({"error": "Range must span 1 to 366 days"}), 400
+        dates = [start_date + timedelta(days=i) for i in range(num_days)]
+        
+        db = _request_db()
+        
+        # One lookup for every cached day in the range
+        cached = {
+            c.goal_date: c for c in db.query(DailyGoalCache).filter(
+                DailyGoalCache.user_id == user_id,
+                DailyGoalCache.goal_date.in_(dates)
+            ).all()
+        }
+        
+        missing = [d for d in dates if d not in cached]
+        computed = {}
+        goal_type = 'static'
+        if missing:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user:
+                return jsonify({"error": "User not found"}), 404
+            
+            user_profile = _build_goal_profile(db, user)
+            goal_type = user_profile.get('advanced_goal_type', 'static')
+            computed = advanced_goal_calculator.get_goals_for_dates(user_profile, missing)
+            
+            # Cache all missing days with one multi-row INSERT
+            if engine.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            
+            now = datetime.utcnow()
+            rows = [
+                {
+                    'user_id': user_id,
+                    'goal_date': d,
+                    'calories': goals['calories'],
+                    'protein_g': goals['protein_g'],
+                    'fat_g': goals['fat_g'],
+                    'carbs_g': goals['carbs_g'],
+                    'fiber_g': goals['fiber_g'],
+                    'sodium_mg': goals['sodium_mg'],
+                    'goal_type': goal_type,
+                    'created_at': now
+                }
+                for d, goals in computed.items()
+            ]
+            stmt = dialect_insert(DailyGoalCache)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['user_id', 'goal_date'],
+                set_={col: stmt.excluded[col] for col in DAILY_GOAL_UPSERT_COLUMNS}
+            )
+            db.execute(stmt, rows)
+            db.commit()
+        
+        days = []
+        for d in dates:
+            if d in cached:
+                c = cached[d]
+                days.append({
+                    "date": d.isoformat(),
+                    "goals": {
+                        "calories": c.calories,
+                        "protein_g": c.protein_g,
+                        "fat_g": c.fat_g,
+                        "carbs_g": c.carbs_g,
+                        "fiber_g": c.fiber_g,
+                        "sodium_mg": c.sodium_mg
+                    },
+                    "goal_type": c.goal_type,
+                    "cached": True
+                })
+            else:
+                goals = computed[d]
+                days.append({
+                    "date": d.isoformat(),
+                    "goals": {k: round(goals[k], 1) for k in ('calories', 'protein_g', 'fat_g', 'carbs_g', 'fiber_g', 'sodium_mg')},
+                    "goal_type": goal_type,
+                    "cached": False
+                })
+        
+        return jsonify({"days": days})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@lru_cache(maxsize=1)
+def _goal_templates_body() -> bytes:
+    """Serialized /goal-templates payload; templates are static per process"""
+    from app.advanced_goals import GoalTemplate
+    return orjson.dumps({"templates": GoalTemplate.get_template_payload()})
+
+@lru_cache(maxsize=1)
+def _goal_templates_gzip() -> bytes:
+    return gzip.compress(_goal_templates_body())
+
 @app.route("/goal-templates", methods=["GET"])
 def get_goal_templates():
     """Get available goal templates"""
     try:
-        from app.advanced_goals import GoalTemplate
-        
-        templates = GoalTemplate.get_templates()
-        
-        # Format templates for frontend
-        formatted_templates = []
-        for name, template in templates.items():
-            formatted_templates.append({
-                'name': name,
-                'display_name': template['name'],
-                'description': template['description'],
-                'goal_type': template['goal_type'],
-                'suitable_for': {
-                    'bodybuilding_prep': ['Contest prep', 'Cutting', 'High protein'],
-                    'powerlifting': ['Strength training', 'Powerlifting', 'Heavy lifting'],
-                    'carb_cycling': ['Fat loss', 'Body recomposition', 'Metabolic flexibility'],
-                    'weekend_warrior': ['Recreational athletes', 'Busy professionals', 'Weekend activities']
-                }.get(name, ['General fitness'])
-            })
-        
-        return jsonify({"templates": formatted_templates})
+        if "gzip" in request.accept_encodings:
+            resp = Response(_goal_templates_gzip(), mimetype="application/json")
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = Response(_goal_templates_body(), mimetype="application/json")
+        resp.vary.add("Accept-Encoding")
+        return resp
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _upsert_scanned_food(db: Session, upc: str, product_data: dict) -> int:
+    """Insert or refresh the Food for a scanned UPC in one round trip; returns its id (caller commits)."""
+    if engine.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    
+    nutrition = product_data['nutrition']
+    # Every nutrient column is written (None where the source has no value) so the row matches its blob
+    nutrients = {col: nutrition.get(col) for col in NUTRIENT_COLS}
+    food_values = dict(
+        name=product_data['name'],
+        brand=product_data['brand'],
+        upc=upc,
+        data_source=product_data['source'],
+        # Core statements skip the ORM before_insert/before_update packer
+        nutrients_blob=pack_nutrients(list(nutrients.values())),
+        **nutrients,
+    )
+    # Insert-or-refresh by UPC in one round-trip
+    stmt = dialect_insert(Food).values(**food_values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['upc'],
+        set_={k: stmt.excluded[k] for k in food_values if k != 'upc'}
+    ).returning(Food.id)
+    return db.execute(stmt).scalar_one()
+
 @app.route("/barcode/scan", methods=["POST"])
 def scan_barcode():
     """Scan barcode from camera or uploaded image"""
     try:
-        from app.barcode_scanner import barcode_api, barcode_history, validate_upc, decode_barcode_image
-        from app.models import BarcodeHistory, Food
-        
-        data = request.get_json()
-        user_id = data.get('user_id', 1)
+        image_file = request.files.get('image')
+        if image_file:
+            # Multipart upload: Werkzeug spools the file, so no base64 copy is held in memory
+            data = request.form.to_dict()
+            data['save_to_db'] = data.get('save_to_db', 'true').lower() != 'false'
+        else:
+            data = request.get_json()
+        user_id = int(data.get('user_id', 1))
         
         # Handle different input types
-        if 'upc' in data:
+        if image_file:
+            upc = decode_barcode_image(image_file.stream)
+            scan_method = "upload"
+            
+            if not upc:
+                barcode_history.record_scan("unknown", False, None, user_id)
+                return jsonify({
+                    "success": False,
+                    "error": "No barcode detected in image",
+                    "suggestions": [
+                        "Ensure the barcode is clearly visible",
+                        "Try better lighting",
+                        "Hold the camera steady",
+                        "Get closer to the barcode"
+                    ]
+                }), 400
+        elif 'upc' in data:
             # Manual UPC input
             upc = data['upc'].strip()
             scan_method = "manual"
@@ -1847,7 +2182,14 @@ def scan_barcode():
                 "upc": upc
             }), 400
         
-        db = next(get_db())
+        # Recently resolved UPCs skip both the DB and the external APIs
+        with _UPC_CACHE_LOCK:
+            cached = UPC_CACHE.get(upc)
+        if cached is not None:
+            barcode_history.record_scan(upc, True, cached['product'], user_id)
+            return jsonify({"success": True, "upc": upc, "scan_method": scan_method, **cached})
+        
+        db = _request_db()
         
         # First check if we already have this product in our database
         existing_food = db.query(Food).filter(Food.upc == upc).first()
@@ -1862,7 +2204,7 @@ def scan_barcode():
                     'protein_g': existing_food.protein_g,
                     'fat_g': existing_food.fat_g,
                     'carbs_g': existing_food.carbs_g,
-                    'fiber_g': existing_food.fiber_g,
+                    'fiber_g': None,  # Food has no fiber column
                     'sodium_mg': existing_food.sodium_mg,
                     'vitamin_c_mg': existing_food.vitamin_c_mg,
                     'calcium_mg': existing_food.calcium_mg,
@@ -1872,6 +2214,9 @@ def scan_barcode():
             
             barcode_history.record_scan(upc, True, product_data, user_id)
             
+            with _UPC_CACHE_LOCK:
+                UPC_CACHE[upc] = {"product": product_data, "source": "local_database", "food_id": existing_food.id}
+            
             return jsonify({
                 "success": True,
                 "upc": upc,
@@ -1891,26 +2236,16 @@ def scan_barcode():
             # Optionally create a Food entry for future use
             if data.get('save_to_db', True):
                 try:
-                    new_food = Food(
-                        name=product_data['name'],
-                        brand=product_data['brand'],
-                        upc=upc,
-                        data_source=product_data['source'],
-                        calories=product_data['nutrition']['calories'],
-                        protein_g=product_data['nutrition']['protein_g'],
-                        fat_g=product_data['nutrition']['fat_g'],
-                        carbs_g=product_data['nutrition']['carbs_g'],
-                        fiber_g=product_data['nutrition'].get('fiber_g'),
-                        sodium_mg=product_data['nutrition'].get('sodium_mg'),
-                        vitamin_c_mg=product_data['nutrition'].get('vitamin_c_mg'),
-                        calcium_mg=product_data['nutrition'].get('calcium_mg'),
-                        iron_mg=product_data['nutrition'].get('iron_mg')
-                    )
-                    db.add(new_food)
+                    from app.nutrition import invalidate_food_vectors
+                    food_id = _upsert_scanned_food(db, upc, product_data)
                     db.commit()
-                    db.refresh(new_food)
+                    invalidate_food_vectors([food_id])  # a refreshed row would leave stale cached vectors
                     
-                    product_data['food_id'] = new_food.id
+                    product_data['food_id'] = food_id
+                    # Cache only once the Food exists, so a later save_to_db scan can't be answered
+                    # from an entry that never saved it
+                    with _UPC_CACHE_LOCK:
+                        UPC_CACHE[upc] = {"product": product_data, "source": product_data['source'], "food_id": food_id}
                 except Exception as e:
                     print(f"Error saving food to DB: {e}")
                     db.rollback()
@@ -1941,22 +2276,37 @@ def scan_barcode():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _encode_history_cursor(row: dict) -> str:
+    """Opaque keyset cursor for a scan-history row: base64 of '<scanned_at>|<id>'."""
+    return base64.urlsafe_b64encode(f"{row['scanned_at']}|{row['id']}".encode()).decode()
+
+def _decode_history_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None
+    scanned_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(scanned_at), int(row_id)
+
 @app.route("/barcode/history/<int:user_id>", methods=["GET"])
 def get_barcode_history(user_id: int):
     """Get user's barcode scan history"""
     try:
-        from app.barcode_scanner import barcode_history
-        
         limit = int(request.args.get('limit', 50))
-        history = barcode_history.get_scan_history(user_id, limit)
+        try:
+            before = _decode_history_cursor(request.args.get('cursor'))
+        except (ValueError, binascii.Error):
+            return jsonify({"error": "Invalid cursor"}), 400
+        history = barcode_history.get_scan_history(user_id, limit, before=before)
+        next_cursor = _encode_history_cursor(history[-1]) if len(history) == limit else None
         
         # Get success rate
-        total_scans = len(history)
-        successful_scans = sum(1 for scan in history if scan['success'])
+        stats = barcode_history.get_scan_stats(user_id)
+        total_scans = stats['total_scans']
+        successful_scans = stats['successful_scans']
         success_rate = (successful_scans / total_scans * 100) if total_scans > 0 else 0
         
-        return jsonify({
+        return _orjson_response({
             "history": history,
+            "next_cursor": next_cursor,
             "stats": {
                 "total_scans": total_scans,
                 "successful_scans": successful_scans,
@@ -1970,12 +2320,10 @@ def get_barcode_history(user_id: int):
 def get_popular_barcodes():
     """Get most frequently scanned products"""
     try:
-        from app.barcode_scanner import barcode_history
-        
         limit = int(request.args.get('limit', 20))
         popular = barcode_history.get_popular_products(limit)
         
-        return jsonify({"popular_products": popular})
+        return _orjson_response({"popular_products": popular})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1985,11 +2333,7 @@ def get_popular_barcodes():
 def get_social_feed(user_id: int):
     """Get social feed for user (following + public posts)"""
     try:
-        from app.models import SharedFood, UserFollow, User
-        from sqlalchemy.orm import joinedload
-        from sqlalchemy import or_, desc
-        
-        db = next(get_db())
+        db = _request_db()
         limit = int(request.args.get('limit', 20))
         
         # Get users that this user follows
@@ -1997,12 +2341,37 @@ def get_social_feed(user_id: int):
         following_ids = [f.following_id for f in following_query.all()]
         following_ids.append(user_id)  # Include own posts
         
-        # Get shared foods from following + popular public posts
-        shared_foods = db.query(SharedFood).options(
-            joinedload(SharedFood.user),
-            joinedload(SharedFood.food),
-            joinedload(SharedFood.recipe)
-        ).filter(
+        include_recipe = 'recipe' in request.args.get('include', '').split(',')
+        
+        # Get shared foods from following + popular public posts, projecting only the columns we serialize
+        columns = [
+            SharedFood.id,
+            SharedFood.caption,
+            SharedFood.tags,
+            SharedFood.is_recipe,
+            SharedFood.likes_count,
+            SharedFood.comments_count,
+            SharedFood.created_at,
+            SharedFood.is_public,
+            User.id.label('user_id'),
+            User.username,
+            User.email,
+            Food.id.label('food_id'),
+            Food.name.label('food_name'),
+            Food.brand,
+            Food.calories,
+            Food.protein_g
+        ]
+        if include_recipe:
+            columns += [SharedFood.recipe_id, Recipe.name.label('recipe_name'), Recipe.servings]
+        
+        query = db.query(*columns).join(User, SharedFood.user_id == User.id).join(
+            Food, SharedFood.food_id == Food.id
+        )
+        if include_recipe:
+            query = query.outerjoin(Recipe, SharedFood.recipe_id == Recipe.id)
+        
+        rows = query.filter(
             or_(
                 SharedFood.user_id.in_(following_ids),  # From following
                 SharedFood.is_public == True  # Public posts
@@ -2010,29 +2379,36 @@ def get_social_feed(user_id: int):
         ).order_by(desc(SharedFood.created_at)).limit(limit).all()
         
         feed_items = []
-        for shared_food in shared_foods:
-            feed_items.append({
-                'id': shared_food.id,
+        for row in rows:
+            item = {
+                'id': row.id,
                 'user': {
-                    'id': shared_food.user.id,
-                    'username': shared_food.user.username,
-                    'email': shared_food.user.email
+                    'id': row.user_id,
+                    'username': row.username,
+                    'email': row.email
                 },
                 'food': {
-                    'id': shared_food.food.id,
-                    'name': shared_food.food.name,
-                    'brand': shared_food.food.brand,
-                    'calories': shared_food.food.calories,
-                    'protein_g': shared_food.food.protein_g
+                    'id': row.food_id,
+                    'name': row.food_name,
+                    'brand': row.brand,
+                    'calories': row.calories,
+                    'protein_g': row.protein_g
                 },
-                'caption': shared_food.caption,
-                'tags': shared_food.tags,
-                'is_recipe': shared_food.is_recipe,
-                'likes_count': shared_food.likes_count,
-                'comments_count': shared_food.comments_count,
-                'created_at': shared_food.created_at.isoformat(),
-                'is_public': shared_food.is_public
-            })
+                'caption': row.caption,
+                'tags': row.tags,
+                'is_recipe': row.is_recipe,
+                'likes_count': row.likes_count,
+                'comments_count': row.comments_count,
+                'created_at': row.created_at.isoformat(),
+                'is_public': row.is_public
+            }
+            if include_recipe:
+                item['recipe'] = {
+                    'id': row.recipe_id,
+                    'name': row.recipe_name,
+                    'servings': row.servings
+                } if row.recipe_id else None
+            feed_items.append(item)
         
         return jsonify({"feed": feed_items})
     except Exception as e:
@@ -2042,13 +2418,11 @@ def get_social_feed(user_id: int):
 def share_food():
     """Share a food or recipe to the community"""
     try:
-        from app.models import SharedFood, ActivityFeed
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         shared_food = SharedFood(
             user_id=data.get('user_id', 1),
@@ -2061,14 +2435,14 @@ def share_food():
         )
         
         db.add(shared_food)
-        db.commit()
-        db.refresh(shared_food)
+        db.flush()  # assigns shared_food.id; committed together with the activity
+        shared_food_id = shared_food.id
         
         # Add to activity feed
         activity = ActivityFeed(
             user_id=shared_food.user_id,
             activity_type='shared_food',
-            shared_food_id=shared_food.id,
+            shared_food_id=shared_food_id,
             activity_data={
                 'food_name': data.get('food_name', ''),
                 'caption': shared_food.caption[:100]  # Truncated for feed
@@ -2079,7 +2453,7 @@ def share_food():
         
         return jsonify({
             "message": "Food shared successfully",
-            "shared_food_id": shared_food.id
+            "shared_food_id": shared_food_id
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -2088,13 +2462,11 @@ def share_food():
 def like_shared_food():
     """Like or unlike a shared food"""
     try:
-        from app.models import SharedFoodLike, SharedFood
-        
         data = request.get_json()
         user_id = data.get('user_id', 1)
         shared_food_id = data['shared_food_id']
         
-        db = next(get_db())
+        db = _request_db()
         
         # Check if already liked
         existing_like = db.query(SharedFoodLike).filter(
@@ -2106,10 +2478,11 @@ def like_shared_food():
             # Unlike
             db.delete(existing_like)
             
-            # Decrease like count
-            shared_food = db.query(SharedFood).filter(SharedFood.id == shared_food_id).first()
-            if shared_food:
-                shared_food.likes_count = max(0, shared_food.likes_count - 1)
+            # Decrease like count (clamped at zero) in a single UPDATE
+            db.query(SharedFood).filter(SharedFood.id == shared_food_id).update(
+                {SharedFood.likes_count: case((SharedFood.likes_count > 0, SharedFood.likes_count - 1), else_=0)},
+                synchronize_session=False
+            )
             
             db.commit()
             return jsonify({"message": "Unliked", "liked": False})
@@ -2121,10 +2494,11 @@ def like_shared_food():
             )
             db.add(new_like)
             
-            # Increase like count
-            shared_food = db.query(SharedFood).filter(SharedFood.id == shared_food_id).first()
-            if shared_food:
-                shared_food.likes_count += 1
+            # Increase like count in a single UPDATE
+            db.query(SharedFood).filter(SharedFood.id == shared_food_id).update(
+                {SharedFood.likes_count: SharedFood.likes_count + 1},
+                synchronize_session=False
+            )
             
             db.commit()
             return jsonify({"message": "Liked", "liked": True})
@@ -2136,13 +2510,11 @@ def like_shared_food():
 def comment_on_shared_food():
     """Add a comment to a shared food"""
     try:
-        from app.models import SharedFoodComment, SharedFood
-        
         data = request.get_json()
         if not data or not data.get('content'):
             return jsonify({"error": "Comment content required"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         comment = SharedFoodComment(
             user_id=data.get('user_id', 1),
@@ -2152,10 +2524,11 @@ def comment_on_shared_food():
         
         db.add(comment)
         
-        # Increase comment count
-        shared_food = db.query(SharedFood).filter(SharedFood.id == data['shared_food_id']).first()
-        if shared_food:
-            shared_food.comments_count += 1
+        # Increase comment count in a single UPDATE
+        db.query(SharedFood).filter(SharedFood.id == data['shared_food_id']).update(
+            {SharedFood.comments_count: SharedFood.comments_count + 1},
+            synchronize_session=False
+        )
         
         db.commit()
         
@@ -2164,18 +2537,15 @@ def comment_on_shared_food():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/social/challenges", methods=["GET"])
+@cache.cached(timeout=60, key_prefix=CHALLENGES_CACHE_KEY, response_filter=_cache_ok)
 def get_challenges():
     """Get active community challenges"""
     try:
-        from app.models import Challenge, ChallengeParticipant
-        from sqlalchemy.orm import joinedload
-        from datetime import date
+        db = _request_db()
         
-        db = next(get_db())
-        
-        # Get active challenges
+        # Get active challenges; only the creator's username is serialized, so skip the wide User row
         challenges = db.query(Challenge).options(
-            joinedload(Challenge.creator)
+            joinedload(Challenge.creator).load_only(User.username)
         ).filter(
             Challenge.end_date >= date.today(),
             Challenge.is_public == True
@@ -2190,8 +2560,8 @@ def get_challenges():
                 'challenge_type': challenge.challenge_type,
                 'target_value': challenge.target_value,
                 'target_unit': challenge.target_unit,
-                'start_date': challenge.start_date.isoformat(),
-                'end_date': challenge.end_date.isoformat(),
+                'start_date': challenge.start_date,
+                'end_date': challenge.end_date,
                 'participants_count': challenge.participants_count,
                 'max_participants': challenge.max_participants,
                 'creator': {
@@ -2200,7 +2570,7 @@ def get_challenges():
                 'days_remaining': (challenge.end_date - date.today()).days
             })
         
-        return jsonify({"challenges": challenge_list})
+        return _orjson_response({"challenges": challenge_list})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -2208,42 +2578,49 @@ def get_challenges():
 def join_challenge():
     """Join a community challenge"""
     try:
-        from app.models import ChallengeParticipant, Challenge
-        
         data = request.get_json()
         user_id = data.get('user_id', 1)
         challenge_id = data['challenge_id']
         
-        db = next(get_db())
+        db = _request_db()
         
-        # Check if already participating
-        existing = db.query(ChallengeParticipant).filter(
-            ChallengeParticipant.user_id == user_id,
-            ChallengeParticipant.challenge_id == challenge_id
-        ).first()
-        
-        if existing:
-            return jsonify({"error": "Already participating in this challenge"}), 400
-        
-        # Check if challenge is full
-        challenge = db.query(Challenge).filter(Challenge.id == challenge_id).first()
-        if not challenge:
-            return jsonify({"error": "Challenge not found"}), 404
+        if engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
         
-        if challenge.max_participants and challenge.participants_count >= challenge.max_participants:
+        # Claim a slot first, atomically and only while the challenge exists and has room;
+        # the participant row is written only after that, so a missing challenge never hits the FK
+        updated = db.query(Challenge).filter(
+            Challenge.id == challenge_id,
+            or_(
+                Challenge.max_participants.is_(None),
+                Challenge.max_participants == 0,
+                Challenge.participants_count < Challenge.max_participants
+            )
+        ).update(
+            {Challenge.participants_count: Challenge.participants_count + 1},
+            synchronize_session=False
+        )
+        if updated == 0:
+            db.rollback()
+            if db.execute(select(Challenge.id).where(Challenge.id == challenge_id)).scalar_one_or_none() is None:
+                return jsonify({"error": "Challenge not found"}), 404
             return jsonify({"error": "Challenge is full"}), 400
         
-        # Join challenge
-        participant = ChallengeParticipant(
-            user_id=user_id,
-            challenge_id=challenge_id
+        # Join challenge; the unique (challenge_id, user_id) index catches repeat joins
+        joined = db.execute(
+            dialect_insert(ChallengeParticipant).values(
+                user_id=user_id,
+                challenge_id=challenge_id
+            ).on_conflict_do_nothing(index_elements=['challenge_id', 'user_id'])
         )
-        db.add(participant)
-        
-        # Update participant count
-        challenge.participants_count += 1
+        if joined.rowcount == 0:
+            db.rollback()  # also releases the slot claimed above
+            return jsonify({"error": "Already participating in this challenge"}), 400
         
         db.commit()
+        cache.delete(CHALLENGES_CACHE_KEY)  # participants_count changed
         
         return jsonify({"message": "Successfully joined challenge"})
     except Exception as e:
@@ -2253,8 +2630,6 @@ def join_challenge():
 def follow_user():
     """Follow or unfollow a user"""
     try:
-        from app.models import UserFollow
-        
         data = request.get_json()
         follower_id = data.get('follower_id', 1)
         following_id = data['following_id']
@@ -2262,13 +2637,15 @@ def follow_user():
         if follower_id == following_id:
             return jsonify({"error": "Cannot follow yourself"}), 400
         
-        db = next(get_db())
+        db = _request_db()
         
         # Check if already following
-        existing_follow = db.query(UserFollow).filter(
-            UserFollow.follower_id == follower_id,
-            UserFollow.following_id == following_id
-        ).first()
+        existing_follow = db.execute(
+            select(UserFollow).where(
+                UserFollow.follower_id == follower_id,
+                UserFollow.following_id == following_id
+            )
+        ).scalar_one_or_none()
         
         if existing_follow:
             # Unfollow
@@ -2289,30 +2666,30 @@ def follow_user():
         return jsonify({"error": str(e)}), 500
 
 @app.route("/social/users/search", methods=["GET"])
+@cache.cached(timeout=60, query_string=True, response_filter=_cache_ok)
 def search_users():
     """Search for users to follow"""
     try:
-        from app.models import User
-        
         query = request.args.get('q', '').strip()
         if not query:
-            return jsonify({"users": []})
+            return _orjson_response({"users": []})
         
-        db = next(get_db())
+        db = _request_db()
         
-        users = db.query(User).filter(
+        # Keyset pagination by id: pass the previous page's next_cursor as ?cursor=
+        limit = 10
+        after_id = request.args.get('cursor', type=int)
+        stmt = select(User.id, User.username, User.email).where(
             User.username.ilike(f"%{query}%")
-        ).limit(10).all()
-        
-        user_list = []
-        for user in users:
-            user_list.append({
-                'id': user.id,
-                'username': user.username,
-                'email': user.email
-            })
+        )
+        if after_id is not None:
+            stmt = stmt.where(User.id > after_id)
+        rows = db.execute(stmt.order_by(User.id).limit(limit)).mappings().all()
+        
+        user_list = [dict(row) for row in rows]
         
-        return jsonify({"users": user_list})
+        next_cursor = user_list[-1]['id'] if len(user_list) == limit else None
+        return _orjson_response({"users": user_list, "next_cursor": next_cursor})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1,7 +1,13 @@
 from typing import List, Optional
+from operator import mul
 from sqlalchemy.orm import Session
 from .models import Food
 
+# UPC-A weights for the 11 data digits
+_UPC_WEIGHTS = (3, 1, 3, 1, 3, 1, 3, 1, 3, 1, 3)
+# sum((b - 48) * w) == sum(b * w) - 48 * sum(w)
+_UPC_ASCII_OFFSET = 48 * sum(_UPC_WEIGHTS)
+
 def lookup_upc(db: Session, upc: str) -> List[Food]:
     """Lookup food by UPC code"""
     return db.query(Food).filter(Food.upc == upc).all()
@@ -39,6 +45,14 @@ def validate_upc(upc: str) -> bool:
     if not upc or len(upc) != 12:
         return False
     
+    if upc.isascii():
+        if not upc.isdigit():
+            return False
+        # Weighted sum straight over the ASCII bytes
+        raw = upc.encode()
+        check_sum = sum(map(mul, raw, _UPC_WEIGHTS)) - _UPC_ASCII_OFFSET
+        return (10 - (check_sum % 10)) % 10 == raw[11] - 48
+    
     try:
         digits = [int(d) for d in upc]
         # Simple check digit validation
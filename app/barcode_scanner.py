@@ -2,9 +2,60 @@
 Enhanced barcode scanning system with camera support and history tracking
 """
 import requests
-from typing import Optional, Dict, List
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Dict, List, Tuple
 import json
+import os
+import atexit
+import queue
+import threading
+import time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from operator import mul
+import numpy as np
+from sqlalchemy import create_engine, func, case, select, text, tuple_
+from app import shared_cache
+from app.db import session_scope, engine
+from app.models import BarcodeHistory
+
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, cache=True)
+    def _binarize(img, threshold):
+        out = np.empty_like(img)
+        for y in prange(img.shape[0]):
+            for x in range(img.shape[1]):
+                out[y, x] = 255 if img[y, x] > threshold else 0
+        return out
+except ImportError:
+    def _binarize(img, threshold):
+        return np.where(img > threshold, 255, 0).astype(np.uint8)
+
+# The SQLite engine shares one StaticPool connection across threads, so a commit from the history
+# writer would also commit whatever a request session had flushed; give the writer its own connection
+if engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+    _history_engine = create_engine(engine.url, connect_args={"check_same_thread": False, "timeout": 30})
+else:
+    _history_engine = engine
+
+# Queued after the last scan to stop the history writer
+_STOP_WRITER = object()
+
+# Shared pool for concurrent external lookups
+_lookup_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="barcode-lookup")
+# Seconds to wait on OpenFoodFacts before also asking UPC Item DB
+UPCITEMDB_HEDGE_DELAY = float(os.getenv("UPCITEMDB_HEDGE_DELAY", "0.5"))
+
+# Keep-alive HTTP session so repeat scans reuse TCP/TLS connections
+_http = requests.Session()
+_http.mount('https://', HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=(502, 503, 504))
+))
 
 class BarcodeAPI:
     """Enhanced barcode lookup using multiple APIs"""
@@ -24,13 +75,25 @@ class BarcodeAPI:
         ]
         
     def lookup_product(self, upc: str) -> Optional[Dict]:
-        """Lookup product by UPC using multiple APIs"""
-        
-        # Try OpenFoodFacts first (free, comprehensive)
+        """Lookup product by UPC using multiple APIs (shared across workers via the L2 cache)"""
+        return shared_cache.cached(f"off:upc:{upc}", lambda: self._lookup_upstream(upc))
+    
+    def _lookup_upstream(self, upc: str) -> Optional[Dict]:
+        # OpenFoodFacts first (free, comprehensive). UPC Item DB's trial quota is rate limited, so it is
+        # only asked when OpenFoodFacts misses, or in parallel once OpenFoodFacts is slower than the hedge delay
+        off = _lookup_pool.submit(self._fetch_openfoodfacts, upc)
         try:
-            response = requests.get(
+            product = off.result(timeout=UPCITEMDB_HEDGE_DELAY)
+        except FuturesTimeout:
+            fallback = _lookup_pool.submit(self._fetch_upcitemdb, upc)
+            return off.result() or fallback.result()
+        return product or self._fetch_upcitemdb(upc)
+    
+    def _fetch_openfoodfacts(self, upc: str) -> Optional[Dict]:
+        try:
+            response = _http.get(
                 f'https://world.openfoodfacts.org/api/v0/product/{upc}.json',
-                timeout=10
+                timeout=3
             )
             if response.status_code == 200:
                 data = response.json()
@@ -38,13 +101,14 @@ class BarcodeAPI:
                     return self._parse_openfoodfacts(data)
         except Exception as e:
             print(f"OpenFoodFacts API error: {e}")
-        
-        # Fallback to UPC Item DB (if available)
+        return None
+    
+    def _fetch_upcitemdb(self, upc: str) -> Optional[Dict]:
         try:
-            response = requests.get(
+            response = _http.get(
                 'https://api.upcitemdb.com/prod/trial/lookup',
                 params={'upc': upc},
-                timeout=10
+                timeout=3
             )
             if response.status_code == 200:
                 data = response.json()
@@ -52,7 +116,6 @@ class BarcodeAPI:
                     return self._parse_upcitemdb(data)
         except Exception as e:
             print(f"UPCItemDB API error: {e}")
-            
         return None
         
     def _parse_openfoodfacts(self, data: Dict) -> Dict:
@@ -106,148 +169,270 @@ class BarcodeAPI:
 class BarcodeHistoryManager:
     """Manages barcode scan history and analytics"""
     
+    # Background writer batching: flush every BATCH_SIZE rows or BATCH_INTERVAL seconds
+    BATCH_SIZE = 100
+    BATCH_INTERVAL = 0.5
+    # Seconds between popular_products materialized view refreshes
+    POPULAR_REFRESH_INTERVAL = int(os.getenv("POPULAR_REFRESH_INTERVAL", "900"))
+    
     def __init__(self):
         self.scan_cache = {}
+        self._queue = queue.Queue(maxsize=10000)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._refresher = None
         
     def record_scan(self, upc: str, success: bool, product_data: Optional[Dict] = None, user_id: int = 1):
-        """Record a barcode scan attempt"""
-        from app.models import BarcodeHistory
-        from app.db import get_db
+        """Record a barcode scan attempt (written to the database in the background)"""
+        row = {
+            'user_id': user_id,
+            'upc': upc,
+            'success': success,
+            'product_name': product_data.get('name') if product_data else None,
+            'brand': product_data.get('brand') if product_data else None,
+            'source': product_data.get('source') if product_data else None,
+            'scanned_at': datetime.utcnow()
+        }
         
+        self._ensure_writer()
         try:
-            db = next(get_db())
-            
-            history = BarcodeHistory(
-                user_id=user_id,
-                upc=upc,
-                success=success,
-                product_name=product_data.get('name') if product_data else None,
-                brand=product_data.get('brand') if product_data else None,
-                source=product_data.get('source') if product_data else None
-            )
-            db.add(history)
-            db.commit()
-            
-            # Cache successful scans
-            if success and product_data:
-                self.scan_cache[upc] = product_data
-                
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # Writer is falling behind; write this one inline rather than drop it
+            self._write_rows([row])
+        
+        # Cache successful scans
+        if success and product_data:
+            self.scan_cache[upc] = product_data
+    
+    def flush(self):
+        """Stop the writer, then write any scans still queued (called at interpreter exit)"""
+        writer = self._writer
+        if writer is not None and writer.is_alive():
+            # The writer finishes the batch it already dequeued before exiting
+            self._queue.put(_STOP_WRITER)
+            writer.join(timeout=5)
+        rows = []
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if row is not _STOP_WRITER:
+                rows.append(row)
+        if rows:
+            self._write_rows(rows)
+    
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._drain_loop, name="barcode-history-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+    
+    def _drain_loop(self):
+        while True:
+            row = self._queue.get()
+            if row is _STOP_WRITER:
+                return
+            rows = [row]
+            stopping = False
+            deadline = time.monotonic() + self.BATCH_INTERVAL
+            while len(rows) < self.BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if row is _STOP_WRITER:
+                    stopping = True
+                    break
+                rows.append(row)
+            self._write_rows(rows)
+            if stopping:
+                return
+    
+    def _write_rows(self, rows: List[Dict]):
+        """Insert scan rows with one executemany and a single commit (on the writer's own connection)"""
+        try:
+            with _history_engine.begin() as conn:
+                conn.execute(BarcodeHistory.__table__.insert(), rows)
         except Exception as e:
             print(f"Error recording scan history: {e}")
             
-    def get_scan_history(self, user_id: int = 1, limit: int = 50) -> List[Dict]:
-        """Get recent barcode scan history"""
-        from app.models import BarcodeHistory
-        from app.db import get_db
-        
+    def get_scan_history(self, user_id: int = 1, limit: int = 50,
+                         before: Optional[Tuple[datetime, int]] = None) -> List[Dict]:
+        """
+        Get recent barcode scan history, newest first.
+        Pass before=(scanned_at, id) of the last row seen to get the next page (keyset pagination).
+        """
         try:
-            db = next(get_db())
-            
-            history = db.query(BarcodeHistory).filter(
-                BarcodeHistory.user_id == user_id
-            ).order_by(
-                BarcodeHistory.scanned_at.desc()
-            ).limit(limit).all()
+            with session_scope() as db:
+                query = db.query(BarcodeHistory).filter(
+                    BarcodeHistory.user_id == user_id
+                )
+                if before is not None:
+                    query = query.filter(tuple_(BarcodeHistory.scanned_at, BarcodeHistory.id) < before)
+                history = query.order_by(
+                    BarcodeHistory.scanned_at.desc(),
+                    BarcodeHistory.id.desc()
+                ).limit(limit).all()
             
-            return [
-                {
-                    'upc': h.upc,
-                    'product_name': h.product_name,
-                    'brand': h.brand,
-                    'success': h.success,
-                    'source': h.source,
-                    'scanned_at': h.scanned_at.isoformat()
-                }
-                for h in history
-            ]
+                return [
+                    {
+                        'id': h.id,
+                        'upc': h.upc,
+                        'product_name': h.product_name,
+                        'brand': h.brand,
+                        'success': h.success,
+                        'source': h.source,
+                        'scanned_at': h.scanned_at.isoformat()
+                    }
+                    for h in history
+                ]
         except Exception as e:
             print(f"Error getting scan history: {e}")
             return []
+    
+    def get_scan_stats(self, user_id: int = 1) -> Dict:
+        """Get scan totals for a user, aggregated in the database"""
+        try:
+            with session_scope() as db:
+                total, successful = db.query(
+                    func.count(BarcodeHistory.id),
+                    func.sum(case((BarcodeHistory.success == True, 1), else_=0))
+                ).filter(
+                    BarcodeHistory.user_id == user_id
+                ).one()
+            
+                return {'total_scans': total or 0, 'successful_scans': successful or 0}
+        except Exception as e:
+            print(f"Error getting scan stats: {e}")
+            return {'total_scans': 0, 'successful_scans': 0}
         
     def get_popular_products(self, limit: int = 20) -> List[Dict]:
         """Get most frequently scanned products"""
-        from app.models import BarcodeHistory
-        from app.db import get_db
-        from sqlalchemy import func
+        if engine.dialect.name == "postgresql":
+            # Pre-aggregated snapshot, refreshed by start_popular_refresher(); fall back to a live GROUP BY
+            try:
+                with session_scope() as db:
+                    return [dict(row) for row in db.execute(
+                        text("SELECT upc, product_name, brand, scan_count FROM popular_products "
+                             "ORDER BY scan_count DESC LIMIT :limit"),
+                        {'limit': limit}
+                    ).mappings()]
+            except Exception as e:
+                print(f"popular_products view unavailable, aggregating live: {e}")
+        
+        # Group by UPC only; name/brand can vary between sources, so take one representative value
+        scan_count = func.count(BarcodeHistory.upc)
+        stmt = select(
+            BarcodeHistory.upc,
+            func.max(BarcodeHistory.product_name).label('product_name'),
+            func.max(BarcodeHistory.brand).label('brand'),
+            scan_count.label('scan_count')
+        ).where(
+            BarcodeHistory.success == True  # matches the ix_bh_success_upc partial index
+        ).group_by(
+            BarcodeHistory.upc
+        ).order_by(
+            scan_count.desc()
+        ).limit(limit)
         
         try:
-            db = next(get_db())
-            
-            popular = db.query(
-                BarcodeHistory.upc,
-                BarcodeHistory.product_name,
-                BarcodeHistory.brand,
-                func.count(BarcodeHistory.upc).label('scan_count')
-            ).filter(
-                BarcodeHistory.success == True
-            ).group_by(
-                BarcodeHistory.upc
-            ).order_by(
-                func.count(BarcodeHistory.upc).desc()
-            ).limit(limit).all()
-            
-            return [
-                {
-                    'upc': p.upc,
-                    'product_name': p.product_name,
-                    'brand': p.brand,
-                    'scan_count': p.scan_count
-                }
-                for p in popular
-            ]
+            with session_scope() as db:
+                return [dict(row) for row in db.execute(stmt).mappings()]
         except Exception as e:
             print(f"Error getting popular products: {e}")
             return []
 
+    def start_popular_refresher(self):
+        """Refresh the popular_products materialized view every POPULAR_REFRESH_INTERVAL seconds (Postgres only)"""
+        if engine.dialect.name != "postgresql" or self._refresher is not None:
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="popular-products-refresh", daemon=True)
+        self._refresher.start()
+    
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.POPULAR_REFRESH_INTERVAL)
+            try:
+                with engine.begin() as conn:
+                    # Only one worker refreshes per interval; the others skip
+                    if conn.execute(text("SELECT pg_try_advisory_xact_lock(hashtext('popular_products'))")).scalar():
+                        conn.execute(text("REFRESH MATERIALIZED VIEW CONCURRENTLY popular_products"))
+            except Exception as e:
+                print(f"Error refreshing popular_products: {e}")
+
 # Global instances
 barcode_api = BarcodeAPI()
 barcode_history = BarcodeHistoryManager()
 
+# Supported lengths: UPC-A (12 digits) and EAN-13 (13 digits)
+_UPC_LENGTHS = frozenset((12, 13))
+# Check-digit weights, read right-to-left starting next to the check digit
+_UPC_WEIGHTS = (3, 1) * 6
+# sum((b - 48) * w) == sum(b * w) - 48 * sum(w), so the ASCII offset is folded in once per length
+_UPC_ASCII_OFFSET = {n: 48 * sum(_UPC_WEIGHTS[:n - 1]) for n in _UPC_LENGTHS}
+
 def validate_upc(upc: str) -> bool:
     """Enhanced UPC validation"""
     if not upc:
         return False
         
     # Remove any non-digit characters
-    upc = ''.join(filter(str.isdigit, upc))
+    if not upc.isdigit():
+        upc = ''.join(filter(str.isdigit, upc))
     
-    # Support both UPC-A (12 digits) and EAN-13 (13 digits)
-    if len(upc) not in [12, 13]:
+    if len(upc) not in _UPC_LENGTHS:
         return False
     
+    if upc.isascii():
+        # Weighted sum straight over the ASCII bytes, no per-digit int() calls
+        raw = upc.encode()
+        check_sum = sum(map(mul, raw[-2::-1], _UPC_WEIGHTS)) - _UPC_ASCII_OFFSET[len(raw)]
+        return (10 - check_sum % 10) % 10 == raw[-1] - 48
+    
     try:
-        digits = [int(d) for d in upc]
-        
-        if len(upc) == 12:  # UPC-A
-            check_sum = sum(digits[i] * (3 if i % 2 == 0 else 1) for i in range(11))
-            check_digit = (10 - (check_sum % 10)) % 10
-            return check_digit == digits[11]
-        else:  # EAN-13
-            check_sum = sum(digits[i] * (1 if i % 2 == 0 else 3) for i in range(12))
-            check_digit = (10 - (check_sum % 10)) % 10
-            return check_digit == digits[12]
-            
-    except (ValueError, IndexError):
+        check_sum = sum(int(d) * w for d, w in zip(upc[-2::-1], _UPC_WEIGHTS))
+        return (10 - check_sum % 10) % 10 == int(upc[-1])
+    except ValueError:
         return False
 
-def decode_barcode_image(image_data: bytes) -> Optional[str]:
+# pyzbar symbol types that can carry a UPC-A / EAN-13 code
+_UPC_SYMBOL_TYPES = frozenset(('EAN13', 'UPCA'))
+
+def decode_barcode_image(image_data) -> Optional[str]:
     """
-    Decode barcode from image data using pyzbar
+    Decode barcode from image data using pyzbar.
+    Accepts bytes, a bytes-like object (e.g. memoryview) or a binary file stream.
     """
     try:
         from pyzbar.pyzbar import decode
         from PIL import Image
         import io
         
-        # Convert bytes to PIL Image
-        image = Image.open(io.BytesIO(image_data))
+        # Convert to a grayscale PIL Image, reading streams in place.
+        # draft() lets libjpeg decode straight to luminance (and downscale oversized photos).
+        source = image_data if hasattr(image_data, 'read') else io.BytesIO(image_data)
+        image = Image.open(source)
+        image.draft('L', (1600, 1600))
+        image = image.convert('L')
         
-        # Decode barcodes
-        decoded_objects = decode(image)
-        
-        if decoded_objects:
+        # Decode barcodes; retry on a thresholded copy for low-contrast photos
+        for attempt in range(2):
+            if attempt == 1:
+                pixels = np.asarray(image, dtype=np.uint8)
+                image = Image.fromarray(_binarize(pixels, pixels.mean()))
+            
             # Return the first valid barcode found
-            for obj in decoded_objects:
+            for obj in decode(image):
+                if obj.type not in _UPC_SYMBOL_TYPES:
+                    continue
                 barcode_data = obj.data.decode('utf-8')
                 if validate_upc(barcode_data):
                     return barcode_data
@@ -1,12 +1,16 @@
 import os
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from sqlalchemy.pool import StaticPool
+import zlib
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import StaticPool, QueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///micros.db")
+# Compiled-statement cache entries (SQLAlchemy default is 500); the app has more distinct hot statements than that
+QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))
 
 # Create engine
 if DATABASE_URL.startswith("sqlite"):
@@ -14,9 +18,18 @@ if DATABASE_URL.startswith("sqlite"):
         DATABASE_URL,
         connect_args={"check_same_thread": False},
         poolclass=StaticPool,
+        query_cache_size=QUERY_CACHE_SIZE,
     )
 else:
-    engine = create_engine(DATABASE_URL)
+    engine = create_engine(
+        DATABASE_URL,
+        poolclass=QueuePool,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        pool_pre_ping=True,  # drop connections the server closed while idle
+        pool_recycle=3600,
+        query_cache_size=QUERY_CACHE_SIZE,
+    )
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -24,6 +37,20 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 # Create base class for models
 Base = declarative_base()
 
+def run_after_commit(session: Session, callback):
+    """Call callback() once session's current transaction commits (dropped if it rolls back).
+    For in-process caches: clearing them at flush lets concurrent readers refill from the old rows."""
+    session.info.setdefault("after_commit", []).append(callback)
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_callbacks(session):
+    for callback in session.info.pop("after_commit", ()):
+        callback()
+
+@event.listens_for(Session, "after_rollback")
+def _drop_after_commit_callbacks(session):
+    session.info.pop("after_commit", None)
+
 def get_db():
     """Get database session"""
     db = SessionLocal()
@@ -32,6 +59,33 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def session_scope():
+    """Session for code outside a request handler; always closed on exit"""
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _schema_version():
+    """Fingerprint of the mapped tables and columns; changes whenever a model does"""
+    shape = ";".join(
+        f"{table.name}:{','.join(column.name for column in table.columns)}"
+        for table in Base.metadata.sorted_tables
+    )
+    return zlib.crc32(shape.encode()) & 0x7FFFFFFF  # user_version is a signed 32-bit int
+
 def create_tables():
     """Create all tables if they don't exist"""
+    if engine.dialect.name != "sqlite":
+        Base.metadata.create_all(bind=engine)
+        return
+    # SQLite: skip create_all's per-table existence checks when the file already matches the models
+    version = _schema_version()
+    with engine.connect() as conn:
+        if conn.exec_driver_sql("PRAGMA user_version").scalar() == version:
+            return
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {version}")
@@ -2,19 +2,92 @@
 USDA FoodData Central API integration for comprehensive food database access.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from app import shared_cache
 
 load_dotenv()
 
+# Map USDA nutrient IDs to our field names
+# Common nutrient IDs from USDA database
+NUTRIENT_ID_MAP = {
+    1008: 'calories',           # Energy (kcal)
+    1003: 'protein_g',          # Protein
+    1004: 'fat_g',              # Total lipid (fat)
+    1005: 'carbs_g',            # Carbohydrate, by difference
+    1106: 'vitamin_a_rae',      # Vitamin A, RAE
+    1162: 'vitamin_c_mg',       # Vitamin C, total ascorbic acid
+    1114: 'vitamin_d_iu',       # Vitamin D (D2 + D3), International Units
+    1109: 'vitamin_e_mg',       # Vitamin E (alpha-tocopherol)
+    1185: 'vitamin_k_mcg',      # Vitamin K (phylloquinone)
+    1087: 'calcium_mg',         # Calcium, Ca
+    1089: 'iron_mg',            # Iron, Fe
+    1090: 'magnesium_mg',       # Magnesium, Mg
+    1095: 'zinc_mg',            # Zinc, Zn
+    1092: 'potassium_mg',       # Potassium, K
+    1093: 'sodium_mg',          # Sodium, Na
+}
+
+# Shared stand-in for a missing 'nutrient' sub-dict (read-only)
+_EMPTY: Dict = {}
+
+# Name-based mapping for extended micronutrients (fallback when IDs vary/missing)
+NUTRIENT_NAME_MAP = {
+    'vitamin a, rae': ('vitamin_a_rae', 'mcg'),
+    'vitamin c, total ascorbic acid': ('vitamin_c_mg', 'mg'),
+    'vitamin d (d2 + d3), iu': ('vitamin_d_iu', 'iu'),
+    'vitamin e (alpha-tocopherol)': ('vitamin_e_mg', 'mg'),
+    'vitamin k (phylloquinone)': ('vitamin_k_mcg', 'mcg'),
+    'thiamin': ('vitamin_b1_mg', 'mg'),
+    'riboflavin': ('vitamin_b2_mg', 'mg'),
+    'niacin': ('vitamin_b3_mg', 'mg'),
+    'pantothenic acid': ('vitamin_b5_mg', 'mg'),
+    'vitamin b-6': ('vitamin_b6_mg', 'mg'),
+    'biotin': ('vitamin_b7_mcg', 'mcg'),
+    'folate, total': ('vitamin_b9_mcg', 'mcg'),
+    'vitamin b-12': ('vitamin_b12_mcg', 'mcg'),
+    'choline, total': ('choline_mg', 'mg'),
+    'phosphorus, p': ('phosphorus_mg', 'mg'),
+    'copper, cu': ('copper_mg', 'mg'),
+    'manganese, mn': ('manganese_mg', 'mg'),
+    'iodine, i': ('iodine_mcg', 'mcg'),
+    'selenium, se': ('selenium_mcg', 'mcg'),
+    'chromium, cr': ('chromium_mcg', 'mcg'),
+    'molybdenum, mo': ('molybdenum_mcg', 'mcg'),
+    'fluoride, f': ('fluoride_mg', 'mg'),
+    # Chloride and sulfur often absent; leave if not present
+    'chloride, cl': ('chloride_mg', 'mg'),
+    'sulfur, s': ('sulfur_mg', 'mg'),
+}
+
+# Keep-alive session for FoodData Central; retries rate limits (429, honoring Retry-After) and 5xx
+_http = requests.Session()
+_http.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(429, 500, 502, 503, 504))
+))
+
 class USDAFoodAPI:
     def __init__(self):
         self.api_key = os.getenv('USDA_API_KEY', 'DEMO_KEY')
         self.base_url = 'https://api.nal.usda.gov/fdc/v1'
-        # Simple in-memory cache to reduce API calls
-        self._search_cache = {}
-        self._detail_cache = {}
+        # Bounded in-memory caches to reduce API calls (guarded by _cache_lock)
+        self._search_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._detail_cache = TTLCache(maxsize=1024, ttl=3600)
+        self._normalized_cache = TTLCache(maxsize=4096, ttl=3600)
+        self._cache_lock = threading.Lock()
+        # Detail fetches for search enrichment run concurrently (I/O-bound)
+        self._detail_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="usda-detail")
+        # Separate pool for fan-out searches, which themselves wait on the detail pool
+        self._search_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="usda-search")
         
     def search_foods(self, query: str, page_size: int = 50, data_type: str = None) -> Dict:
         """
@@ -48,37 +121,68 @@ class USDAFoodAPI:
             
         # Check cache first
         cache_key = f"{query}_{page_size}_{data_type}"
-        if cache_key in self._search_cache:
-            return self._search_cache[cache_key]
+        with self._cache_lock:
+            cached = self._search_cache.get(cache_key)
+        if cached is not None:
+            return cached
             
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            
-            # For foods with limited data, try to get detailed info
-            if 'foods' in result:
-                enriched_foods = []
-                for food in result['foods'][:30]:  # Limit to first 30 for better variety
-                    # If this food has minimal nutrients, try to get detailed info
-                    if len(food.get('foodNutrients', [])) < 5:
-                        detailed_food = self.get_food_details(food.get('fdcId'))
-                        if detailed_food and len(detailed_food.get('foodNutrients', [])) > len(food.get('foodNutrients', [])):
-                            enriched_foods.append(detailed_food)
-                        else:
-                            enriched_foods.append(food)
-                    else:
-                        enriched_foods.append(food)
-                
-                result['foods'] = enriched_foods
+            digest = hashlib.sha1(cache_key.encode()).hexdigest()
+            result = shared_cache.cached(
+                f"usda:search:{digest}",
+                lambda: self._fetch_search(url, params),
+                is_empty=lambda r: not r.get('foods')
+            )
             
             # Cache the result
-            self._search_cache[cache_key] = result
+            with self._cache_lock:
+                self._search_cache[cache_key] = result
             return result
         except requests.RequestException as e:
             print(f"Error searching USDA API: {e}")
             return {'foods': []}
     
+    def _fetch_search(self, url: str, params: Dict) -> Dict:
+        """Run the upstream search and enrich sparse results; raises requests.RequestException."""
+        response = _http.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        result = response.json()
+        
+        # For foods with limited data, try to get detailed info
+        if 'foods' in result:
+            foods = result['foods'][:30]  # Limit to first 30 for better variety
+            
+            # If a food has minimal nutrients, fetch detailed info (all such fetches in parallel)
+            sparse = [f for f in foods if len(f.get('foodNutrients', [])) < 5]
+            details = dict(zip(
+                (id(f) for f in sparse),
+                self._detail_pool.map(lambda f: self.get_food_details(f.get('fdcId')), sparse)
+            ))
+            
+            enriched_foods = []
+            for food in foods:
+                detailed_food = details.get(id(food))
+                if detailed_food and len(detailed_food.get('foodNutrients', [])) > len(food.get('foodNutrients', [])):
+                    enriched_foods.append(detailed_food)
+                else:
+                    enriched_foods.append(food)
+            
+            result['foods'] = enriched_foods
+        
+        return result
+    
+    def search_foods_by_types(self, query: str, data_types: List[str], page_size: int = 50) -> List[Dict]:
+        """
+        Run search_foods once per data type concurrently
+        
+        Returns:
+            List of search results, in the same order as data_types
+        """
+        return list(self._search_pool.map(
+            lambda dtype: self.search_foods(query, page_size=page_size, data_type=dtype),
+            data_types
+        ))
+    
     def get_food_details(self, fdc_id: int) -> Optional[Dict]:
         """
         Get detailed information for a specific food by FDC ID
@@ -92,48 +196,31 @@ class USDAFoodAPI:
         url = f"{self.base_url}/food/{fdc_id}"
         
         # Check cache first
-        if fdc_id in self._detail_cache:
-            return self._detail_cache[fdc_id]
+        with self._cache_lock:
+            cached = self._detail_cache.get(fdc_id)
+        if cached is not None:
+            return cached
             
         params = {
             'api_key': self.api_key
         }
         
-        try:
-            response = requests.get(url, params=params, timeout=10)
+        def fetch():
+            response = _http.get(url, params=params, timeout=10)
             response.raise_for_status()
-            result = response.json()
+            return response.json()
+        
+        try:
+            result = shared_cache.cached(f"usda:food:{fdc_id}", fetch)
             
             # Cache the result
-            self._detail_cache[fdc_id] = result
+            with self._cache_lock:
+                self._detail_cache[fdc_id] = result
             return result
         except requests.RequestException as e:
             print(f"Error getting food details from USDA API: {e}")
             return None
     
-    def _read_nutrient_value(self, item: Dict) -> (float, str, str):
-        """Extract (value, unit, name) from a foodNutrients entry in both search and detail responses."""
-        # Search results usually: nutrientId, nutrientName?, value, unitName
-        # Detail results: nutrient: { id, name, unitName }, amount/value
-        name = (
-            (item.get('nutrient') or {}).get('name')
-            or item.get('nutrientName')
-            or ''
-        )
-        unit = (
-            (item.get('nutrient') or {}).get('unitName')
-            or item.get('unitName')
-            or ''
-        )
-        value = item.get('amount')
-        if value is None:
-            value = item.get('value')
-        try:
-            value = float(value or 0)
-        except Exception:
-            value = 0.0
-        return value, unit, name
-
     def _convert_unit(self, value: float, unit: str, target: str, nutrient_name: str = '') -> float:
         """Convert USDA unit to target (mg/mcg/IU). IU is returned as-is. Handles µg/mcg synonyms."""
         if value is None:
@@ -174,23 +261,49 @@ class USDAFoodAPI:
         Returns:
             Dict in our internal food format
         """
+        # Search and detail payloads for the same fdcId differ, so the nutrient count is part of the key.
+        # Callers mutate the result, so always hand out a copy.
+        fdc_id = usda_food.get('fdcId')
+        cache_key = (fdc_id, usda_food.get('dataType'), len(usda_food.get('foodNutrients') or ()))
+        if fdc_id is not None:
+            with self._cache_lock:
+                cached = self._normalized_cache.get(cache_key)
+            if cached is not None:
+                return dict(cached)
+        
+        normalized = self._normalize_food_data(usda_food)
+        if fdc_id is not None:
+            with self._cache_lock:
+                self._normalized_cache[cache_key] = normalized
+        return dict(normalized)
+    
+    def _normalize_food_data(self, usda_food: Dict) -> Dict:
         # Extract nutrients into a dict for easy lookup
         nutrients_by_id: Dict[int, float] = {}
         nutrients_by_name: Dict[str, Dict[str, float]] = {}
-        if 'foodNutrients' in usda_food:
-            for nutrient in usda_food['foodNutrients']:
-                nid = nutrient.get('nutrientId')
-                value, unit, name = self._read_nutrient_value(nutrient)
-                if nid is not None:
-                    try:
-                        nutrients_by_id[int(nid)] = value
-                    except Exception:
-                        pass
-                if name:
-                    nutrients_by_name[name.lower()] = {
-                        'value': value,
-                        'unit': unit
-                    }
+        # Search results usually: nutrientId, nutrientName?, value, unitName
+        # Detail results: nutrient: { id, name, unitName }, amount/value
+        for item in usda_food.get('foodNutrients') or ():
+            nut = item.get('nutrient') or _EMPTY
+            value = item.get('amount')
+            if value is None:
+                value = item.get('value')
+            try:
+                value = float(value or 0)
+            except Exception:
+                value = 0.0
+            nid = item.get('nutrientId')
+            if nid is not None:
+                try:
+                    nutrients_by_id[int(nid)] = value
+                except Exception:
+                    pass
+            name = nut.get('name') or item.get('nutrientName')
+            if name:
+                nutrients_by_name[name.lower()] = {
+                    'value': value,
+                    'unit': nut.get('unitName') or item.get('unitName') or ''
+                }
                     
         # If we don't have basic nutrients, try to extract from other fields
         if not nutrients_by_id and 'labelNutrients' in usda_food:
@@ -205,55 +318,6 @@ class USDAFoodAPI:
             if 'carbohydrates' in label_nutrients:
                 nutrients_by_id[1005] = float(label_nutrients['carbohydrates'].get('value', 0))
         
-        # Map USDA nutrient IDs to our field names
-        # Common nutrient IDs from USDA database
-        nutrient_mapping = {
-            1008: 'calories',           # Energy (kcal)
-            1003: 'protein_g',          # Protein
-            1004: 'fat_g',              # Total lipid (fat)
-            1005: 'carbs_g',            # Carbohydrate, by difference
-            1106: 'vitamin_a_rae',      # Vitamin A, RAE
-            1162: 'vitamin_c_mg',       # Vitamin C, total ascorbic acid
-            1114: 'vitamin_d_iu',       # Vitamin D (D2 + D3), International Units
-            1109: 'vitamin_e_mg',       # Vitamin E (alpha-tocopherol)
-            1185: 'vitamin_k_mcg',      # Vitamin K (phylloquinone)
-            1087: 'calcium_mg',         # Calcium, Ca
-            1089: 'iron_mg',            # Iron, Fe
-            1090: 'magnesium_mg',       # Magnesium, Mg
-            1095: 'zinc_mg',            # Zinc, Zn
-            1092: 'potassium_mg',       # Potassium, K
-            1093: 'sodium_mg',          # Sodium, Na
-        }
-
-        # Name-based mapping for extended micronutrients (fallback when IDs vary/missing)
-        name_map = {
-            'vitamin a, rae': ('vitamin_a_rae', 'mcg'),
-            'vitamin c, total ascorbic acid': ('vitamin_c_mg', 'mg'),
-            'vitamin d (d2 + d3), iu': ('vitamin_d_iu', 'iu'),
-            'vitamin e (alpha-tocopherol)': ('vitamin_e_mg', 'mg'),
-            'vitamin k (phylloquinone)': ('vitamin_k_mcg', 'mcg'),
-            'thiamin': ('vitamin_b1_mg', 'mg'),
-            'riboflavin': ('vitamin_b2_mg', 'mg'),
-            'niacin': ('vitamin_b3_mg', 'mg'),
-            'pantothenic acid': ('vitamin_b5_mg', 'mg'),
-            'vitamin b-6': ('vitamin_b6_mg', 'mg'),
-            'biotin': ('vitamin_b7_mcg', 'mcg'),
-            'folate, total': ('vitamin_b9_mcg', 'mcg'),
-            'vitamin b-12': ('vitamin_b12_mcg', 'mcg'),
-            'choline, total': ('choline_mg', 'mg'),
-            'phosphorus, p': ('phosphorus_mg', 'mg'),
-            'copper, cu': ('copper_mg', 'mg'),
-            'manganese, mn': ('manganese_mg', 'mg'),
-            'iodine, i': ('iodine_mcg', 'mcg'),
-            'selenium, se': ('selenium_mcg', 'mcg'),
-            'chromium, cr': ('chromium_mcg', 'mcg'),
-            'molybdenum, mo': ('molybdenum_mcg', 'mcg'),
-            'fluoride, f': ('fluoride_mg', 'mg'),
-            # Chloride and sulfur often absent; leave if not present
-            'chloride, cl': ('chloride_mg', 'mg'),
-            'sulfur, s': ('sulfur_mg', 'mg'),
-        }
-        
         # Build our normalized food object
         normalized = {
             'id': usda_food.get('fdcId'),
@@ -266,29 +330,27 @@ class USDAFoodAPI:
             'image_url': '',
         }
         
-        # Add all nutrients with default values
-        for nutrient_id, field_name in nutrient_mapping.items():
-            normalized[field_name] = nutrients_by_id.get(nutrient_id, 0)
-
-        # Fill extended micronutrients by name if present
+        # Add all nutrients with default values, counting the non-zero ones as we go
         completeness = 0
-        for key, val in normalized.items():
-            if key in ('id', 'name', 'brand', 'upc', 'data_type', 'publication_date'):
-                continue
-            if isinstance(val, (int, float)) and val:
+        for nutrient_id, field_name in NUTRIENT_ID_MAP.items():
+            val = nutrients_by_id.get(nutrient_id, 0)
+            normalized[field_name] = val
+            if val:
                 completeness += 1
 
-        for lname, (field, target_unit) in name_map.items():
+        # Fill extended micronutrients by name if present
+        for lname, (field, target_unit) in NUTRIENT_NAME_MAP.items():
             if field in normalized and normalized.get(field, 0):
                 continue
-            # find nutrient by name match
-            for n_name, data in nutrients_by_name.items():
-                if lname in n_name:
-                    val = self._convert_unit(data['value'], data['unit'], target_unit, lname)
-                    normalized[field] = val
-                    if val:
-                        completeness += 1
-                    break
+            # find nutrient by name: exact match is a dict hit, otherwise fall back to a substring scan
+            data = nutrients_by_name.get(lname)
+            if data is None:
+                data = next((d for n_name, d in nutrients_by_name.items() if lname in n_name), None)
+            if data is not None:
+                val = self._convert_unit(data['value'], data['unit'], target_unit, lname)
+                normalized[field] = val
+                if val:
+                    completeness += 1
 
         normalized['completeness_score'] = completeness
             
@@ -1 +1,62 @@
 # Food data source loaders
+import hashlib
+from typing import Any, Callable, Dict, Iterable, Iterator, List
+
+import requests
+import urllib3
+
+try:
+    import orjson
+    loads_json = orjson.loads
+except ImportError:  # stdlib fallback
+    import json
+    loads_json = json.loads
+
+# Bodies larger than this (or of unknown size) are parsed straight off the socket
+STREAM_PARSE_THRESHOLD = 256 * 1024
+
+try:
+    import xxhash
+
+    def _digest64(data: bytes) -> int:
+        return xxhash.xxh64_intdigest(data)
+except ImportError:
+    def _digest64(data: bytes) -> int:
+        return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "big")
+
+
+def stable_food_id(key: str) -> int:
+    """Negative placeholder id for an external food, stable across processes (unlike hash())."""
+    return -(_digest64(str(key).encode()) % 10_000_000)
+
+
+def read_json(response):
+    """
+    Parse a requests response opened with stream=True.
+    Large or unsized bodies are read from r.raw in one call, skipping Response.content's chunk
+    accumulation; small ones use the normal path.
+    """
+    length = response.headers.get("Content-Length")
+    if length is None or int(length) > STREAM_PARSE_THRESHOLD:
+        try:
+            body = response.raw.read(decode_content=True)
+        except urllib3.exceptions.HTTPError as e:
+            # Raw reads bypass requests' error wrapping; keep callers' RequestException handling working
+            raise requests.ConnectionError(e)
+        return loads_json(body)
+    return loads_json(response.content)
+
+
+def normalize_lazily(docs: Iterable[Dict[str, Any]], normalize: Callable[[Dict[str, Any]], Dict[str, Any]],
+                     store: Callable[[List[Dict[str, Any]]], None]) -> Iterator[Dict[str, Any]]:
+    """
+    Yield normalize(doc) for each doc as the caller asks for it (copies, since callers mutate items).
+    The full list is handed to store() only if the caller exhausts the iterator.
+    """
+    items = []
+    for doc in docs:
+        item = normalize(doc)
+        items.append(item)
+        yield dict(item)
+    if items:
+        store(items)
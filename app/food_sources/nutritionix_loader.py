@@ -9,17 +9,36 @@ Env support:
 from __future__ import annotations
 
 import os
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, Iterator, List, Optional
 
 import requests
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from . import stable_food_id, loads_json as _loads, read_json, normalize_lazily
+
 load_dotenv()
 
 API_BASE = "https://trackapi.nutritionix.com/v2"
 
+# Keep-alive session so back-to-back searches/UPC lookups reuse TCP+TLS connections
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+))
 
-def _headers() -> Optional[Dict[str, str]]:
+# Short-lived caches for repeat searches/UPCs (only non-empty results are stored; guarded by _cache_lock)
+_search_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_upc_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_cache_lock = threading.Lock()
+
+
+def _build_headers() -> Optional[Dict[str, str]]:
     app_id = os.getenv("NUTRITIONIX_APP_ID")
     app_key = os.getenv("NUTRITIONIX_APP_KEY")
     single = os.getenv("NUTRITIONIX_KEY")
@@ -32,10 +51,45 @@ def _headers() -> Optional[Dict[str, str]]:
     }
 
 
+# Credentials are read once at import (after load_dotenv); call reset_headers() after changing the env
+_CACHED_HEADERS = _build_headers()
+
+
+def _headers() -> Optional[Dict[str, str]]:
+    return _CACHED_HEADERS
+
+
+def reset_headers() -> None:
+    """Re-read Nutritionix credentials from the environment."""
+    global _CACHED_HEADERS
+    _CACHED_HEADERS = _build_headers()
+
+
 def available() -> bool:
     return _headers() is not None
 
 
+# Nutritionix full_nutrients attr_id codes -> (our field, multiplier); we map common few
+NX_MICRONUTRIENT_MAP = {
+    318: ("vitamin_a_rae", 1.0),
+    401: ("vitamin_c_mg", 1.0),
+    328: ("vitamin_d_iu", 1.0),
+    323: ("vitamin_e_mg", 1.0),
+    430: ("vitamin_k_mcg", 1.0),
+    301: ("calcium_mg", 1.0),
+    303: ("iron_mg", 1.0),
+    304: ("magnesium_mg", 1.0),
+    305: ("phosphorus_mg", 1.0),
+    306: ("potassium_mg", 1.0),
+    307: ("sodium_mg", 1.0),
+    309: ("zinc_mg", 1.0),
+    312: ("copper_mg", 1.0),
+    315: ("manganese_mg", 1.0),
+    454: ("choline_mg", 1.0),
+}
+_NX_IDS = frozenset(NX_MICRONUTRIENT_MAP)
+
+
 def _normalize_item(doc: Dict[str, Any]) -> Dict[str, Any]:
     # Nutritionix fields (branded):
     # brand_name, food_name, nix_item_id, upc, nf_calories, nf_protein, nf_total_fat, nf_total_carbohydrate
@@ -51,43 +105,25 @@ def _normalize_item(doc: Dict[str, Any]) -> Dict[str, Any]:
     # Some micronutrients are available in full_nutrients (array), provide best-effort mapping
     micronutrients = {}
     full = doc.get("full_nutrients") or []
-    # Nutritionix full_nutrients uses attr_id codes; we map common few
-    nx_map = {
-        318: ("vitamin_a_rae", 1.0),
-        401: ("vitamin_c_mg", 1.0),
-        328: ("vitamin_d_iu", 1.0),
-        323: ("vitamin_e_mg", 1.0),
-        430: ("vitamin_k_mcg", 1.0),
-        301: ("calcium_mg", 1.0),
-        303: ("iron_mg", 1.0),
-        304: ("magnesium_mg", 1.0),
-        305: ("phosphorus_mg", 1.0),
-        306: ("potassium_mg", 1.0),
-        307: ("sodium_mg", 1.0),
-        309: ("zinc_mg", 1.0),
-        312: ("copper_mg", 1.0),
-        315: ("manganese_mg", 1.0),
-        454: ("choline_mg", 1.0),
-    }
     for item in full:
+        # The API returns integer attr_ids; most of the ~150 entries are ones we don't map
+        attr_id = item.get("attr_id")
+        if attr_id not in _NX_IDS:
+            continue
+        key, mult = NX_MICRONUTRIENT_MAP[attr_id]
         try:
-            attr_id = int(item.get("attr_id"))
-            val = float(item.get("value") or 0)
-            if attr_id in nx_map:
-                key, mult = nx_map[attr_id]
-                micronutrients[key] = val * mult
-        except Exception:
+            micronutrients[key] = float(item.get("value") or 0) * mult
+        except (TypeError, ValueError):
             continue
 
-    # Completeness heuristic
-    completeness = 0
-    for k in ("calories", "protein_g", "fat_g", "carbs_g"):
-        if locals()[k]:
-            completeness += 1
-    completeness += sum(1 for v in micronutrients.values() if v)
+    # Completeness heuristic: count of non-zero macros and mapped micronutrients
+    completeness = (
+        bool(calories) + bool(protein_g) + bool(fat_g) + bool(carbs_g)
+        + sum(map(bool, micronutrients.values()))
+    )
 
     return {
-        "id": -(abs(hash(upc or name)) % 10_000_000),
+        "id": stable_food_id(upc or name),
         "name": name,
         "brand": brand,
         "upc": upc,
@@ -103,34 +139,53 @@ def _normalize_item(doc: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def search_nx_foods(query: str, limit: int = 25) -> List[Dict[str, Any]]:
-    """Search Nutritionix and return normalized branded items. Best-effort details for top N."""
+def search_nx_foods(query: str, limit: int = 25) -> Iterator[Dict[str, Any]]:
+    """
+    Search Nutritionix and return normalized branded items. Best-effort details for top N.
+    Items are normalized as the caller iterates, so taking only the first few skips the rest.
+    """
     hdrs = _headers()
     if not hdrs:
-        return []
+        return iter(())
+    key = (query, limit)
+    with _cache_lock:
+        cached = _search_cache.get(key)
+    if cached is not None:
+        return (dict(item) for item in cached)  # callers may mutate the items
     try:
-        r = requests.get(f"{API_BASE}/search/instant", params={"query": query, "detailed": True}, headers=hdrs, timeout=8)
-        r.raise_for_status()
-        js = r.json() or {}
-        branded = (js.get("branded") or [])[:limit]
-        return [_normalize_item(b) for b in branded]
-    except requests.RequestException:
-        return []
+        with _SESSION.get(f"{API_BASE}/search/instant", params={"query": query, "detailed": True},
+                          headers=hdrs, timeout=8, stream=True) as r:
+            r.raise_for_status()
+            js = read_json(r) or {}
+    except (requests.RequestException, ValueError):  # ValueError covers JSON decode errors
+        return iter(())
+    branded = (js.get("branded") or [])[:limit]
+    return normalize_lazily(branded, _normalize_item, lambda items: _store_search(key, items))
+
+
+def _store_search(key, items: List[Dict[str, Any]]) -> None:
+    with _cache_lock:
+        _search_cache[key] = items
 
 
 def get_nx_item_by_upc(upc: str) -> Dict[str, Any]:
     hdrs = _headers()
     if not hdrs:
         return {}
+    with _cache_lock:
+        cached = _upc_cache.get(upc)
+    if cached is not None:
+        return dict(cached)
     try:
-        r = requests.get(f"{API_BASE}/search/item", params={"upc": upc}, headers=hdrs, timeout=8)
+        r = _SESSION.get(f"{API_BASE}/search/item", params={"upc": upc}, headers=hdrs, timeout=8)
         r.raise_for_status()
-        js = r.json() or {}
+        js = _loads(r.content) or {}
         foods = js.get("foods") or []
         if foods:
-            return _normalize_item(foods[0])
+            item = _normalize_item(foods[0])
+            with _cache_lock:
+                _upc_cache[upc] = item
+            return dict(item)
         return {}
-    except requests.RequestException:
+    except (requests.RequestException, ValueError):  # ValueError covers JSON decode errors
         return {}
-
-
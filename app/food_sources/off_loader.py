@@ -3,23 +3,47 @@ Open Food Facts (OFF) simple integration.
 - Public API: no key required.
 - We normalize a minimal subset (name, brand, barcode, macros) and leave micronutrients best-effort.
 """
+import threading
 import requests
-from typing import List, Dict, Any, Optional
+from cachetools import TTLCache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, Iterator, Optional
 from sqlalchemy.orm import Session
 from ..models import Food
+from . import stable_food_id, loads_json as _loads, read_json, normalize_lazily
 
 OFF_SEARCH_URL = "https://world.openfoodfacts.org/cgi/search.pl"
 OFF_PRODUCT_URL = "https://world.openfoodfacts.org/api/v2/product/{}"
+# Only the fields _normalize_off_product reads; full product documents run to tens of KB each
+OFF_FIELDS = "code,id,_id,product_name,generic_name,brands,image_front_url,image_url,image_small_url,nutriments"
+
+# Keep-alive session so repeat searches/barcode lookups reuse TCP+TLS connections
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=20,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504)),
+))
+
+# Short-lived caches for repeat searches/barcodes (only non-empty results are stored; guarded by _cache_lock)
+_search_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_product_cache: TTLCache = TTLCache(maxsize=1024, ttl=300)
+_cache_lock = threading.Lock()
 
 def _normalize_off_product(prod: Dict[str, Any]) -> Dict[str, Any]:
     nutrients = prod.get('nutriments') or {}
-    def g(key: str) -> float:
+    def g(key: str, _n=nutrients) -> float:
         try:
-            return float(nutrients.get(key) or 0)
+            return float(_n.get(key) or 0)
         except Exception:
             return 0.0
+    # Minerals are usually reported in g/100g; values under 10 are taken as grams and scaled to mg
+    calcium = g('calcium_100g')
+    sodium = g('sodium_100g')
+    potassium = g('potassium_100g')
     return {
-        'id': -(abs(hash(prod.get('code') or prod.get('id') or prod.get('_id') or '0')) % 10_000_000),
+        'id': stable_food_id(prod.get('code') or prod.get('id') or prod.get('_id') or '0'),
         'name': prod.get('product_name') or prod.get('generic_name') or 'Unknown Product',
         'brand': (prod.get('brands') or 'Generic').split(',')[0].strip(),
         'upc': prod.get('code') or '',
@@ -32,36 +56,54 @@ def _normalize_off_product(prod: Dict[str, Any]) -> Dict[str, Any]:
         'carbs_g': g('carbohydrates_100g'),
         # Basic micronutrients if available (per 100g)
         'vitamin_c_mg': g('vitamin-c_100g'),
-        'calcium_mg': g('calcium_100g') * 1000 if g('calcium_100g') < 10 else g('calcium_100g'),
+        'calcium_mg': calcium * 1000 if calcium < 10 else calcium,
         'iron_mg': g('iron_100g'),
-        'sodium_mg': g('sodium_100g') * 1000 if g('sodium_100g') and g('sodium_100g') < 10 else g('sodium_100g'),
-        'potassium_mg': g('potassium_100g') * 1000 if g('potassium_100g') and g('potassium_100g') < 10 else g('potassium_100g'),
+        'sodium_mg': sodium * 1000 if sodium < 10 else sodium,
+        'potassium_mg': potassium * 1000 if potassium < 10 else potassium,
     }
 
-def search_off_foods(query: str, limit: int = 10) -> List[Dict[str, Any]]:
+def search_off_foods(query: str, limit: int = 10) -> Iterator[Dict[str, Any]]:
+    """Search OFF; products are normalized as the caller iterates, so early exits skip the rest."""
     params = {
         'search_terms': query,
         'search_simple': 1,
         'json': 1,
         'page_size': limit,
+        'fields': OFF_FIELDS,
     }
+    key = (query, limit)
+    with _cache_lock:
+        cached = _search_cache.get(key)
+    if cached is not None:
+        return (dict(p) for p in cached)  # callers may mutate the items
     try:
-        r = requests.get(OFF_SEARCH_URL, params=params, timeout=8)
-        r.raise_for_status()
-        data = r.json() or {}
-        prods = (data.get('products') or [])[:limit]
-        return [_normalize_off_product(p) for p in prods]
-    except requests.RequestException:
-        return []
+        with _SESSION.get(OFF_SEARCH_URL, params=params, timeout=8, stream=True) as r:
+            r.raise_for_status()
+            data = read_json(r) or {}
+    except (requests.RequestException, ValueError):  # ValueError covers JSON decode errors
+        return iter(())
+    prods = (data.get('products') or [])[:limit]
+    return normalize_lazily(prods, _normalize_off_product, lambda results: _store_search(key, results))
+
+def _store_search(key, results: List[Dict[str, Any]]) -> None:
+    with _cache_lock:
+        _search_cache[key] = results
 
 def get_off_food_details(barcode: str) -> Dict[str, Any]:
+    with _cache_lock:
+        cached = _product_cache.get(barcode)
+    if cached is not None:
+        return dict(cached)
     try:
-        r = requests.get(OFF_PRODUCT_URL.format(barcode), timeout=8)
+        r = _SESSION.get(OFF_PRODUCT_URL.format(barcode), params={'fields': OFF_FIELDS}, timeout=8)
         r.raise_for_status()
-        data = r.json() or {}
+        data = _loads(r.content) or {}
         prod = (data.get('product') or {})
-        return _normalize_off_product(prod)
-    except requests.RequestException:
+        info = _normalize_off_product(prod)
+        with _cache_lock:
+            _product_cache[barcode] = info
+        return dict(info)
+    except (requests.RequestException, ValueError):  # ValueError covers JSON decode errors
         return {}
 
 def load_off_food_to_db(db: Session, barcode: str) -> Optional[Food]:
@@ -1,11 +1,71 @@
 """
 Meal planning and recipe suggestion system.
 """
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, FrozenSet
 from sqlalchemy.orm import Session
+from sqlalchemy import func, inspect, or_
 from datetime import datetime, timedelta
 from app.models import User, Food, MealPlan, MealPlanItem
 import random
+import re
+import numpy as np
+
+# Simple keyword-based filtering for meal types
+MEAL_TYPE_KEYWORDS = {
+    'breakfast': ('oats', 'yogurt', 'banana', 'egg', 'cereal', 'toast'),
+    'lunch': ('chicken', 'salad', 'rice', 'quinoa', 'sandwich'),
+    'dinner': ('salmon', 'beef', 'pasta', 'potato', 'broccoli'),
+    'snack': ('almonds', 'apple', 'cheese', 'nuts'),
+}
+MEAL_TYPE_PATTERNS = {
+    meal_type: re.compile('|'.join(map(re.escape, keywords)))
+    for meal_type, keywords in MEAL_TYPE_KEYWORDS.items()
+}
+# Keyword -> meal types, and one alternation across every meal type's keywords.
+# The lookahead makes finditer report overlapping matches, so no keyword hides another.
+MEAL_KEYWORD_TYPES: Dict[str, FrozenSet[str]] = {
+    keyword: frozenset(mt for mt, kws in MEAL_TYPE_KEYWORDS.items() if keyword in kws)
+    for keywords in MEAL_TYPE_KEYWORDS.values() for keyword in keywords
+}
+ALL_MEAL_KEYWORDS_PATTERN = re.compile('(?=(' + '|'.join(map(re.escape, MEAL_KEYWORD_TYPES)) + '))')
+
+def meal_types_for(food_name: str) -> FrozenSet[str]:
+    """Meal types whose keywords appear in food_name, from a single regex scan."""
+    found = ALL_MEAL_KEYWORDS_PATTERN.findall(food_name.lower())
+    if not found:
+        return frozenset()
+    return frozenset().union(*(MEAL_KEYWORD_TYPES[keyword] for keyword in found))
+
+# Nutrients totalled by get_meal_plan_nutrition
+MEAL_PLAN_NUTRIENT_FIELDS = ('calories', 'protein_g', 'fat_g', 'carbs_g', 'vitamin_c_mg', 'calcium_mg', 'iron_mg')
+
+def _portion_grams(kcals: np.ndarray, target_calories: float, variation: np.ndarray) -> np.ndarray:
+    """
+    Grams of each food needed to fill the remaining calories, scaled by variation (0.8-1.2) and
+    clamped to 20-500g. Foods after the target is reached are dropped from the result.
+    """
+    grams = np.empty(kcals.shape[0], dtype=np.float64)
+    current_calories = 0.0
+    n = 0
+    for i in range(kcals.shape[0]):
+        if current_calories >= target_calories:
+            break
+        if kcals[i] > 0:
+            # Calories still needed, converted to grams, with some variation
+            g = (target_calories - current_calories) / kcals[i] * 100.0 * variation[i]
+            g = max(20.0, min(500.0, g))  # Keep portions reasonable
+        else:
+            g = 100.0  # Default portion
+        grams[i] = g
+        current_calories += kcals[i] * g / 100.0
+        n += 1
+    return grams[:n]
+
+try:
+    from numba import njit
+    _portion_grams = njit(cache=True)(_portion_grams)
+except ImportError:
+    pass
 
 class MealPlanner:
     """Generate meal plans based on user goals and preferences."""
@@ -43,8 +103,7 @@ class MealPlanner:
             target_carbs_g=target_carbs
         )
         db.add(meal_plan)
-        db.commit()
-        db.refresh(meal_plan)
+        db.flush()  # assigns meal_plan.id; plan and items commit together below
         
         # Distribute calories across meals
         calorie_distribution = {
@@ -54,52 +113,56 @@ class MealPlanner:
             'snack': 0.10       # 10%
         }
         
-        # Get available foods
-        foods = db.query(Food).limit(50).all()
+        # Get available foods: a random sample of keyword-matching foods, filtered in SQL
+        # instead of an arbitrary 50 rows that may match no meal type at all
+        foods = db.query(Food).filter(
+            or_(*(Food.name.ilike(f'%{keyword}%') for keyword in MEAL_KEYWORD_TYPES))
+        ).order_by(func.random()).limit(50).all()
         if not foods:
+            # Nothing matches any keyword; every meal type falls back to any foods
+            foods = db.query(Food).order_by(func.random()).limit(50).all()
+        if not foods:
+            db.commit()
             return meal_plan
         
-        # Generate meals for each meal type
+        # Classify each food once for all meal types' keyword filtering
+        food_meal_types = [meal_types_for(food.name) for food in foods]
+        
+        # Generate meals for each meal type, then insert every item in one transaction
+        items: List[MealPlanItem] = []
         for meal_type, calorie_ratio in calorie_distribution.items():
             target_meal_calories = target_calories * calorie_ratio
-            self._add_meal_to_plan(db, meal_plan, meal_type, target_meal_calories, foods)
+            self._add_meal_to_plan(meal_plan, meal_type, target_meal_calories, foods, items, food_meal_types)
         
+        db.add_all(items)
+        db.commit()
         return meal_plan
     
-    def _add_meal_to_plan(self, db: Session, meal_plan: MealPlan, meal_type: str, 
-                         target_calories: float, available_foods: List[Food]):
-        """Add foods to a meal plan for a specific meal type."""
+    def _add_meal_to_plan(self, meal_plan: MealPlan, meal_type: str, target_calories: float,
+                         available_foods: List[Food], items: List[MealPlanItem],
+                         food_meal_types: Optional[List[FrozenSet[str]]] = None):
+        """Append meal plan items for a specific meal type to items (the caller adds and commits them)."""
         
         # Filter foods based on meal type preferences
-        suitable_foods = self._filter_foods_for_meal_type(available_foods, meal_type)
+        suitable_foods = self._filter_foods_for_meal_type(available_foods, meal_type, food_meal_types)
         
         if not suitable_foods:
             suitable_foods = available_foods
         
-        current_calories = 0
-        order_index = 0
-        
         # Add 1-3 foods per meal
         num_foods = random.randint(1, min(3, len(suitable_foods)))
-        selected_foods = random.sample(suitable_foods, num_foods)
-        
-        for food in selected_foods:
-            if current_calories >= target_calories:
-                break
-                
-            # Calculate portion to get remaining calories
-            remaining_calories = target_calories - current_calories
-            food_calories_per_100g = food.calories or 100
-            
-            # Calculate grams needed (with some randomness)
-            if food_calories_per_100g > 0:
-                base_grams = (remaining_calories / food_calories_per_100g) * 100
-                # Add some variation (80-120% of calculated amount)
-                grams = base_grams * random.uniform(0.8, 1.2)
-                grams = max(20, min(500, grams))  # Keep portions reasonable
-            else:
-                grams = 100  # Default portion
-            
+        if num_foods == 1:
+            selected_foods = [suitable_foods[random.randrange(len(suitable_foods))]]
+        else:
+            # Sample indices (range is O(1) to sample from) rather than copying the food list
+            selected_foods = [suitable_foods[i] for i in random.sample(range(len(suitable_foods)), num_foods)]
+        
+        # Portion sizes for the selected foods (stops early once the meal's calories are covered)
+        kcals = np.array([food.calories or 100 for food in selected_foods], dtype=np.float64)
+        variation = np.array([random.uniform(0.8, 1.2) for _ in selected_foods], dtype=np.float64)
+        portions = _portion_grams(kcals, float(target_calories), variation)
+        
+        for order_index, (food, grams) in enumerate(zip(selected_foods, portions.tolist())):
             # Create meal plan item
             item = MealPlanItem(
                 meal_plan_id=meal_plan.id,
@@ -109,67 +172,50 @@ class MealPlanner:
                 order_index=order_index,
                 notes=f"Suggested portion for {meal_type}"
             )
-            db.add(item)
-            
-            current_calories += (food_calories_per_100g * grams / 100)
-            order_index += 1
-        
-        db.commit()
+            items.append(item)
     
-    def _filter_foods_for_meal_type(self, foods: List[Food], meal_type: str) -> List[Food]:
-        """Filter foods that are suitable for a specific meal type."""
-        
-        # Simple keyword-based filtering
-        breakfast_keywords = ['oats', 'yogurt', 'banana', 'egg', 'cereal', 'toast']
-        lunch_keywords = ['chicken', 'salad', 'rice', 'quinoa', 'sandwich']
-        dinner_keywords = ['salmon', 'beef', 'pasta', 'potato', 'broccoli']
-        snack_keywords = ['almonds', 'apple', 'cheese', 'nuts']
-        
-        keyword_map = {
-            'breakfast': breakfast_keywords,
-            'lunch': lunch_keywords,
-            'dinner': dinner_keywords,
-            'snack': snack_keywords
-        }
+    def _filter_foods_for_meal_type(self, foods: List[Food], meal_type: str,
+                                    food_meal_types: Optional[List[FrozenSet[str]]] = None) -> List[Food]:
+        """Filter foods that are suitable for a specific meal type.
         
-        keywords = keyword_map.get(meal_type, [])
-        if not keywords:
+        food_meal_types, if given, is [meal_types_for(food.name) for food in foods], precomputed by the caller.
+        """
+        pattern = MEAL_TYPE_PATTERNS.get(meal_type)
+        if pattern is None:
             return foods
         
-        suitable_foods = []
-        for food in foods:
-            food_name = food.name.lower()
-            if any(keyword in food_name for keyword in keywords):
-                suitable_foods.append(food)
-        
+        if food_meal_types is not None:
+            # Set membership against the precomputed classification
+            suitable_foods = [food for food, types in zip(foods, food_meal_types) if meal_type in types]
+        else:
+            # One C-level regex scan per name instead of a substring test per keyword
+            suitable_foods = [food for food in foods if pattern.search(food.name.lower())]
         return suitable_foods if suitable_foods else foods
     
     def get_meal_plan_nutrition(self, db: Session, meal_plan: MealPlan) -> Dict:
-        """Calculate total nutrition for a meal plan."""
-        
-        total_nutrition = {
-            'calories': 0,
-            'protein_g': 0,
-            'fat_g': 0,
-            'carbs_g': 0,
-            'vitamin_c_mg': 0,
-            'calcium_mg': 0,
-            'iron_mg': 0
-        }
-        
-        for item in meal_plan.items:
-            food = item.food
-            multiplier = item.grams / 100.0
-            
-            total_nutrition['calories'] += (food.calories or 0) * multiplier
-            total_nutrition['protein_g'] += (food.protein_g or 0) * multiplier
-            total_nutrition['fat_g'] += (food.fat_g or 0) * multiplier
-            total_nutrition['carbs_g'] += (food.carbs_g or 0) * multiplier
-            total_nutrition['vitamin_c_mg'] += (food.vitamin_c_mg or 0) * multiplier
-            total_nutrition['calcium_mg'] += (food.calcium_mg or 0) * multiplier
-            total_nutrition['iron_mg'] += (food.iron_mg or 0) * multiplier
-        
-        return total_nutrition
+        """Calculate total nutrition for a meal plan (summed in one SQL aggregate)."""
+        
+        if 'items' not in inspect(meal_plan).unloaded:
+            # Items already in memory: one grams @ nutrient-matrix product instead of a round trip
+            items = meal_plan.items
+            grams = np.fromiter((item.grams or 0 for item in items), dtype=np.float64, count=len(items))
+            nutrients = np.array(
+                [[getattr(item.food, field) or 0 for field in MEAL_PLAN_NUTRIENT_FIELDS] for item in items],
+                dtype=np.float64
+            ).reshape(len(items), len(MEAL_PLAN_NUTRIENT_FIELDS))
+            return dict(zip(MEAL_PLAN_NUTRIENT_FIELDS, (grams @ nutrients / 100.0).tolist()))
+        
+        grams = MealPlanItem.grams / 100.0
+        row = db.query(*(
+            func.coalesce(func.sum(func.coalesce(getattr(Food, field), 0) * grams), 0.0).label(field)
+            for field in MEAL_PLAN_NUTRIENT_FIELDS
+        )).select_from(MealPlanItem).join(
+            Food, MealPlanItem.food_id == Food.id
+        ).filter(
+            MealPlanItem.meal_plan_id == meal_plan.id
+        ).one()
+        
+        return {field: float(value) for field, value in row._mapping.items()}
 
 # Global instance
 meal_planner = MealPlanner()
@@ -1,6 +1,10 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, Date, Index
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, JSON, ForeignKey, Boolean, Date, Index, LargeBinary, text
+from sqlalchemy import event
 from sqlalchemy.orm import relationship
 from datetime import datetime
+from operator import attrgetter
+import struct
+import numpy as np
 from .db import Base
 
 class User(Base):
@@ -72,11 +76,31 @@ class User(Base):
     meal_logs = relationship("MealLog", back_populates="user")
     meal_plans = relationship("MealPlan", back_populates="user")
 
+# Per-100g Food nutrient columns, in NutritionTotals field order (see nutrition.compute_totals)
+NUTRIENT_COLS = (
+    # Macronutrients
+    "calories", "protein_g", "fat_g", "carbs_g",
+    # Fat-soluble vitamins
+    "vitamin_a_rae", "vitamin_d_iu", "vitamin_e_mg", "vitamin_k_mcg",
+    # Water-soluble vitamins
+    "vitamin_c_mg", "vitamin_b1_mg", "vitamin_b2_mg", "vitamin_b3_mg", "vitamin_b5_mg",
+    "vitamin_b6_mg", "vitamin_b7_mcg", "vitamin_b9_mcg", "vitamin_b12_mcg", "choline_mg",
+    # Macrominerals
+    "calcium_mg", "phosphorus_mg", "magnesium_mg", "sodium_mg", "potassium_mg", "chloride_mg", "sulfur_mg",
+    # Trace minerals
+    "iron_mg", "zinc_mg", "copper_mg", "manganese_mg", "iodine_mcg", "selenium_mcg",
+    "chromium_mcg", "molybdenum_mcg", "fluoride_mg",
+)
+_food_nutrients = attrgetter(*NUTRIENT_COLS)
+# Little-endian float64 packing of NUTRIENT_COLS stored in Food.nutrients_blob
+_NUTRIENT_STRUCT = struct.Struct(f"<{len(NUTRIENT_COLS)}d")
+
 class Food(Base):
     __tablename__ = "foods"
     
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    # No B-tree: searches are ILIKE '%q%' (trigram GIN on Postgres), never point lookups by name
+    name = Column(String)
     brand = Column(String, default="Generic")
     upc = Column(String, unique=True, index=True)
     
@@ -130,9 +154,49 @@ class Food(Base):
     molybdenum_mcg = Column(Float)
     fluoride_mg = Column(Float)
     
+    # NUTRIENT_COLS packed as float64 (maintained by _pack_nutrients_blob) so one value hydrates the vector
+    nutrients_blob = Column(LargeBinary)
+    
     # Relationships
     meal_logs = relationship("MealLog", back_populates="food")
     meal_plan_items = relationship("MealPlanItem", back_populates="food")
+    
+    # Transient (not a column): NUTRIENT_COLS values as a float64 array, built on first use
+    _nutrient_row = None
+    
+    def nutrient_row(self) -> np.ndarray:
+        """Per-100g nutrient values in NUTRIENT_COLS order (None -> 0), cached until the row changes"""
+        if self._nutrient_row is None:
+            self._nutrient_row = unpack_nutrients(self.nutrients_blob)
+            if self._nutrient_row is None:
+                # Rows written before the blob existed, or via Core bulk inserts that skip ORM events
+                self._nutrient_row = np.nan_to_num(np.array(_food_nutrients(self), dtype=np.float64))
+        return self._nutrient_row
+
+# Keep the packed nutrient vector in sync with the per-column values
+@event.listens_for(Food, "before_insert")
+@event.listens_for(Food, "before_update")
+def _pack_nutrients_blob(mapper, connection, target):
+    target.nutrients_blob = pack_nutrients(_food_nutrients(target))
+
+def pack_nutrients(values) -> bytes:
+    """Food.nutrients_blob for values in NUTRIENT_COLS order (None -> 0); for Core inserts that skip ORM events"""
+    return _NUTRIENT_STRUCT.pack(*np.nan_to_num(np.array(values, dtype=np.float64)))
+
+def unpack_nutrients(blob):
+    """Read-only float64 view of a Food.nutrients_blob, or None if it is missing or from another layout"""
+    if blob is None or len(blob) != _NUTRIENT_STRUCT.size:
+        return None
+    return np.frombuffer(blob, dtype="<f8")
+
+# Drop the cached row whenever the Food's values may have changed
+@event.listens_for(Food, "after_update")
+def _clear_nutrient_row_on_update(mapper, connection, target):
+    target._nutrient_row = None
+
+@event.listens_for(Food, "expire")
+def _clear_nutrient_row_on_expire(target, attrs):
+    target._nutrient_row = None
 
 class MealLog(Base):
     __tablename__ = "meal_logs"
@@ -149,6 +213,11 @@ class MealLog(Base):
     user = relationship("User", back_populates="meal_logs")
     food = relationship("Food", back_populates="meal_logs")
 
+    __table_args__ = (
+        # Covers per-user date-range aggregation (food_id/grams read from the index, not the heap)
+        Index('ix_meal_logs_user_date_food', 'user_id', 'logged_at', 'food_id', 'grams'),
+    )
+
 class MealPlan(Base):
     __tablename__ = "meal_plans"
     
@@ -170,6 +239,10 @@ class MealPlan(Base):
     user = relationship("User", back_populates="meal_plans")
     items = relationship("MealPlanItem", back_populates="meal_plan", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index('ix_meal_plans_user_date', 'user_id', 'target_date'),
+    )
+
 class MealPlanItem(Base):
     __tablename__ = "meal_plan_items"
     
@@ -213,7 +286,9 @@ class Recipe(Base):
     
     # Relationships
     user = relationship("User")
-    ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan")
+    # Ingredients are read whenever a recipe is: load them with one IN query per batch of recipes
+    ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan",
+                               lazy="selectin")
 
 class RecipeIngredient(Base):
     __tablename__ = "recipe_ingredients"
@@ -316,6 +391,14 @@ class BarcodeHistory(Base):
     
     # Relationships
     user = relationship("User")
+    
+    __table_args__ = (
+        # Per-user history ordered by scanned_at (index is scanned backwards for DESC)
+        Index('ix_bh_user_scanned', 'user_id', 'scanned_at'),
+        # Popular products only aggregate successful scans
+        Index('ix_bh_success_upc', 'upc',
+              postgresql_where=text('success = true'), sqlite_where=text('success = 1')),
+    )
 
 class UserFollow(Base):
     """User following relationships"""
@@ -453,6 +536,7 @@ class ChallengeParticipant(Base):
     # Unique constraint
     __table_args__ = (
         Index('ix_unique_participant', 'challenge_id', 'user_id', unique=True),
+        Index('ix_challenge_participants_user', 'user_id'),  # user-first lookups
     )
 
 class ActivityFeed(Base):
@@ -1,152 +1,358 @@
 from typing import List, Dict, Any
+from datetime import date
+import hashlib
+import threading
+import time
+import numpy as np
+from cachetools import TTLCache
+from sqlalchemy import event, select, text, inspect
+from sqlalchemy.orm import Session, joinedload, load_only, raiseload
+from sqlalchemy.orm.attributes import set_committed_value
 from .schemas import NutritionTotals
-from .models import MealLog, Food
+from .models import MealLog, Food, NUTRIENT_COLS, unpack_nutrients
+
+# Loader option for MealLog queries that feed compute_totals: fetch only the Food columns totals
+# (and log listings) read, and fail loudly on accidental lazy loads of Food's other relationships
+_TOTALS_FOOD_COLUMNS = (Food.id, Food.name, Food.nutrients_blob, *(getattr(Food, col) for col in NUTRIENT_COLS))
+TOTALS_FOOD_LOAD = joinedload(MealLog.food).options(load_only(*_TOTALS_FOOD_COLUMNS), raiseload("*"))
+
+# Below this many logs BLAS matvec beats the parallel kernel's thread startup
+TOTALS_KERNEL_MIN_ROWS = 1024
+
+try:
+    from numba import njit, prange
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _totals_kernel(mat, scales):
+        out = np.zeros(mat.shape[1])
+        for j in prange(mat.shape[1]):
+            acc = 0.0
+            for i in range(mat.shape[0]):
+                acc += mat[i, j] * scales[i]
+            out[j] = acc
+        return out
+
+    @njit(parallel=True, fastmath=True, cache=True)
+    def _rollup_kernel(scales, food_idx, mat):
+        # Same reduction over mat[food_idx] without materializing the gathered (logs x nutrients) copy
+        out = np.zeros(mat.shape[1])
+        for j in prange(mat.shape[1]):
+            acc = 0.0
+            for i in range(food_idx.shape[0]):
+                acc += mat[food_idx[i], j] * scales[i]
+            out[j] = acc
+        return out
+except ImportError:
+    _totals_kernel = None
+    _rollup_kernel = None
+
+# Both caches expire after this long, bounding staleness from edits this process never sees
+# (other workers, Core writes that skip the ORM events)
+NUTRITION_CACHE_TTL = 300
+
+# Recent sum vectors keyed by a digest of the (log id, food id, grams) set; guarded by _totals_cache_lock
+_totals_cache: TTLCache = TTLCache(maxsize=4096, ttl=NUTRITION_CACHE_TTL)
+_totals_cache_lock = threading.Lock()
+
+# Per-100g nutrient vectors by Food.id for (food_id, grams) aggregation without loading Food rows
+_food_vectors: TTLCache = TTLCache(maxsize=50_000, ttl=NUTRITION_CACHE_TTL)
+_food_vectors_lock = threading.Lock()
+_ZERO_VECTOR = np.zeros(len(NUTRIENT_COLS))
+
+def invalidate_food_vectors(food_ids):
+    """Forget cached vectors (and totals built from them) for foods changed outside the ORM, e.g. Core upserts"""
+    # Cached totals embed the foods' old values; edits are rare, so drop everything
+    with _totals_cache_lock:
+        _totals_cache.clear()
+    with _food_vectors_lock:
+        for food_id in food_ids:
+            _food_vectors.pop(food_id, None)
+
+@event.listens_for(Food, "after_update")
+def _clear_totals_cache(mapper, connection, target):
+    invalidate_food_vectors([target.id])
+
+def _food_vectors_for(session: Session, food_ids):
+    """
+    Distinct per-100g food vectors plus an index per food_id into them; uncached foods are
+    read as (id, nutrients_blob) in one SELECT. Unknown or NULL food ids map to a zero row.
+    """
+    with _food_vectors_lock:
+        vectors = {food_id: _food_vectors.get(food_id) for food_id in set(food_ids)}
+    missing = [food_id for food_id, vector in vectors.items() if vector is None and food_id is not None]
+    if missing:
+        fetched = {}
+        unpacked = []
+        for food_id, blob in session.execute(select(Food.id, Food.nutrients_blob).where(Food.id.in_(missing))):
+            vector = unpack_nutrients(blob)  # read-only, so safe to share between requests
+            if vector is None:
+                unpacked.append(food_id)
+            else:
+                fetched[food_id] = vector
+        if unpacked:
+            # Rows without a blob yet: fall back to the scalar columns
+            columns = [getattr(Food, col) for col in NUTRIENT_COLS]
+            for row in session.execute(select(Food.id, *columns).where(Food.id.in_(unpacked))):
+                vector = np.nan_to_num(np.array(row[1:], dtype=np.float64))
+                vector.setflags(write=False)  # shared between requests
+                fetched[row[0]] = vector
+        with _food_vectors_lock:
+            _food_vectors.update(fetched)
+        vectors.update(fetched)
+    
+    position = {}
+    rows = [_ZERO_VECTOR]
+    for food_id, vector in vectors.items():
+        if vector is not None:
+            position[food_id] = len(rows)
+            rows.append(vector)
+    food_idx = np.fromiter((position.get(food_id, 0) for food_id in food_ids), dtype=np.intp, count=len(food_ids))
+    return np.stack(rows), food_idx
+
+def food_nutrient_matrix(session: Session, food_ids) -> np.ndarray:
+    """(len(food_ids) x nutrients) per-100g matrix; unknown or NULL food ids give zero rows"""
+    mat, food_idx = _food_vectors_for(session, food_ids)
+    return mat[food_idx]
+
+def compute_totals_from_portions(session: Session, portions) -> NutritionTotals:
+    """Totals for (food_id, grams) pairs, e.g. straight from a MealLog column query"""
+    if not portions:
+        return NutritionTotals()
+    mat, food_idx = _food_vectors_for(session, [food_id for food_id, _ in portions])
+    scales = np.fromiter((grams or 0 for _, grams in portions), dtype=np.float64, count=len(portions)) / 100.0
+    if _rollup_kernel is not None and len(portions) > TOTALS_KERNEL_MIN_ROWS:
+        sums = _rollup_kernel(scales, food_idx, mat)
+    else:
+        sums = scales @ mat[food_idx]
+    return NutritionTotals.from_array(sums)
 
 def compute_totals(meal_logs: List[MealLog]) -> NutritionTotals:
     """Compute nutrition totals from meal logs, scaling per-100g values by grams"""
-    totals = NutritionTotals()
+    if not meal_logs:
+        return NutritionTotals()
     
-    for log in meal_logs:
-        food = log.food
-        scale_factor = log.grams / 100.0  # Convert from per-100g to actual grams
-        
-        # Macronutrients
-        totals.calories += food.calories * scale_factor
-        totals.protein_g += food.protein_g * scale_factor
-        totals.fat_g += food.fat_g * scale_factor
-        totals.carbs_g += food.carbs_g * scale_factor
-        
-        # Fat-soluble vitamins
-        totals.vitamin_a_rae += (food.vitamin_a_rae or 0) * scale_factor
-        totals.vitamin_d_iu += (food.vitamin_d_iu or 0) * scale_factor
-        totals.vitamin_e_mg += (food.vitamin_e_mg or 0) * scale_factor
-        totals.vitamin_k_mcg += (food.vitamin_k_mcg or 0) * scale_factor
-        
-        # Water-soluble vitamins
-        totals.vitamin_c_mg += (food.vitamin_c_mg or 0) * scale_factor
-        totals.vitamin_b1_mg += (food.vitamin_b1_mg or 0) * scale_factor
-        totals.vitamin_b2_mg += (food.vitamin_b2_mg or 0) * scale_factor
-        totals.vitamin_b3_mg += (food.vitamin_b3_mg or 0) * scale_factor
-        totals.vitamin_b5_mg += (food.vitamin_b5_mg or 0) * scale_factor
-        totals.vitamin_b6_mg += (food.vitamin_b6_mg or 0) * scale_factor
-        totals.vitamin_b7_mcg += (food.vitamin_b7_mcg or 0) * scale_factor
-        totals.vitamin_b9_mcg += (food.vitamin_b9_mcg or 0) * scale_factor
-        totals.vitamin_b12_mcg += (food.vitamin_b12_mcg or 0) * scale_factor
-        totals.choline_mg += (food.choline_mg or 0) * scale_factor
-        
-        # Macrominerals
-        totals.calcium_mg += (food.calcium_mg or 0) * scale_factor
-        totals.phosphorus_mg += (food.phosphorus_mg or 0) * scale_factor
-        totals.magnesium_mg += (food.magnesium_mg or 0) * scale_factor
-        totals.sodium_mg += (food.sodium_mg or 0) * scale_factor
-        totals.potassium_mg += (food.potassium_mg or 0) * scale_factor
-        totals.chloride_mg += (food.chloride_mg or 0) * scale_factor
-        totals.sulfur_mg += (food.sulfur_mg or 0) * scale_factor
-        
-        # Trace minerals
-        totals.iron_mg += (food.iron_mg or 0) * scale_factor
-        totals.zinc_mg += (food.zinc_mg or 0) * scale_factor
-        totals.copper_mg += (food.copper_mg or 0) * scale_factor
-        totals.manganese_mg += (food.manganese_mg or 0) * scale_factor
-        totals.iodine_mcg += (food.iodine_mcg or 0) * scale_factor
-        totals.selenium_mcg += (food.selenium_mcg or 0) * scale_factor
-        totals.chromium_mcg += (food.chromium_mcg or 0) * scale_factor
-        totals.molybdenum_mcg += (food.molybdenum_mcg or 0) * scale_factor
-        totals.fluoride_mg += (food.fluoride_mg or 0) * scale_factor
+    if any(log.id is None for log in meal_logs):
+        # Unsaved logs have no stable identity to key on
+        return NutritionTotals.from_array(_compute_sums(meal_logs))
     
-    return totals
+    # Same logs with the same portions give the same totals; edits to a log change its grams/food_id
+    key = hashlib.blake2b(
+        repr(sorted((log.id, log.food_id, log.grams) for log in meal_logs)).encode(), digest_size=16
+    ).digest()
+    with _totals_cache_lock:
+        sums = _totals_cache.get(key)
+    if sums is None:
+        sums = _compute_sums(meal_logs)
+        sums.setflags(write=False)  # shared between callers
+        with _totals_cache_lock:
+            _totals_cache[key] = sums
+    # Each caller gets its own model built straight from the cached vector
+    return NutritionTotals.from_array(sums)
+
+def _load_foods(meal_logs: List[MealLog]) -> None:
+    """Hydrate MealLog.food for logs that weren't eager-loaded with one IN query instead of one SELECT per log"""
+    pending = [log for log in meal_logs if log.food_id is not None and "food" in inspect(log).unloaded]
+    session = Session.object_session(pending[0]) if pending else None
+    if session is None:
+        return
+    stmt = (
+        select(Food)
+        .options(load_only(*_TOTALS_FOOD_COLUMNS), raiseload("*"))
+        .where(Food.id.in_(list({log.food_id for log in pending})))
+    )
+    foods = {food.id: food for food in session.scalars(stmt)}
+    for log in pending:
+        # Committed value: populates the relationship without marking the log dirty
+        set_committed_value(log, "food", foods.get(log.food_id))
+
+def _build_matrix(meal_logs: List[MealLog]):
+    """(logs x nutrients) matrix of per-100g values and the per-log grams/100 scales"""
+    _load_foods(meal_logs)
+    # Gathered from each Food's cached row
+    mat = np.stack([log.food.nutrient_row() for log in meal_logs])
+    scales = np.fromiter((log.grams for log in meal_logs), dtype=np.float64, count=len(meal_logs)) / 100.0
+    return mat, scales
+
+def _compute_sums(meal_logs: List[MealLog]) -> np.ndarray:
+    """Grams-scaled nutrient sums as a float64 vector in NUTRIENT_COLS order"""
+    mat, scales = _build_matrix(meal_logs)
+    if _totals_kernel is not None and mat.shape[0] > TOTALS_KERNEL_MIN_ROWS:
+        sums = _totals_kernel(mat, scales)
+    else:
+        sums = scales @ mat
+    return sums
+
+class NutritionContext:
+    """
+    Nutrient matrix for a set of meal logs, built once so totals for many subsets
+    (per day of a range, per meal type) are each just a masked matvec.
+    """
+    
+    def __init__(self, meal_logs: List[MealLog]):
+        self.meal_logs = list(meal_logs)
+        if self.meal_logs:
+            self.mat, self.scales = _build_matrix(self.meal_logs)
+        else:
+            self.mat, self.scales = np.zeros((0, len(NUTRIENT_COLS))), np.zeros(0)
+    
+    def totals(self, rows=None) -> NutritionTotals:
+        """Totals over all logs, or the subset selected by a boolean mask / index array into meal_logs"""
+        if rows is None:
+            return NutritionTotals.from_array(self.scales @ self.mat)
+        return NutritionTotals.from_array(self.scales[rows] @ self.mat[rows])
+
+# Postgres materialized view of per-user, per-UTC-day totals for dashboards
+DAILY_NUTRITION_VIEW = "mv_daily_nutrition"
+DAILY_NUTRITION_REFRESH_INTERVAL = 60  # seconds between refreshes when meal logs changed
+DAILY_NUTRITION_MAX_STALENESS = 900    # refresh at least this often regardless
+_daily_nutrition_dirty = threading.Event()
+
+def ensure_daily_nutrition_view(engine) -> bool:
+    """Create mv_daily_nutrition (Postgres only). Returns True if the view is available."""
+    if engine.dialect.name != "postgresql":
+        return False
+    sums = ", ".join(f"SUM(COALESCE(f.{col}, 0) * ml.grams / 100.0) AS {col}" for col in NUTRIENT_COLS)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS {DAILY_NUTRITION_VIEW} AS "
+            f"SELECT ml.user_id, CAST(date_trunc('day', ml.logged_at) AS date) AS day, "
+            f"COUNT(*) AS meals_logged, {sums} "
+            f"FROM meal_logs ml JOIN foods f ON f.id = ml.food_id GROUP BY 1, 2"
+        ))
+        # Unique index is required for REFRESH ... CONCURRENTLY
+        conn.execute(text(
+            f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{DAILY_NUTRITION_VIEW}_user_day ON {DAILY_NUTRITION_VIEW} (user_id, day)"
+        ))
+    return True
+
+@event.listens_for(MealLog, "after_insert")
+@event.listens_for(MealLog, "after_update")
+@event.listens_for(MealLog, "after_delete")
+def _mark_daily_nutrition_dirty(mapper, connection, target):
+    _daily_nutrition_dirty.set()
+
+def start_daily_nutrition_refresher(engine) -> None:
+    """Refresh mv_daily_nutrition in the background, debounced to once per interval after meal-log writes"""
+    def loop():
+        last_refresh = time.monotonic()
+        while True:
+            time.sleep(DAILY_NUTRITION_REFRESH_INTERVAL)
+            if not _daily_nutrition_dirty.is_set() and time.monotonic() - last_refresh < DAILY_NUTRITION_MAX_STALENESS:
+                continue
+            _daily_nutrition_dirty.clear()
+            try:
+                with engine.begin() as conn:
+                    # Only one worker refreshes at a time; the others skip this round
+                    if conn.execute(text(f"SELECT pg_try_advisory_xact_lock(hashtext('{DAILY_NUTRITION_VIEW}'))")).scalar():
+                        conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {DAILY_NUTRITION_VIEW}"))
+                last_refresh = time.monotonic()
+            except Exception as e:
+                print(f"Error refreshing {DAILY_NUTRITION_VIEW}: {e}")
+    
+    threading.Thread(target=loop, name="daily-nutrition-refresh", daemon=True).start()
+
+def get_daily_nutrition_rows(db: Session, user_id: int, start_day: date, end_day: date) -> Dict[date, Dict[str, float]]:
+    """Materialized per-day totals for [start_day, end_day], keyed by day (days without logs are absent)"""
+    rows = db.execute(
+        text(f"SELECT * FROM {DAILY_NUTRITION_VIEW} WHERE user_id = :user_id AND day BETWEEN :start AND :end"),
+        {"user_id": user_id, "start": start_day, "end": end_day}
+    ).mappings()
+    return {row["day"]: dict(row) for row in rows}
+
+def _actual_goal_arrays(totals: NutritionTotals, goals: Dict[str, float]):
+    """Tracked nutrient names with their actual and goal values as float64 arrays"""
+    names = [nutrient for nutrient in goals if hasattr(totals, nutrient)]
+    actual = np.fromiter((getattr(totals, n) for n in names), dtype=np.float64, count=len(names))
+    goal = np.fromiter((goals[n] for n in names), dtype=np.float64, count=len(names))
+    return names, actual, goal
 
 def compare_to_goals(totals: NutritionTotals, goals: Dict[str, float]) -> Dict[str, Dict[str, float]]:
     """Compare nutrition totals to goals and return deltas and percentages"""
-    comparison = {}
+    names, actual, goal = _actual_goal_arrays(totals, goals)
+    if not names:
+        return {}
     
-    for nutrient, goal in goals.items():
-        if hasattr(totals, nutrient):
-            actual = getattr(totals, nutrient)
-            delta = actual - goal
-            percentage = (actual / goal * 100) if goal > 0 else 0
-            
-            comparison[nutrient] = {
-                "actual": actual,
-                "goal": goal,
-                "delta": delta,
-                "percentage": percentage,
-                "met": actual >= goal
-            }
+    # Elementwise over all tracked nutrients at once
+    delta = actual - goal
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentage = np.where(goal > 0, actual / goal * 100, 0.0)
+    met = actual >= goal
     
-    return comparison
+    return {
+        n: {"actual": a, "goal": goals[n], "delta": d, "percentage": p, "met": m}
+        for n, a, d, p, m in zip(names, actual.tolist(), delta.tolist(), percentage.tolist(), met.tolist())
+    }
 
 def get_nutrient_gaps(totals: NutritionTotals, goals: Dict[str, float]) -> List[str]:
     """Get list of nutrients that are below goals"""
-    gaps = []
-    comparison = compare_to_goals(totals, goals)
-    
-    for nutrient, data in comparison.items():
-        if not data["met"]:
-            gaps.append(nutrient)
-    
-    return gaps
+    names, actual, goal = _actual_goal_arrays(totals, goals)
+    # Complement of compare_to_goals' "met" (so a NaN goal still counts as unmet)
+    return [names[i] for i in np.flatnonzero(~(actual >= goal))]
+
+# (section header, ((label, NutritionTotals field, format spec, unit), ...)) in report order
+SUMMARY_SECTIONS = (
+    ("📊 MACRONUTRIENTS:", (
+        ("Calories", "calories", ".1f", " kcal"),
+        ("Protein", "protein_g", ".1f", "g"),
+        ("Fat", "fat_g", ".1f", "g"),
+        ("Carbs", "carbs_g", ".1f", "g"),
+    )),
+    ("🟡 FAT-SOLUBLE VITAMINS:", (
+        ("Vitamin A", "vitamin_a_rae", ".1f", " RAE"),
+        ("Vitamin D", "vitamin_d_iu", ".1f", " IU"),
+        ("Vitamin E", "vitamin_e_mg", ".1f", "mg"),
+        ("Vitamin K", "vitamin_k_mcg", ".1f", "mcg"),
+    )),
+    ("💧 WATER-SOLUBLE VITAMINS:", (
+        ("Vitamin C", "vitamin_c_mg", ".1f", "mg"),
+        ("Thiamin (B1)", "vitamin_b1_mg", ".2f", "mg"),
+        ("Riboflavin (B2)", "vitamin_b2_mg", ".2f", "mg"),
+        ("Niacin (B3)", "vitamin_b3_mg", ".1f", "mg"),
+        ("Pantothenic Acid (B5)", "vitamin_b5_mg", ".1f", "mg"),
+        ("Pyridoxine (B6)", "vitamin_b6_mg", ".2f", "mg"),
+        ("Biotin (B7)", "vitamin_b7_mcg", ".1f", "mcg"),
+        ("Folate (B9)", "vitamin_b9_mcg", ".1f", "mcg"),
+        ("Cobalamin (B12)", "vitamin_b12_mcg", ".2f", "mcg"),
+        ("Choline", "choline_mg", ".1f", "mg"),
+    )),
+    ("⚪ MACROMINERALS:", (
+        ("Calcium", "calcium_mg", ".1f", "mg"),
+        ("Phosphorus", "phosphorus_mg", ".1f", "mg"),
+        ("Magnesium", "magnesium_mg", ".1f", "mg"),
+        ("Sodium", "sodium_mg", ".1f", "mg"),
+        ("Potassium", "potassium_mg", ".1f", "mg"),
+        ("Chloride", "chloride_mg", ".1f", "mg"),
+        ("Sulfur", "sulfur_mg", ".1f", "mg"),
+    )),
+    ("🔍 TRACE MINERALS:", (
+        ("Iron", "iron_mg", ".1f", "mg"),
+        ("Zinc", "zinc_mg", ".1f", "mg"),
+        ("Copper", "copper_mg", ".2f", "mg"),
+        ("Manganese", "manganese_mg", ".1f", "mg"),
+        ("Iodine", "iodine_mcg", ".1f", "mcg"),
+        ("Selenium", "selenium_mcg", ".1f", "mcg"),
+        ("Chromium", "chromium_mcg", ".1f", "mcg"),
+        ("Molybdenum", "molybdenum_mcg", ".1f", "mcg"),
+        ("Fluoride", "fluoride_mg", ".2f", "mg"),
+    )),
+)
 
 def format_nutrition_summary(totals: NutritionTotals, goals: Dict[str, float] = None) -> str:
     """Format nutrition totals into a readable summary"""
-    summary = f"🍎 Comprehensive Nutrition Summary\n"
-    summary += "=" * 40 + "\n\n"
-    
-    # Macronutrients
-    summary += "📊 MACRONUTRIENTS:\n"
-    summary += f"  Calories: {totals.calories:.1f} kcal\n"
-    summary += f"  Protein: {totals.protein_g:.1f}g\n"
-    summary += f"  Fat: {totals.fat_g:.1f}g\n"
-    summary += f"  Carbs: {totals.carbs_g:.1f}g\n\n"
-    
-    # Fat-soluble vitamins
-    summary += "🟡 FAT-SOLUBLE VITAMINS:\n"
-    summary += f"  Vitamin A: {totals.vitamin_a_rae:.1f} RAE\n"
-    summary += f"  Vitamin D: {totals.vitamin_d_iu:.1f} IU\n"
-    summary += f"  Vitamin E: {totals.vitamin_e_mg:.1f}mg\n"
-    summary += f"  Vitamin K: {totals.vitamin_k_mcg:.1f}mcg\n\n"
-    
-    # Water-soluble vitamins
-    summary += "💧 WATER-SOLUBLE VITAMINS:\n"
-    summary += f"  Vitamin C: {totals.vitamin_c_mg:.1f}mg\n"
-    summary += f"  Thiamin (B1): {totals.vitamin_b1_mg:.2f}mg\n"
-    summary += f"  Riboflavin (B2): {totals.vitamin_b2_mg:.2f}mg\n"
-    summary += f"  Niacin (B3): {totals.vitamin_b3_mg:.1f}mg\n"
-    summary += f"  Pantothenic Acid (B5): {totals.vitamin_b5_mg:.1f}mg\n"
-    summary += f"  Pyridoxine (B6): {totals.vitamin_b6_mg:.2f}mg\n"
-    summary += f"  Biotin (B7): {totals.vitamin_b7_mcg:.1f}mcg\n"
-    summary += f"  Folate (B9): {totals.vitamin_b9_mcg:.1f}mcg\n"
-    summary += f"  Cobalamin (B12): {totals.vitamin_b12_mcg:.2f}mcg\n"
-    summary += f"  Choline: {totals.choline_mg:.1f}mg\n\n"
-    
-    # Macrominerals
-    summary += "⚪ MACROMINERALS:\n"
-    summary += f"  Calcium: {totals.calcium_mg:.1f}mg\n"
-    summary += f"  Phosphorus: {totals.phosphorus_mg:.1f}mg\n"
-    summary += f"  Magnesium: {totals.magnesium_mg:.1f}mg\n"
-    summary += f"  Sodium: {totals.sodium_mg:.1f}mg\n"
-    summary += f"  Potassium: {totals.potassium_mg:.1f}mg\n"
-    summary += f"  Chloride: {totals.chloride_mg:.1f}mg\n"
-    summary += f"  Sulfur: {totals.sulfur_mg:.1f}mg\n\n"
-    
-    # Trace minerals
-    summary += "🔍 TRACE MINERALS:\n"
-    summary += f"  Iron: {totals.iron_mg:.1f}mg\n"
-    summary += f"  Zinc: {totals.zinc_mg:.1f}mg\n"
-    summary += f"  Copper: {totals.copper_mg:.2f}mg\n"
-    summary += f"  Manganese: {totals.manganese_mg:.1f}mg\n"
-    summary += f"  Iodine: {totals.iodine_mcg:.1f}mcg\n"
-    summary += f"  Selenium: {totals.selenium_mcg:.1f}mcg\n"
-    summary += f"  Chromium: {totals.chromium_mcg:.1f}mcg\n"
-    summary += f"  Molybdenum: {totals.molybdenum_mcg:.1f}mcg\n"
-    summary += f"  Fluoride: {totals.fluoride_mg:.2f}mg\n\n"
+    # Collect lines and join once rather than growing a string with +=
+    lines = ["🍎 Comprehensive Nutrition Summary", "=" * 40, ""]
+    for header, rows in SUMMARY_SECTIONS:
+        lines.append(header)
+        lines.extend(f"  {label}: {getattr(totals, attr):{fmt}}{unit}" for label, attr, fmt, unit in rows)
+        lines.append("")
     
     if goals:
         comparison = compare_to_goals(totals, goals)
-        summary += "🎯 GOAL PROGRESS:\n"
-        summary += "=" * 30 + "\n"
+        lines.append("🎯 GOAL PROGRESS:")
+        lines.append("=" * 30)
         for nutrient, data in comparison.items():
             status = "✅" if data["met"] else "❌"
-            summary += f"{status} {nutrient}: {data['actual']:.1f}/{data['goal']:.1f} ({data['percentage']:.1f}%)\n"
+            lines.append(f"{status} {nutrient}: {data['actual']:.1f}/{data['goal']:.1f} ({data['percentage']:.1f}%)")
+        lines.append("")
     
-    return summary
+    return "\n".join(lines) + ("" if goals else "\n")
@@ -1,8 +1,72 @@
 """
 Nutrition goal calculation and management.
 """
+import threading
 from typing import Dict, Optional
-from app.models import User
+import numpy as np
+from cachetools import LRUCache, TTLCache
+from sqlalchemy import select, update, delete, event, inspect
+from sqlalchemy.orm import Session, object_session
+from app.db import run_after_commit
+from app.models import User, AdvancedGoalSettings, DailyGoalCache
+
+# Macro goals are a pure function of a handful of profile fields, so memoize on those
+_macro_goals_cache: LRUCache = LRUCache(maxsize=4096)
+_macro_goals_lock = threading.Lock()
+
+# In-process L1 in front of the daily_goal_cache table, keyed by (user_id, goal_date).
+# Per worker; the TTL bounds how long another worker's invalidation can go unseen.
+_daily_goals_cache: TTLCache = TTLCache(maxsize=10_000, ttl=300)
+_daily_goals_lock = threading.Lock()
+
+# Inputs to advanced_goal_calculator; changing any of them invalidates a user's cached daily goals
+_USER_GOAL_INPUTS = ('weight_kg', 'height_cm', 'age', 'gender', 'activity_level', 'goal_type')
+_SETTINGS_GOAL_INPUTS = ('goal_type', 'training_schedule', 'carb_cycling_pattern', 'custom_protein_ratio',
+                         'custom_fat_ratio', 'custom_carb_ratio', 'custom_schedule')
+
+def get_cached_daily_goals(user_id: int, goal_date) -> Optional[dict]:
+    """Daily goals payload from the in-process cache, or None"""
+    with _daily_goals_lock:
+        return _daily_goals_cache.get((user_id, goal_date))
+
+def cache_daily_goals(user_id: int, goal_date, payload: dict) -> None:
+    with _daily_goals_lock:
+        _daily_goals_cache[(user_id, goal_date)] = payload
+
+def _forget_daily_goals(user_id: int) -> None:
+    with _daily_goals_lock:
+        for key in [k for k in _daily_goals_cache if k[0] == user_id]:
+            del _daily_goals_cache[key]
+
+def invalidate_daily_goals(connection, target, user_id: int) -> None:
+    """
+    Drop a user's cached daily goals: the daily_goal_cache rows in this flush, the in-process
+    entries once it commits (clearing them earlier lets a concurrent read refill from the old rows)
+    """
+    connection.execute(delete(DailyGoalCache).where(DailyGoalCache.user_id == user_id))
+    session = object_session(target)
+    if session is not None:
+        run_after_commit(session, lambda: _forget_daily_goals(user_id))
+    else:
+        _forget_daily_goals(user_id)
+
+def _goal_inputs_changed(target, attrs) -> bool:
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in attrs)
+
+@event.listens_for(User, "after_update")
+def _invalidate_goals_on_profile_change(mapper, connection, target):
+    if _goal_inputs_changed(target, _USER_GOAL_INPUTS):
+        invalidate_daily_goals(connection, target, target.id)
+
+@event.listens_for(AdvancedGoalSettings, "after_insert")
+def _invalidate_goals_on_settings_created(mapper, connection, target):
+    invalidate_daily_goals(connection, target, target.user_id)
+
+@event.listens_for(AdvancedGoalSettings, "after_update")
+def _invalidate_goals_on_settings_change(mapper, connection, target):
+    if _goal_inputs_changed(target, _SETTINGS_GOAL_INPUTS):
+        invalidate_daily_goals(connection, target, target.user_id)
 
 class NutritionGoalCalculator:
     """Calculate nutrition goals based on user profile."""
@@ -16,6 +80,30 @@ class NutritionGoalCalculator:
         'very_active': 1.9    # Very hard exercise, physical job
     }
     
+    # Daily calorie adjustment by goal type
+    GOAL_ADJUSTMENTS = {
+        'lose_weight': -500,    # 1 lb per week
+        'gain_weight': 500,     # 1 lb per week
+        'muscle_gain': 300,     # Lean bulk
+        'maintain': 0
+    }
+    
+    # Default macro ratios based on goal type
+    MACRO_RATIOS = {
+        'lose_weight': {'protein': 0.30, 'fat': 0.25, 'carbs': 0.45},
+        'gain_weight': {'protein': 0.25, 'fat': 0.30, 'carbs': 0.45},
+        'muscle_gain': {'protein': 0.30, 'fat': 0.25, 'carbs': 0.45},
+        'maintain': {'protein': 0.25, 'fat': 0.30, 'carbs': 0.45}
+    }
+    
+    # Micronutrient goals by (female?, over 50?) - simplified RDA overrides applied by update_user_goals
+    MICRO_GOALS = {
+        (True, False): (('goal_iron_mg', 18.0), ('goal_calcium_mg', 1000.0)),
+        (True, True): (('goal_iron_mg', 18.0), ('goal_calcium_mg', 1200.0)),
+        (False, False): (('goal_iron_mg', 8.0), ('goal_calcium_mg', 1000.0)),
+        (False, True): (('goal_iron_mg', 8.0), ('goal_calcium_mg', 1200.0)),
+    }
+    
     def calculate_bmr(self, user: User) -> Optional[float]:
         """Calculate Basal Metabolic Rate using Mifflin-St Jeor Equation."""
         if not all([user.age, user.weight_kg, user.height_cm, user.gender]):
@@ -48,31 +136,27 @@ class NutritionGoalCalculator:
         if not tdee:
             return None
             
-        goal_adjustments = {
-            'lose_weight': -500,    # 1 lb per week
-            'gain_weight': 500,     # 1 lb per week
-            'muscle_gain': 300,     # Lean bulk
-            'maintain': 0
-        }
-        
-        adjustment = goal_adjustments.get(user.goal_type, 0)
+        adjustment = self.GOAL_ADJUSTMENTS.get(user.goal_type, 0)
         return tdee + adjustment
     
     def calculate_macro_goals(self, user: User) -> Dict[str, float]:
-        """Calculate macronutrient goals based on calorie goal."""
+        """Calculate macronutrient goals based on calorie goal (memoized on the profile fields used)."""
+        key = (user.goal_calories, user.age, user.weight_kg, user.height_cm,
+               user.gender, user.activity_level, user.goal_type)
+        with _macro_goals_lock:
+            cached = _macro_goals_cache.get(key)
+        if cached is None:
+            cached = self._calculate_macro_goals(user)
+            with _macro_goals_lock:
+                _macro_goals_cache[key] = cached
+        return dict(cached)
+    
+    def _calculate_macro_goals(self, user: User) -> Dict[str, float]:
         calorie_goal = user.goal_calories or self.calculate_calorie_goal(user)
         if not calorie_goal:
             return {}
         
-        # Default macro ratios based on goal type
-        macro_ratios = {
-            'lose_weight': {'protein': 0.30, 'fat': 0.25, 'carbs': 0.45},
-            'gain_weight': {'protein': 0.25, 'fat': 0.30, 'carbs': 0.45},
-            'muscle_gain': {'protein': 0.30, 'fat': 0.25, 'carbs': 0.45},
-            'maintain': {'protein': 0.25, 'fat': 0.30, 'carbs': 0.45}
-        }
-        
-        ratios = macro_ratios.get(user.goal_type, macro_ratios['maintain'])
+        ratios = self.MACRO_RATIOS.get(user.goal_type, self.MACRO_RATIOS['maintain'])
         
         return {
             'calories': calorie_goal,
@@ -91,18 +175,81 @@ class NutritionGoalCalculator:
                 user.goal_fat_g = macro_goals['fat_g']
                 user.goal_carbs_g = macro_goals['carbs_g']
         
-        # Set micronutrient goals based on age/gender (simplified)
-        if user.gender == 'female':
-            user.goal_iron_mg = 18.0
-            user.goal_calcium_mg = 1000.0
-        else:
-            user.goal_iron_mg = 8.0
-            user.goal_calcium_mg = 1000.0
-            
-        if user.age and user.age > 50:
-            user.goal_calcium_mg = 1200.0
+        # Set micronutrient goals based on age/gender; only assign changed values so a
+        # no-op call doesn't put the user in session.dirty (and run its update listeners on flush)
+        key = (user.gender == 'female', bool(user.age and user.age > 50))
+        for attr, value in self.MICRO_GOALS[key]:
+            if getattr(user, attr) != value:
+                setattr(user, attr, value)
             
         return user
+    
+    def bulk_recompute_goals(self, session: Session) -> int:
+        """
+        Apply update_user_goals to every user at once: one SELECT of the profile columns, the
+        same formulas over NumPy arrays, and one bulk UPDATE of the rows whose goals changed.
+        Returns the number of users updated; the caller commits.
+        """
+        rows = session.execute(select(
+            User.id, User.age, User.weight_kg, User.height_cm, User.gender, User.activity_level, User.goal_type,
+            User.goal_calories, User.goal_protein_g, User.goal_fat_g, User.goal_carbs_g,
+            User.goal_iron_mg, User.goal_calcium_mg,
+        )).all()
+        if not rows:
+            return 0
+        (ids, ages, weights, heights, genders, activities, goal_types,
+         calories0, protein0, fat0, carbs0, iron0, calcium0) = zip(*rows)
+        
+        # None -> NaN; nan_to_num(x) != 0 mirrors the scalar path's truthiness checks
+        age = np.array(ages, dtype=np.float64)
+        weight = np.array(weights, dtype=np.float64)
+        height = np.array(heights, dtype=np.float64)
+        gender = [(g or '').lower() for g in genders]
+        is_male = np.array([g == 'male' for g in gender])
+        is_female = np.array([g == 'female' for g in gender])
+        
+        # Mifflin-St Jeor, evaluated exactly as calculate_bmr does per branch
+        base = 10 * weight + 6.25 * height - 5 * age
+        bmr = np.where(is_male, base + 5, np.where(is_female, base - 161, ((base + 5) + (base - 161)) / 2))
+        has_profile = ((np.nan_to_num(age) != 0) & (np.nan_to_num(weight) != 0) & (np.nan_to_num(height) != 0)
+                       & np.array([bool(g) for g in gender]))
+        multiplier = np.array([self.ACTIVITY_MULTIPLIERS.get(a, 1.2) for a in activities])
+        tdee = bmr * multiplier
+        calories = tdee + np.array([self.GOAL_ADJUSTMENTS.get(t, 0) for t in goal_types], dtype=np.float64)
+        
+        # Macros only for users without a manually set calorie goal
+        auto = (has_profile & (np.nan_to_num(bmr) != 0) & (np.nan_to_num(tdee) != 0) & (np.nan_to_num(calories) != 0)
+                & (np.nan_to_num(np.array(calories0, dtype=np.float64)) == 0))
+        ratios = [self.MACRO_RATIOS.get(t, self.MACRO_RATIOS['maintain']) for t in goal_types]
+        protein = calories * np.array([r['protein'] for r in ratios]) / 4
+        fat = calories * np.array([r['fat'] for r in ratios]) / 9
+        carbs = calories * np.array([r['carbs'] for r in ratios]) / 4
+        
+        over_50 = np.nan_to_num(age) > 50
+        iron = np.where(np.array([g == 'female' for g in genders]), 18.0, 8.0)
+        calcium = np.where(over_50, 1200.0, 1000.0)
+        
+        mappings = []
+        for i, user_id in enumerate(ids):
+            changes = {}
+            if auto[i]:
+                new_macros = (('goal_calories', calories[i], calories0[i]), ('goal_protein_g', protein[i], protein0[i]),
+                              ('goal_fat_g', fat[i], fat0[i]), ('goal_carbs_g', carbs[i], carbs0[i]))
+                for attr, value, current in new_macros:
+                    if current != value:
+                        changes[attr] = float(value)
+            if iron0[i] != iron[i]:
+                changes['goal_iron_mg'] = float(iron[i])
+            if calcium0[i] != calcium[i]:
+                changes['goal_calcium_mg'] = float(calcium[i])
+            if changes:
+                changes['id'] = user_id
+                mappings.append(changes)
+        
+        if mappings:
+            # ORM bulk UPDATE by primary key: executemany without loading User objects
+            session.execute(update(User), mappings)
+        return len(mappings)
 
 # Global instance
 goal_calculator = NutritionGoalCalculator()
@@ -34,7 +34,9 @@ class Recipe(Base):
     
     # Relationships
     user = relationship("User")
-    ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan")
+    # Ingredients are read whenever a recipe is: load them with one IN query per batch of recipes
+    ingredients = relationship("RecipeIngredient", back_populates="recipe", cascade="all, delete-orphan",
+                               lazy="selectin")
 
 class RecipeIngredient(Base):
     __tablename__ = "recipe_ingredients"
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
@@ -14,8 +14,7 @@ class User(UserBase):
     prefs: Dict[str, Any] = {}
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class FoodBase(BaseModel):
     name: str
@@ -115,8 +114,7 @@ class Food(FoodBase):
     
     created_at: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class MealLogBase(BaseModel):
     food_id: int
@@ -136,8 +134,7 @@ class MealLog(BaseModel):
     logged_at: datetime
     food_name: Optional[str] = None
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 class AgentRequest(BaseModel):
     user_id: int
@@ -193,6 +190,11 @@ class NutritionTotals(BaseModel):
     chromium_mcg: float = 0.0
     molybdenum_mcg: float = 0.0
     fluoride_mg: float = 0.0
+    
+    @classmethod
+    def from_array(cls, values) -> "NutritionTotals":
+        """Build from a vector of sums in field order (models.NUTRIENT_COLS), skipping per-field validation"""
+        return cls.model_construct(**dict(zip(cls.model_fields, values.tolist())))
 
 # ---- Structured /agent response schemas ----
 class FoodCandidate(BaseModel):
@@ -0,0 +1,47 @@
+"""
+Redis-backed L2 cache shared by all workers for external lookups (USDA, barcode APIs).
+Disabled when REDIS_URL is unset or redis is not installed; every call then goes straight to the loader.
+"""
+import os
+from typing import Any, Callable, Optional
+import orjson
+
+SUCCESS_TTL = int(os.getenv("L2_CACHE_TTL", str(24 * 3600)))
+# Short TTL for empty results so missing products don't re-hammer upstream, but new ones show up soon
+EMPTY_TTL = int(os.getenv("L2_CACHE_EMPTY_TTL", "300"))
+
+_redis = None
+if os.getenv("REDIS_URL"):
+    try:
+        import redis
+        _redis = redis.Redis.from_url(
+            os.getenv("REDIS_URL"),
+            socket_timeout=0.2,
+            socket_connect_timeout=0.2,
+        )
+    except ImportError:
+        _redis = None
+
+def cached(key: str, loader: Callable[[], Any], ttl: int = SUCCESS_TTL, empty_ttl: int = EMPTY_TTL,
+           is_empty: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Return the JSON value stored at key, or call loader() and store its result.
+    Redis errors fall through to the loader; exceptions from loader() propagate and are not cached.
+    """
+    if _redis is None:
+        return loader()
+    try:
+        raw = _redis.get(key)
+    except Exception as e:
+        print(f"L2 cache get failed for {key}: {e}")
+        raw = None
+    if raw is not None:
+        return orjson.loads(raw)
+
+    value = loader()
+    empty = is_empty(value) if is_empty else not value
+    try:
+        _redis.setex(key, empty_ttl if empty else ttl, orjson.dumps(value))
+    except Exception as e:
+        print(f"L2 cache set failed for {key}: {e}")
+    return value
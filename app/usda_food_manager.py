@@ -1,11 +1,24 @@
 """
 Manager for handling USDA food integration with local database.
 """
+import threading
 from sqlalchemy.orm import Session
-from typing import Dict, Optional
-from app.models import Food
+from typing import Dict, List, Optional
+from cachetools import LRUCache
+from app.db import engine
+from app.models import Food, NUTRIENT_COLS, pack_nutrients
 from app.food_api import usda_api
 
+# usda_fdc_id -> local Food.id; the mapping never changes once the row exists.
+# Stores ids, not instances, so nothing is tied to a closed session.
+_food_id_cache: LRUCache = LRUCache(maxsize=10_000)
+_food_id_lock = threading.Lock()
+
+def _remember_food_ids(foods) -> None:
+    with _food_id_lock:
+        for food in foods:
+            _food_id_cache[food.usda_fdc_id] = food.id
+
 class USDAFoodManager:
     """Manages the integration of USDA foods with local database."""
     
@@ -20,18 +33,68 @@ class USDAFoodManager:
         Returns:
             Food: Local database Food object
         """
-        usda_fdc_id = abs(usda_food_data.get('id', 0))  # Remove negative sign
+        return self.bulk_get_or_create_foods(db, [usda_food_data])[0]
+    
+    def bulk_get_or_create_foods(self, db: Session, usda_food_data_list: List[Dict]) -> List[Food]:
+        """
+        Get or create Foods for many USDA foods: cached ids by primary key, one SELECT for the
+        other stored ones, one INSERT ... ON CONFLICT DO NOTHING RETURNING for the rest and a single commit.
+        
+        Returns:
+            List[Food]: Local Food objects in the same order as the input
+        """
+        fdc_ids = [abs(data.get('id', 0)) for data in usda_food_data_list]  # Remove negative sign
+        if not fdc_ids:
+            return []
+        
+        # Check which USDA foods we already have in our local database
+        foods = self._stored_foods(db, fdc_ids)
         
-        # Check if we already have this USDA food in our local database
-        existing_food = db.query(Food).filter(Food.usda_fdc_id == usda_fdc_id).first()
-        if existing_food:
-            return existing_food
+        missing = {}
+        for usda_fdc_id, usda_food_data in zip(fdc_ids, usda_food_data_list):
+            if usda_fdc_id not in foods and usda_fdc_id not in missing:
+                missing[usda_fdc_id] = self._food_values(usda_fdc_id, usda_food_data)
+        
+        if missing:
+            if engine.dialect.name == "postgresql":
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            
+            # One INSERT for all misses; rows a concurrent request inserted first are skipped, not errors
+            stmt = (
+                dialect_insert(Food)
+                .values(list(missing.values()))
+                .on_conflict_do_nothing(index_elements=['usda_fdc_id'])
+                .returning(Food)
+            )
+            # RETURNING hands back complete rows, so skip expire-on-commit:
+            # otherwise the first attribute read re-SELECTs each new food
+            expire_on_commit = db.expire_on_commit
+            db.expire_on_commit = False
+            try:
+                for food in db.scalars(stmt):
+                    foods[food.usda_fdc_id] = food
+                raced = [usda_fdc_id for usda_fdc_id in missing if usda_fdc_id not in foods]
+                if raced:
+                    foods.update(
+                        (food.usda_fdc_id, food)
+                        for food in db.query(Food).filter(Food.usda_fdc_id.in_(raced))
+                    )
+                db.commit()
+            finally:
+                db.expire_on_commit = expire_on_commit
         
-        # Create new Food entry from USDA data
-        food = Food(
+        _remember_food_ids(foods.values())
+        return [foods[usda_fdc_id] for usda_fdc_id in fdc_ids]
+    
+    def _food_values(self, usda_fdc_id: int, usda_food_data: Dict) -> Dict:
+        """Column values for a new Food entry from USDA data"""
+        values = dict(
             name=usda_food_data.get('name', 'Unknown Food'),
             brand=usda_food_data.get('brand', 'Generic'),
-            upc=usda_food_data.get('upc', ''),
+            # No GTIN -> NULL, so several UPC-less foods don't collide on the unique upc index
+            upc=usda_food_data.get('upc') or None,
             
             # Nutrition data
             calories=usda_food_data.get('calories', 0),
@@ -57,17 +120,41 @@ class USDAFoodManager:
             data_source='usda',
             publication_date=usda_food_data.get('publication_date', '')
         )
+        # Core INSERT skips the ORM listener that normally packs this
+        values['nutrients_blob'] = pack_nutrients([values.get(col) for col in NUTRIENT_COLS])
+        return values
+    
+    def _stored_foods(self, db: Session, fdc_ids: List[int]) -> Dict[int, Food]:
+        """
+        Stored Foods by usda_fdc_id. Ids seen before resolve by primary key (free when already in
+        the session's identity map); only the rest go to one usda_fdc_id IN (...) query.
+        """
+        unique_ids = set(fdc_ids)
+        with _food_id_lock:
+            cached = {usda_fdc_id: _food_id_cache.get(usda_fdc_id) for usda_fdc_id in unique_ids}
         
-        db.add(food)
-        db.commit()
-        db.refresh(food)
+        foods = {}
+        for usda_fdc_id, food_id in cached.items():
+            if food_id is None:
+                continue
+            food = db.get(Food, food_id)
+            if food is not None and food.usda_fdc_id == usda_fdc_id:
+                foods[usda_fdc_id] = food
+            else:
+                with _food_id_lock:
+                    _food_id_cache.pop(usda_fdc_id, None)  # row was deleted
         
-        return food
+        remaining = unique_ids.difference(foods)
+        if remaining:
+            found = db.query(Food).filter(Food.usda_fdc_id.in_(remaining)).all()
+            _remember_food_ids(found)
+            foods.update((food.usda_fdc_id, food) for food in found)
+        return foods
     
     def get_food_by_usda_id(self, db: Session, usda_id: int) -> Optional[Food]:
         """Get a food by its USDA FDC ID."""
         usda_fdc_id = abs(usda_id)  # Remove negative sign
-        return db.query(Food).filter(Food.usda_fdc_id == usda_fdc_id).first()
+        return self._stored_foods(db, [usda_fdc_id]).get(usda_fdc_id)
     
     def fetch_and_store_usda_food(self, db: Session, usda_id: int) -> Optional[Food]:
         """
@@ -80,23 +167,38 @@ class USDAFoodManager:
         Returns:
             Food: Local database Food object or None if not found
         """
-        usda_fdc_id = abs(usda_id)  # Remove negative sign
+        return self.fetch_and_store_many(db, [usda_id])[0]
+    
+    def fetch_and_store_many(self, db: Session, usda_ids: List[int]) -> List[Optional[Food]]:
+        """
+        Fetch and store many USDA foods: stored ones resolved as in _stored_foods, concurrent
+        detail requests for the rest on the shared USDA pool, then a single bulk insert.
         
-        # Check if already exists
-        existing = self.get_food_by_usda_id(db, usda_fdc_id)
-        if existing:
-            return existing
+        Returns:
+            List[Optional[Food]]: Food objects in input order, None where USDA has no such food
+        """
+        fdc_ids = [abs(usda_id) for usda_id in usda_ids]  # Remove negative sign
+        if not fdc_ids:
+            return []
         
-        # Fetch from USDA API
-        usda_food_raw = usda_api.get_food_details(usda_fdc_id)
-        if not usda_food_raw:
-            return None
+        foods = self._stored_foods(db, fdc_ids)
         
-        # Normalize and store
-        usda_food_data = usda_api.normalize_food_data(usda_food_raw)
-        usda_food_data['id'] = usda_fdc_id  # Ensure positive ID
+        missing = list(dict.fromkeys(fdc_id for fdc_id in fdc_ids if fdc_id not in foods))
+        if missing:
+            # Network-bound: overlap the requests instead of paying each round trip in turn
+            raw_foods = usda_api._detail_pool.map(usda_api.get_food_details, missing)
+            normalized = []
+            for usda_fdc_id, usda_food_raw in zip(missing, raw_foods):
+                if not usda_food_raw:
+                    continue
+                usda_food_data = usda_api.normalize_food_data(usda_food_raw)
+                usda_food_data['id'] = usda_fdc_id  # Ensure positive ID
+                normalized.append(usda_food_data)
+            
+            for food in self.bulk_get_or_create_foods(db, normalized):
+                foods[food.usda_fdc_id] = food
         
-        return self.get_or_create_food(db, usda_food_data)
+        return [foods.get(fdc_id) for fdc_id in fdc_ids]
 
 # Global instance
 usda_food_manager = USDAFoodManager()
@@ -6,15 +6,22 @@ Quick local runner for testing the agent workflow
 
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app.db import create_tables
-from agentic.graph import run_agent
+from agentic.graph import get_graph, run_agent
 from agentic.observability import setup_langsmith
 
+def _run_test_case(test_case, dependency=None):
+    """Run one test case, first waiting for the case it depends on (its errors are reported there)"""
+    if dependency is not None:
+        dependency.exception()
+    return run_agent(test_case['user_id'], test_case['message'])
+
 def main():
     """Main runner function"""
     load_dotenv()
@@ -30,24 +37,34 @@ def main():
 
     # Test the agent workflow
     print("\n🤖 Testing agent workflow...")
+    # Compile the graph (and construct its LLM clients) once up front, not inside the first test case
+    get_graph()
 
-    # Sample test cases
+    # Sample test cases; "after" is the index of a case whose write this one must see
     test_cases = [
         {"user_id": 1, "message": "search oats", "description": "Search for oats"},
         {"user_id": 1, "message": "log meal: 100g food_id=1", "description": "Log a meal"},
-        {"user_id": 1, "message": "daily summary today", "description": "Get daily summary"},
+        {"user_id": 1, "message": "daily summary today", "description": "Get daily summary", "after": 1},
     ]
 
-    for i, test_case in enumerate(test_cases, 1):
-        print(f"\n--- Test {i}: {test_case['description']} ---")
-        print(f"Input: {test_case['message']}")
-        try:
-            result = run_agent(test_case['user_id'], test_case['message'])
-            print(f"Intent: {result.get('intent', 'unknown')}")
-            print(f"Response: {result.get('response', 'No response')}")
-            print(f"Confidence: {result.get('confidence', 0.0):.2f}")
-        except Exception as e:
-            print(f"❌ Error: {e}")
+    # Agent calls are network-bound, so independent cases overlap instead of queueing
+    with ThreadPoolExecutor(max_workers=len(test_cases)) as executor:
+        futures = []
+        for test_case in test_cases:
+            dependency = futures[test_case["after"]] if "after" in test_case else None
+            futures.append(executor.submit(_run_test_case, test_case, dependency))
+
+        # Report in the original order
+        for i, (test_case, future) in enumerate(zip(test_cases, futures), 1):
+            print(f"\n--- Test {i}: {test_case['description']} ---")
+            print(f"Input: {test_case['message']}")
+            try:
+                result = future.result()
+                print(f"Intent: {result.get('intent', 'unknown')}")
+                print(f"Response: {result.get('response', 'No response')}")
+                print(f"Confidence: {result.get('confidence', 0.0):.2f}")
+            except Exception as e:
+                print(f"❌ Error: {e}")
 
     print("\n🚀 Ready to run Flask server!")
     print("Run: export FLASK_APP=app.api && flask run")
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Recompute every user's auto-calculated nutrition goals (e.g. after changing the goal formulas)
+"""
+
+import os
+import sys
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db import SessionLocal
+from app.nutrition_goals import goal_calculator
+
+def recompute_goals():
+    """Apply the current goal formulas to all users in one bulk UPDATE"""
+    db = SessionLocal()
+    
+    try:
+        updated = goal_calculator.bulk_recompute_goals(db)
+        db.commit()
+        print(f"🎯 Updated goals for {updated} users")
+        
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Error recomputing goals: {e}")
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    recompute_goals()
@@ -13,6 +13,13 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.db import SessionLocal, create_tables
 from app.models import User, Food
 
+# Rows per bulk INSERT/commit, so memory stays flat as foods_data grows
+SEED_BATCH_SIZE = 1000
+
+def _chunks(seq, n=SEED_BATCH_SIZE):
+    for i in range(0, len(seq), n):
+        yield seq[i:i + n]
+
 def seed_database():
     """Seed the database with sample data"""
     db = SessionLocal()
@@ -266,17 +273,21 @@ def seed_database():
             }
         ]
         
-        # Add foods to database
+        # Find already-seeded foods with one query, then insert the rest in one bulk INSERT
+        upcs = [food_data["upc"] for food_data in foods_data]
+        existing_upcs = {upc for (upc,) in db.query(Food.upc).filter(Food.upc.in_(upcs))}
+        to_insert = []
         for food_data in foods_data:
-            existing_food = db.query(Food).filter(Food.upc == food_data["upc"]).first()
-            if not existing_food:
-                food = Food(**food_data)
-                db.add(food)
-                print(f"✅ Added {food_data['name']}")
-            else:
+            if food_data["upc"] in existing_upcs:
                 print(f"⏭️  {food_data['name']} already exists")
+            else:
+                to_insert.append(food_data)
+                print(f"✅ Added {food_data['name']}")
+        for batch in _chunks(to_insert):
+            db.bulk_insert_mappings(Food, batch)
+            db.commit()
         
-        # Commit changes
+        # Commit changes (demo user, if nothing else was inserted)
         db.commit()
         print("\n🎉 Database seeded successfully!")
         print(f"📊 Added {len(foods_data)} food items")
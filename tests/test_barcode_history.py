@@ -0,0 +1,20 @@
+import base64
+
+import pytest
+
+
+def _b64(text):
+    return base64.urlsafe_b64encode(text.encode()).decode()
+
+
+@pytest.mark.parametrize("cursor", ["%%%not-base64", _b64("no-separator"), _b64("yesterday|7"), _b64("2024-01-01T00:00:00|x")])
+def test_history_rejects_malformed_cursor(client, cursor):
+    resp = client.get("/barcode/history/1", query_string={"cursor": cursor})
+
+    assert resp.status_code == 400
+
+
+def test_history_without_cursor(client):
+    resp = client.get("/barcode/history/1")
+
+    assert resp.status_code == 200
@@ -0,0 +1,35 @@
+import threading
+
+from app.barcode_scanner import BarcodeHistoryManager
+from app.models import BarcodeHistory, User
+
+
+def _row(upc):
+    return {'user_id': 1, 'upc': upc, 'success': True, 'product_name': None, 'brand': None,
+            'source': None, 'scanned_at': None}
+
+
+def test_history_write_does_not_commit_request_session(db):
+    manager = BarcodeHistoryManager()
+    db.add(User(username="pending", email="pending@example.com"))
+    db.flush()
+
+    # The writer runs on its own thread (and connection) while the request transaction is open
+    writer = threading.Thread(target=manager._write_rows, args=([_row("036000291452")],))
+    writer.start()
+    db.rollback()
+    writer.join(timeout=30)
+
+    assert db.query(User).filter(User.username == "pending").count() == 0
+    assert db.query(BarcodeHistory).filter(BarcodeHistory.upc == "036000291452").count() == 1
+
+
+def test_flush_stops_writer_and_writes_queued_scans(db):
+    manager = BarcodeHistoryManager()
+    for i in range(5):
+        manager.record_scan(f"00000000000{i}", False, user_id=1)
+
+    manager.flush()
+
+    assert not manager._writer.is_alive()
+    assert db.query(BarcodeHistory).count() == 5
@@ -0,0 +1,41 @@
+import time
+
+import app.barcode_scanner as barcode_scanner
+from app.barcode_scanner import barcode_api
+
+OFF_PRODUCT = {"name": "From OFF", "source": "OpenFoodFacts"}
+UPC_PRODUCT = {"name": "From UPCItemDB", "source": "UPCItemDB"}
+
+
+def _count_upcitemdb(monkeypatch, result):
+    calls = []
+    def fetch(upc):
+        calls.append(upc)
+        return result
+    monkeypatch.setattr(barcode_api, "_fetch_upcitemdb", fetch)
+    return calls
+
+
+def test_upcitemdb_skipped_when_openfoodfacts_answers(monkeypatch):
+    monkeypatch.setattr(barcode_api, "_fetch_openfoodfacts", lambda upc: OFF_PRODUCT)
+    calls = _count_upcitemdb(monkeypatch, UPC_PRODUCT)
+
+    assert barcode_api._lookup_upstream("036000291452") == OFF_PRODUCT
+    assert calls == []
+
+
+def test_upcitemdb_used_when_openfoodfacts_misses(monkeypatch):
+    monkeypatch.setattr(barcode_api, "_fetch_openfoodfacts", lambda upc: None)
+    calls = _count_upcitemdb(monkeypatch, UPC_PRODUCT)
+
+    assert barcode_api._lookup_upstream("036000291452") == UPC_PRODUCT
+    assert calls == ["036000291452"]
+
+
+def test_slow_openfoodfacts_is_hedged_but_keeps_priority(monkeypatch):
+    monkeypatch.setattr(barcode_scanner, "UPCITEMDB_HEDGE_DELAY", 0.01)
+    monkeypatch.setattr(barcode_api, "_fetch_openfoodfacts", lambda upc: time.sleep(0.1) or OFF_PRODUCT)
+    calls = _count_upcitemdb(monkeypatch, UPC_PRODUCT)
+
+    assert barcode_api._lookup_upstream("036000291452") == OFF_PRODUCT
+    assert calls == ["036000291452"]
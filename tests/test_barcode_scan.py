@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+import app.api as api
+from app.barcode_scanner import barcode_api
+from app.db import SessionLocal
+from app.models import Food, NUTRIENT_COLS, unpack_nutrients
+from app.nutrition import food_nutrient_matrix
+
+UPC = "036000291452"
+CALORIES = NUTRIENT_COLS.index("calories")
+IRON = NUTRIENT_COLS.index("iron_mg")
+
+
+def _product(calories, iron_mg):
+    return {
+        "name": "Test Cereal",
+        "brand": "Acme",
+        "source": "test",
+        "nutrition": {"calories": calories, "protein_g": 10, "fat_g": 2, "carbs_g": 70,
+                      "fiber_g": 8, "iron_mg": iron_mg},
+    }
+
+
+@pytest.fixture(autouse=True)
+def _fresh_upc_cache():
+    with api._UPC_CACHE_LOCK:
+        api.UPC_CACHE.clear()
+
+
+def test_scan_saves_food_with_blob(client, db, monkeypatch):
+    monkeypatch.setattr(barcode_api, "lookup_product", lambda upc: _product(350, 12))
+
+    resp = client.post("/barcode/scan", json={"upc": UPC, "user_id": 1})
+
+    assert resp.status_code == 200
+    food = db.query(Food).filter(Food.upc == UPC).one()
+    assert resp.get_json()["product"]["food_id"] == food.id
+    blob = unpack_nutrients(food.nutrients_blob)
+    assert blob[CALORIES] == 350
+    assert blob[IRON] == 12
+
+
+def test_scan_upsert_refreshes_blob_and_cached_vectors(client, db, monkeypatch):
+    def lookup_after_concurrent_insert(upc):
+        # Another request saved this UPC between our local lookup and our upsert
+        with SessionLocal() as other:
+            food = Food(name="Test Cereal", brand="Acme", upc=upc, calories=100, iron_mg=1)
+            other.add(food)
+            other.commit()
+            food_nutrient_matrix(other, [food.id])  # warm the per-food vector cache with the old values
+        return _product(350, 12)
+
+    monkeypatch.setattr(barcode_api, "lookup_product", lookup_after_concurrent_insert)
+
+    resp = client.post("/barcode/scan", json={"upc": UPC, "user_id": 1})
+
+    assert resp.status_code == 200
+    food = db.query(Food).filter(Food.upc == UPC).one()
+    assert food.calories == 350
+    columns = np.nan_to_num(np.array([getattr(food, col) for col in NUTRIENT_COLS], dtype=np.float64))
+    np.testing.assert_array_equal(unpack_nutrients(food.nutrients_blob), columns)
+    vector = food_nutrient_matrix(db, [food.id])[0]
+    assert vector[CALORIES] == 350
+    assert vector[IRON] == 12
+
+
+def test_unsaved_scan_is_not_cached(client, db, monkeypatch):
+    monkeypatch.setattr(barcode_api, "lookup_product", lambda upc: _product(350, 12))
+
+    client.post("/barcode/scan", json={"upc": UPC, "user_id": 1, "save_to_db": False})
+    assert db.query(Food).filter(Food.upc == UPC).count() == 0
+
+    resp = client.post("/barcode/scan", json={"upc": UPC, "user_id": 1})
+
+    food = db.query(Food).filter(Food.upc == UPC).one()
+    assert resp.get_json()["product"]["food_id"] == food.id
+
+
+def test_local_scan_cache_follows_food_changes(client, db, monkeypatch):
+    monkeypatch.setattr(barcode_api, "lookup_product", lambda upc: None)
+    food = Food(name="Test Cereal", brand="Acme", upc=UPC, calories=100)
+    db.add(food)
+    db.commit()
+    assert client.post("/barcode/scan", json={"upc": UPC}).get_json()["product"]["nutrition"]["calories"] == 100
+
+    food.calories = 150
+    db.commit()
+    assert client.post("/barcode/scan", json={"upc": UPC}).get_json()["product"]["nutrition"]["calories"] == 150
+
+    db.delete(food)
+    db.commit()
+    assert client.post("/barcode/scan", json={"upc": UPC}).status_code == 404
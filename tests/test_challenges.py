@@ -0,0 +1,37 @@
+from app.models import Challenge, ChallengeParticipant, User
+
+
+def _participants(db, challenge_id):
+    return db.query(ChallengeParticipant).filter(ChallengeParticipant.challenge_id == challenge_id).count()
+
+
+def test_join_missing_challenge(client, db):
+    resp = client.post("/social/challenges/join", json={"user_id": 1, "challenge_id": 424242})
+
+    assert resp.status_code == 404
+    assert _participants(db, 424242) == 0
+
+
+def test_join_counts_once_and_respects_capacity(client, db):
+    alice = User(username="alice", email="alice@example.com")
+    bob = User(username="bob", email="bob@example.com")
+    carol = User(username="carol", email="carol@example.com")
+    challenge = Challenge(title="Protein week", max_participants=2, participants_count=0)
+    db.add_all([alice, bob, carol, challenge])
+    db.commit()
+
+    def join(user):
+        return client.post("/social/challenges/join", json={"user_id": user.id, "challenge_id": challenge.id})
+
+    assert join(alice).status_code == 200
+    repeat = join(alice)
+    assert repeat.status_code == 400
+    assert repeat.get_json()["error"] == "Already participating in this challenge"
+    assert join(bob).status_code == 200
+    full = join(carol)
+    assert full.status_code == 400
+    assert full.get_json()["error"] == "Challenge is full"
+
+    db.expire_all()
+    assert db.get(Challenge, challenge.id).participants_count == 2
+    assert _participants(db, challenge.id) == 2
@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy import null
+
+from app.models import User
+
+
+@pytest.mark.parametrize("prefs", [null(), None, {}], ids=["sql-null", "json-null", "empty"])
+def test_put_goals_on_empty_prefs(client, db, prefs):
+    user = User(username="goals", email="goals@example.com", prefs=prefs)
+    db.add(user)
+    db.commit()
+
+    resp = client.put(f"/users/{user.id}/goals", json={"goals": {"protein": 100}})
+    assert resp.status_code == 200
+
+    resp = client.get(f"/users/{user.id}/goals")
+    assert resp.get_json() == {"goals": {"protein": 100}}
+
+
+def test_put_goals_keeps_other_prefs(client, db):
+    user = User(username="prefs", email="prefs@example.com", prefs={"theme": "dark", "goals": {"fat": 50}})
+    db.add(user)
+    db.commit()
+
+    client.put(f"/users/{user.id}/goals", json={"goals": {"protein": 100}})
+
+    db.expire_all()
+    assert db.get(User, user.id).prefs == {"theme": "dark", "goals": {"protein": 100}}
+
+
+def test_put_goals_unknown_user(client):
+    resp = client.put("/users/999999/goals", json={"goals": {"protein": 100}})
+    assert resp.status_code == 404
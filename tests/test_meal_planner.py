@@ -0,0 +1,28 @@
+import pytest
+
+from app.meal_planner import meal_planner
+from app.models import Food, MealPlan, MealPlanItem, User
+
+
+def test_meal_plan_nutrition_with_unloaded_items(db):
+    user = User(username="planner", email="planner@example.com")
+    oats = Food(name="Oats", calories=380, protein_g=13, fat_g=7, carbs_g=68, iron_mg=4)
+    milk = Food(name="Milk", calories=60, protein_g=3.2, fat_g=3.3, carbs_g=4.8, calcium_mg=120)
+    db.add_all([user, oats, milk])
+    db.flush()
+    plan = MealPlan(user_id=user.id, name="Test plan")
+    plan.items = [
+        MealPlanItem(food_id=oats.id, grams=50, meal_type="breakfast"),
+        MealPlanItem(food_id=milk.id, grams=200, meal_type="breakfast"),
+    ]
+    db.add(plan)
+    db.commit()
+    db.expire(plan)  # items unloaded -> SQL aggregate path
+
+    totals = meal_planner.get_meal_plan_nutrition(db, plan)
+
+    assert totals["calories"] == pytest.approx(190 + 120)
+    assert totals["protein_g"] == pytest.approx(6.5 + 6.4)
+    assert totals["iron_mg"] == pytest.approx(2.0)
+    assert totals["calcium_mg"] == pytest.approx(240)
+    assert totals["vitamin_c_mg"] == pytest.approx(0.0)
@@ -0,0 +1,47 @@
+from datetime import date
+
+import pytest
+
+from app.models import User
+from app.nutrition_goals import cache_daily_goals, get_cached_daily_goals, goal_calculator
+
+GOAL_COLUMNS = ('goal_calories', 'goal_protein_g', 'goal_fat_g', 'goal_carbs_g', 'goal_iron_mg', 'goal_calcium_mg')
+
+
+def test_bulk_recompute_matches_per_user_update(db):
+    profiles = [
+        dict(username="m", email="m@example.com", age=30, weight_kg=80, height_cm=180, gender="male",
+             activity_level="moderate", goal_type="lose"),
+        dict(username="f", email="f@example.com", age=55, weight_kg=60, height_cm=165, gender="female",
+             activity_level="sedentary", goal_type="maintain"),
+        dict(username="manual", email="manual@example.com", age=40, weight_kg=70, height_cm=175, gender="male",
+             goal_calories=2500),
+        dict(username="blank", email="blank@example.com"),
+    ]
+    db.add_all(User(**profile) for profile in profiles)
+    db.commit()
+
+    updated = goal_calculator.bulk_recompute_goals(db)
+    db.commit()
+    db.expire_all()
+    bulk = {u.username: tuple(getattr(u, c) for c in GOAL_COLUMNS) for u in db.query(User)}
+
+    assert updated > 0
+    for user in db.query(User):
+        goal_calculator.update_user_goals(user)
+        assert tuple(getattr(user, c) for c in GOAL_COLUMNS) == pytest.approx(bulk[user.username], nan_ok=True)
+
+
+def test_profile_change_clears_cached_daily_goals_on_commit(db):
+    user = User(username="cached", email="cached@example.com", weight_kg=70)
+    db.add(user)
+    db.commit()
+    cache_daily_goals(user.id, date.today(), {"calories": 2000})
+
+    user.weight_kg = 75
+    db.flush()
+    # Old goals stay visible until the new profile is committed
+    assert get_cached_daily_goals(user.id, date.today()) == {"calories": 2000}
+
+    db.commit()
+    assert get_cached_daily_goals(user.id, date.today()) is None
@@ -0,0 +1,36 @@
+from sqlalchemy import event
+
+from app.db import engine
+from app.food_api import usda_api
+from app.usda_food_manager import usda_food_manager
+
+FDC_ID = 173904
+
+
+def test_repeat_fetch_resolves_cached_id_without_fdc_query(db, monkeypatch):
+    raw = {"fdcId": FDC_ID, "description": "Oats", "dataType": "Foundation",
+           "foodNutrients": [{"nutrient": {"id": 1008}, "amount": 380}]}
+    monkeypatch.setattr(usda_api, "get_food_details", lambda fdc_id: raw if fdc_id == FDC_ID else None)
+
+    food = usda_food_manager.fetch_and_store_usda_food(db, -FDC_ID)
+    assert food is not None and food.usda_fdc_id == FDC_ID
+
+    statements = []
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        db.expunge_all()  # not in the identity map, so the cached id costs one primary-key SELECT
+        again = usda_food_manager.fetch_and_store_usda_food(db, FDC_ID)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    assert again.id == food.id
+    assert not any("usda_fdc_id IN" in s for s in statements)
+    assert len(statements) == 1
+
+
+def test_unknown_usda_food(db, monkeypatch):
+    monkeypatch.setattr(usda_api, "get_food_details", lambda fdc_id: None)
+
+    assert usda_food_manager.fetch_and_store_many(db, [1, 2]) == [None, None]